@@ -1,25 +1,218 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from . import models
+from .database import SessionLocal
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 
-def log_action(db: Session, request: Request, action: str, details: str = None, user_id: int = None, user_type: str = "System"):
+# Background writer tuning: flush when this many events are queued or this many seconds have passed
+AUDIT_FLUSH_BATCH = int(os.getenv("AUDIT_FLUSH_BATCH", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+# Bounded queue: when full, callers wait up to AUDIT_ENQUEUE_TIMEOUT and then write synchronously
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", "2.0"))
+AUDIT_RETRY_BACKOFF = float(os.getenv("AUDIT_RETRY_BACKOFF", "1.0"))
+# A batch still failing after this many attempts is dumped to stderr instead of blocking the writer
+AUDIT_MAX_RETRIES = int(os.getenv("AUDIT_MAX_RETRIES", "5"))
+AUDIT_STOP_TIMEOUT = float(os.getenv("AUDIT_STOP_TIMEOUT", "10.0"))
+
+_STOP = object()
+
+
+class AuditWriter:
     """
-    Logs an action to the audit_logs table.
+    Moves audit inserts off the request path: events are queued in memory and a
+    background thread writes them with one bulk INSERT per batch. Failed batches
+    are retried up to AUDIT_MAX_RETRIES times, and stop() drains the queue before
+    returning (or gives up after its timeout).
     """
-    client_ip = request.client.host if request.client else "Unknown"
-    
+
+    def __init__(self, batch_size: int = AUDIT_FLUSH_BATCH, interval: float = AUDIT_FLUSH_INTERVAL,
+                 max_queue: int = AUDIT_QUEUE_MAX, session_factory=SessionLocal):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.session_factory = session_factory
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "failed_flushes": 0, "dropped": 0, "sync_writes": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = AUDIT_STOP_TIMEOUT):
+        """
+        Flushes everything queued so far and stops the writer thread. Pending retries
+        are cut short: a batch that cannot be written is dumped to stderr.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping.set()
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                pass  # the thread also watches the stop event
+            thread.join(timeout)
+            if thread.is_alive():
+                print(f"Audit writer: still running after {timeout}s, giving up")
+            self._thread = None
+
+    def submit(self, row: dict, timeout: float = AUDIT_ENQUEUE_TIMEOUT) -> bool:
+        """
+        Queues one event. Blocks while the queue is full (backpressure) and returns
+        False if it stayed full for `timeout` seconds; the caller must then write it.
+        `timeout=0` never blocks (for callers on the event loop).
+        """
+        try:
+            if timeout <= 0:
+                self._queue.put_nowait(row)
+            else:
+                self._queue.put(row, timeout=timeout)
+        except queue.Full:
+            return False
+        self._count("enqueued")
+        return True
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _write(self, rows: List[dict]):
+        db = self.session_factory()
+        try:
+            db.execute(insert(models.AuditLog), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def _flush(self, rows: List[dict]):
+        for attempt in range(1, AUDIT_MAX_RETRIES + 1):
+            try:
+                self._write(rows)
+                self._count("written", len(rows))
+                self._count("batches")
+                return
+            except Exception as e:
+                self._count("failed_flushes")
+                print(f"Audit writer: flush of {len(rows)} events failed (attempt {attempt}): {e}")
+                if attempt < AUDIT_MAX_RETRIES:
+                    # Waiting on the event lets stop() cut the backoff short
+                    self._stopping.wait(AUDIT_RETRY_BACKOFF * attempt)
+        # Last resort: never lose the trail silently
+        self._count("dropped", len(rows))
+        for row in rows:
+            print(f"AUDIT-UNWRITTEN {row}", file=sys.stderr)
+
+    def _run(self):
+        rows: List[dict] = []
+        deadline = time.monotonic() + self.interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                if item is _STOP:
+                    stopping = True
+                else:
+                    rows.append(item)
+            except queue.Empty:
+                # stop() could not queue its marker (queue full)
+                stopping = self._stopping.is_set()
+            if rows and (stopping or len(rows) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(rows)
+                rows = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.interval
+        # Events queued behind the stop marker by late callers
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rows.append(item)
+        if rows:
+            self._flush(rows)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["running"] = self.running
+        return stats
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.stop)
+
+
+def _row(request: Request, action: str, details: str, user_id: int, user_type: str, organization_id: int) -> dict:
+    client_ip = request.client.host if request and request.client else "Unknown"
+
     # If we had real auth, we would get the user_id from the request/token
     # For now, we default to "System" or "Local User"
-    
-    audit_log = models.AuditLog(
-        user_id=user_id, # Nullable if generic user
-        user_type=user_type, # 'System', 'Lawyer', etc.
-        action=action,
-        details=details,
-        ip_address=client_ip
-    )
-    
+
+    return {
+        "user_id": user_id, # Nullable if generic user
+        "user_type": user_type, # 'System', 'Lawyer', etc.
+        "action": action,
+        "details": details,
+        "ip_address": client_ip,
+        "organization_id": organization_id,
+        # Time of the action, not of the (later) batch insert
+        "timestamp": datetime.now(timezone.utc),
+    }
+
+
+def _write_now(db: Session, row: dict) -> models.AuditLog:
+    audit_writer._count("sync_writes")
+    audit_log = models.AuditLog(**row)
     db.add(audit_log)
     db.commit()
     db.refresh(audit_log)
     return audit_log
+
+
+def log_action(db: Session, request: Request, action: str, details: str = None, user_id: int = None, user_type: str = "System",
+               organization_id: int = None):
+    """
+    Logs an action to the audit_logs table.
+    While the background writer runs (API process) the event is queued and written
+    in bulk; otherwise, or if the queue stays full, it is written on `db` right away.
+    """
+    row = _row(request, action, details, user_id, user_type, organization_id)
+    if audit_writer.running and audit_writer.submit(row):
+        return models.AuditLog(**row)
+    return _write_now(db, row)
+
+
+async def alog_action(db: Session, request: Request, action: str, details: str = None, user_id: int = None,
+                      user_type: str = "System", organization_id: int = None):
+    """
+    log_action for async endpoints: never waits on a full queue, and the synchronous
+    fallback write runs in the threadpool instead of on the event loop.
+    """
+    row = _row(request, action, details, user_id, user_type, organization_id)
+    if audit_writer.running and audit_writer.submit(row, timeout=0):
+        return models.AuditLog(**row)
+    return await run_in_threadpool(_write_now, db, row)
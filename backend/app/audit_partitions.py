@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+from datetime import date
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+# Monthly partitions created ahead of time, so inserts never fall into the default partition
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "3"))
+# Detach monthly partitions older than this many months at startup (0 = keep everything)
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "0"))
+# How often a running process repeats the maintenance (default: every 6 hours)
+AUDIT_PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("AUDIT_PARTITION_MAINTENANCE_INTERVAL", "21600"))
+
+_PARTITION_RE = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"audit_logs_{month:%Y_%m}"
+
+
+def create_partition(conn: Connection, month: date) -> str:
+    """
+    Creates the partition for `month`. Rows of that month already sitting in the
+    default partition (maintenance fell behind) would make CREATE ... PARTITION OF
+    fail, so they are moved out first and re-inserted into the new partition.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return name
+    # Explicit UTC bounds: a bare date would be read in the session's time zone
+    lower = f"{month:%Y-%m-%d} 00:00:00+00"
+    upper = f"{add_months(month, 1):%Y-%m-%d} 00:00:00+00"
+    in_range = "timestamp >= CAST(:lower AS timestamptz) AND timestamp < CAST(:upper AS timestamptz)"
+    bounds = {"lower": lower, "upper": upper}
+
+    stray = conn.execute(text("SELECT to_regclass('audit_logs_default')")).scalar() is not None and \
+        conn.execute(text(f"SELECT 1 FROM audit_logs_default WHERE {in_range} LIMIT 1"), bounds).scalar()
+    if stray:
+        conn.execute(text("CREATE TEMP TABLE audit_logs_move (LIKE audit_logs)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM audit_logs_default WHERE {in_range} RETURNING *) "
+            "INSERT INTO audit_logs_move SELECT * FROM moved"
+        ), bounds)
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF audit_logs FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+    if stray:
+        result = conn.execute(text("INSERT INTO audit_logs SELECT * FROM audit_logs_move"))
+        conn.execute(text("DROP TABLE audit_logs_move"))
+        print(f"Audit logs: moved {result.rowcount} rows from the default partition into {name}")
+    return name
+
+
+def list_partitions(conn: Connection) -> List[Tuple[str, date]]:
+    """
+    Monthly partitions currently attached to audit_logs, oldest first.
+    """
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'audit_logs'"
+    ))
+    partitions = []
+    for (name,) in rows:
+        match = _PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def upcoming_months(start: Optional[date] = None, months_ahead: int = AUDIT_PARTITION_MONTHS_AHEAD) -> List[date]:
+    # From `start` (default: the current month) through `months_ahead` months from now
+    month = month_start(start or date.today())
+    last = add_months(month_start(date.today()), months_ahead)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def ensure_partitions(conn: Connection, start: Optional[date] = None,
+                      months_ahead: int = AUDIT_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Creates the default partition and one partition per month from `start`
+    (default: the current month) through `months_ahead` months from now.
+    """
+    conn.execute(text("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"))
+    return [create_partition(conn, month) for month in upcoming_months(start, months_ahead)]
+
+
+def detach_partitions_before(conn: Connection, cutoff: date, drop: bool = False) -> List[str]:
+    """
+    Detaches every monthly partition that ends on or before `cutoff`. Detaching is a
+    catalog change, unlike a DELETE over millions of rows; the detached table can be
+    archived (pg_dump) and dropped later, or dropped right away with `drop=True`.
+    """
+    detached = []
+    for name, month in list_partitions(conn):
+        if add_months(month, 1) > month_start(cutoff):
+            break
+        conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+    return detached
+
+
+def maintain_partitions(engine: Engine):
+    """
+    Housekeeping: create upcoming partitions and apply AUDIT_RETENTION_MONTHS.
+    Each step has its own transaction, so one failing partition does not roll back
+    the others (or retention).
+    """
+    steps = [("default partition", lambda conn: conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"
+    )))]
+    for month in upcoming_months():
+        steps.append((partition_name(month), lambda conn, month=month: create_partition(conn, month)))
+    if AUDIT_RETENTION_MONTHS > 0:
+        cutoff = add_months(month_start(date.today()), -AUDIT_RETENTION_MONTHS)
+        def retention(conn):
+            for name in detach_partitions_before(conn, cutoff):
+                print(f"Audit logs: detached partition {name}")
+        steps.append(("retention", retention))
+
+    for label, step in steps:
+        try:
+            with engine.begin() as conn:
+                step(conn)
+        except Exception as e:
+            print(f"Audit logs: partition maintenance failed ({label}): {e}")
+
+
+class PartitionMaintainer:
+    """
+    Re-runs maintain_partitions every AUDIT_PARTITION_MAINTENANCE_INTERVAL seconds,
+    so a long-running process keeps creating partitions ahead of time.
+    """
+
+    def __init__(self, engine: Engine, interval: float = AUDIT_PARTITION_MAINTENANCE_INTERVAL):
+        self.engine = engine
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-partitions", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            maintain_partitions(self.engine)
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,106 @@
+import io
+import csv
+import json
+import base64
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from . import models
+
+AUDIT_EXPORT_COLUMNS = ["id", "timestamp", "organization_id", "user_id", "user_type", "action", "details", "ip_address"]
+
+
+class AuditFilters:
+    def __init__(self, organization_id: Optional[int] = None, user_id: Optional[int] = None,
+                 action: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+        self.organization_id = organization_id
+        self.user_id = user_id
+        self.action = action
+        self.since = since
+        self.until = until
+
+
+def encode_cursor(entry: models.AuditLog) -> str:
+    raw = f"{entry.timestamp.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(entry_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _filtered(db: Session, filters: AuditFilters):
+    query = db.query(models.AuditLog)
+    if filters.organization_id is not None:
+        query = query.filter(models.AuditLog.organization_id == filters.organization_id)
+    if filters.user_id is not None:
+        query = query.filter(models.AuditLog.user_id == filters.user_id)
+    if filters.action:
+        query = query.filter(models.AuditLog.action == filters.action)
+    # Time bounds also let Postgres prune monthly partitions
+    if filters.since is not None:
+        query = query.filter(models.AuditLog.timestamp >= filters.since)
+    if filters.until is not None:
+        query = query.filter(models.AuditLog.timestamp < filters.until)
+    return query
+
+
+def query_audit_logs(db: Session, filters: AuditFilters, cursor: Optional[str] = None,
+                     limit: int = 100) -> Tuple[List[models.AuditLog], Optional[str]]:
+    """
+    One page of audit events, newest first. Keyset pagination on (timestamp, id)
+    keeps every page an index range scan, however deep the client pages.
+    Returns the entries and the cursor of the next page (None on the last one).
+    """
+    query = _filtered(db, filters)
+    if cursor:
+        timestamp, entry_id = decode_cursor(cursor)
+        query = query.filter(tuple_(models.AuditLog.timestamp, models.AuditLog.id) < tuple_(timestamp, entry_id))
+    rows = query.order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def iter_audit_logs(session_factory, filters: AuditFilters, page_size: int = 5000) -> Iterator[models.AuditLog]:
+    # Walks the whole result in keyset pages on a dedicated session (used by streaming exports)
+    db = session_factory()
+    try:
+        cursor = None
+        while True:
+            rows, cursor = query_audit_logs(db, filters, cursor, page_size)
+            yield from rows
+            db.expunge_all()
+            if cursor is None:
+                break
+    finally:
+        db.close()
+
+
+def _row(entry: models.AuditLog) -> dict:
+    row = {column: getattr(entry, column) for column in AUDIT_EXPORT_COLUMNS}
+    row["timestamp"] = entry.timestamp.isoformat() if entry.timestamp else None
+    return row
+
+
+def export_ndjson(entries: Iterator[models.AuditLog]) -> Iterator[str]:
+    for entry in entries:
+        yield json.dumps(_row(entry), ensure_ascii=False) + "\n"
+
+
+def export_csv(entries: Iterator[models.AuditLog], rows_per_chunk: int = 500) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=AUDIT_EXPORT_COLUMNS)
+    writer.writeheader()
+    for count, entry in enumerate(entries, 1):
+        writer.writerow(_row(entry))
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models
+
+# Serialized /cases responses kept per (organization, query variant); stale versions are never served
+CASES_CACHE_ENABLED = os.getenv("CASES_CACHE_ENABLED", "true").lower() == "true"
+CASES_CACHE_MAX_ENTRIES = int(os.getenv("CASES_CACHE_MAX_ENTRIES", "1000"))
+
+
+def bump_cases_version(db: Session, organization_id: Optional[int] = None, case_id: Optional[int] = None):
+    """
+    Marks an organization's case listing as changed. Call it before the commit of the
+    change itself, so both land in the same transaction. With `case_id` the
+    organization is resolved from the case (document uploads).
+    """
+    if organization_id is None and case_id is None:
+        return
+    query = db.query(models.Organization)
+    if organization_id is not None:
+        query = query.filter(models.Organization.id == organization_id)
+    else:
+        query = query.filter(models.Organization.id == select(models.Case.organization_id).where(
+            models.Case.id == case_id
+        ).scalar_subquery())
+    query.update({models.Organization.cases_version: models.Organization.cases_version + 1},
+                 synchronize_session=False)
+
+
+def get_cases_version(db: Session, organization_id: int) -> Optional[int]:
+    # Primary-key lookup; cheap enough to run on every listing request
+    return db.query(models.Organization.cases_version).filter(models.Organization.id == organization_id).scalar()
+
+
+class CasesCache:
+    """
+    Per-process LRU of listing payloads. Each entry remembers the version it was
+    built at, so a bump anywhere (any worker) makes it a miss on the next read.
+    """
+
+    def __init__(self, max_entries: int = CASES_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (organization_id, variant) -> (version, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, organization_id: int, variant: str, version: int) -> Optional[Any]:
+        key = (organization_id, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, organization_id: int, variant: str, version: int, value: Any):
+        key = (organization_id, variant)
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["enabled"] = CASES_CACHE_ENABLED
+        return stats
+
+
+cases_cache = CasesCache()
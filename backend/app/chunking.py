@@ -0,0 +1,60 @@
+import os
+import re
+from bisect import bisect_right
+from typing import List, Optional
+
+# Chunk size and overlap, in (approximate) tokens
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+# Words and individual punctuation marks: a close, model-agnostic stand-in for
+# subword tokens that keeps chunks comfortably inside the embedding input limit
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class Chunk:
+    def __init__(self, index: int, text: str, start_offset: int, end_offset: int,
+                 page_number: Optional[int], token_count: int):
+        self.index = index
+        self.text = text
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.page_number = page_number
+        self.token_count = token_count
+
+
+def count_tokens(text: str) -> int:
+    return sum(1 for _ in _TOKEN_RE.finditer(text))
+
+
+def chunk_pages(pages: List[str], max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap: int = CHUNK_OVERLAP_TOKENS) -> List[Chunk]:
+    """
+    Splits a document (given as its pages, in order) into overlapping windows of
+    at most `max_tokens` tokens. Offsets refer to "".join(pages), which is what
+    Document.extracted_text holds; page_number (1-based) is the page a chunk starts on.
+    """
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+
+    text = "".join(pages)
+    page_starts = []
+    position = 0
+    for page in pages:
+        page_starts.append(position)
+        position += len(page)
+
+    spans = [match.span() for match in _TOKEN_RE.finditer(text)]
+    chunks = []
+    step = max_tokens - overlap
+    start = 0
+    while start < len(spans):
+        window = spans[start:start + max_tokens]
+        start_offset, end_offset = window[0][0], window[-1][1]
+        page_number = bisect_right(page_starts, start_offset) if page_starts else None
+        chunks.append(Chunk(len(chunks), text[start_offset:end_offset], start_offset, end_offset,
+                            page_number, len(window)))
+        if start + max_tokens >= len(spans):
+            break
+        start += step
+    return chunks
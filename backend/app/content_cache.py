@@ -0,0 +1,62 @@
+import threading
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from . import models
+
+# Process-wide hit/miss counters, exposed through /metrics
+_stats = {"hits": 0, "misses": 0, "stores": 0, "deduplicated_blobs": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def lookup(db: Session, content_hash: str, embedding_model: str) -> Optional[models.ContentCache]:
+    """
+    Returns cached OCR text and embedding for a content key, counting hits and misses.
+    Entries embedded by another backend/model count as misses.
+    """
+    entry = db.query(models.ContentCache).filter(
+        models.ContentCache.content_hash == content_hash,
+        models.ContentCache.embedding_model == embedding_model,
+    ).first()
+    _count("hits" if entry is not None else "misses")
+    return entry
+
+
+def store(db: Session, content_hash: str, extracted_text: str, embedding: List[float], embedding_model: str):
+    """
+    Saves processing results for a content key. Concurrent uploads of the same
+    content may both miss; the first one to finish wins. An entry from another
+    embedding model is replaced.
+    """
+    stmt = insert(models.ContentCache).values(
+        content_hash=content_hash,
+        extracted_text=extracted_text,
+        embedding=embedding,
+        embedding_model=embedding_model,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["content_hash"],
+        set_={"extracted_text": stmt.excluded.extracted_text, "embedding": stmt.excluded.embedding,
+              "embedding_model": stmt.excluded.embedding_model},
+        where=models.ContentCache.embedding_model.is_distinct_from(stmt.excluded.embedding_model),
+    )
+    db.execute(stmt)
+    db.commit()
+    _count("stores")
+
+
+def record_deduplicated_blob():
+    _count("deduplicated_blobs")
+
+
+def stats() -> dict:
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 3) if lookups else 0.0
+    return snapshot
@@ -0,0 +1,89 @@
+import os
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from .chunking import count_tokens
+from . import search
+
+# Token budget for retrieved passages in a chat prompt, and how many chunks to consider
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "12"))
+# Passages below this cosine similarity are not worth their tokens
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0.3"))
+# Chunks overlap (see chunking.py); skip a passage mostly covered by one already packed
+CONTEXT_MAX_OVERLAP = float(os.getenv("CONTEXT_MAX_OVERLAP", "0.5"))
+
+CONTEXT_INSTRUCTIONS = (
+    "Responde usando los siguientes extractos de los documentos del caso cuando sean relevantes. "
+    "Cita el documento y la página. Si los extractos no contienen la respuesta, dilo."
+)
+
+
+class PackedContext:
+    def __init__(self, text: str, passages: List[dict], tokens: int, retrieval_ms: float = 0.0):
+        self.text = text
+        self.passages = passages
+        self.tokens = tokens
+        self.retrieval_ms = retrieval_ms
+
+
+def _format_passage(passage: dict) -> str:
+    source = passage.get("filename") or f"documento {passage.get('document_id')}"
+    if passage.get("page_number"):
+        source += f", p. {passage['page_number']}"
+    return f"[{source}]\n{passage['content'].strip()}"
+
+
+def _overlap_ratio(passage: dict, other: dict) -> float:
+    if passage.get("document_id") != other.get("document_id"):
+        return 0.0
+    start, end = passage.get("start_offset"), passage.get("end_offset")
+    other_start, other_end = other.get("start_offset"), other.get("end_offset")
+    if None in (start, end, other_start, other_end) or end <= start:
+        return 0.0
+    shared = min(end, other_end) - max(start, other_start)
+    return max(shared, 0) / (end - start)
+
+
+def pack_context(passages: List[dict], max_tokens: int = CONTEXT_MAX_TOKENS,
+                 min_score: float = CONTEXT_MIN_SCORE) -> PackedContext:
+    """
+    Greedily fills `max_tokens` with the highest-scoring passages. Exact duplicates
+    (same text, e.g. a re-uploaded document) and passages mostly overlapping one
+    already packed are dropped; a passage that does not fit is skipped so a
+    smaller, lower-ranked one can still use the remaining budget.
+    """
+    packed, blocks, seen_texts = [], [], set()
+    used = 0
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        if passage["score"] < min_score or not passage.get("content"):
+            continue
+        normalized = " ".join(passage["content"].split()).lower()
+        if normalized in seen_texts:
+            continue
+        if any(_overlap_ratio(passage, other) > CONTEXT_MAX_OVERLAP for other in packed):
+            continue
+        block = _format_passage(passage)
+        cost = count_tokens(block)
+        if used + cost > max_tokens:
+            continue
+        seen_texts.add(normalized)
+        packed.append(passage)
+        blocks.append(block)
+        used += cost
+    return PackedContext("\n\n".join(blocks), packed, used)
+
+
+def retrieve_context(db: Session, query_vector: List[float], case_id: int, organization_id: Optional[int],
+                     k: int = CONTEXT_TOP_K, max_tokens: int = CONTEXT_MAX_TOKENS) -> PackedContext:
+    """
+    Top-k chunks of the case's documents (HNSW search), packed into the token budget.
+    `organization_id` is the caller's scope (None only for SuperAdmin).
+    """
+    passages = search.semantic_search(db, query_vector, organization_id, case_id=case_id, k=k)
+    return pack_context(passages, max_tokens=max_tokens)
+
+
+def build_prompt(question: str, context: Optional[PackedContext]) -> str:
+    if context is None or not context.text:
+        return question
+    return f"{CONTEXT_INSTRUCTIONS}\n\n{context.text}\n\nPregunta: {question}"
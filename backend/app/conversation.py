@@ -0,0 +1,156 @@
+import os
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from .database import SessionLocal
+from .gemini import GeminiClient
+from . import models
+
+# Most recent messages sent verbatim with every chat request
+CHAT_RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+# Fold older messages into the case summary once this many have piled up past the recent window
+SUMMARY_REFRESH_EVERY = int(os.getenv("SUMMARY_REFRESH_EVERY", "10"))
+# Upper bound per refresh so the first summary of a long case is built over several passes
+SUMMARY_MAX_BATCH = int(os.getenv("SUMMARY_MAX_BATCH", "50"))
+SUMMARY_MESSAGE_CHARS = int(os.getenv("SUMMARY_MESSAGE_CHARS", "4000"))
+SUMMARY_MAX_OUTPUT_TOKENS = int(os.getenv("SUMMARY_MAX_OUTPUT_TOKENS", "512"))
+
+# Questions of this many words or fewer ("¿por qué?") are treated as follow-ups
+FOLLOW_UP_MAX_WORDS = int(os.getenv("FOLLOW_UP_MAX_WORDS", "2"))
+_FOLLOW_UP_OPENERS = {"y", "e", "o", "u", "pero", "entonces", "también", "tambien", "además", "ademas"}
+_FOLLOW_UP_REFERENCES = {
+    "eso", "esto", "ello", "aquello", "ese", "esa", "esos", "esas", "aquel", "aquella",
+    "anterior", "anteriores", "mismo", "misma", "dijiste", "mencionaste", "explicaste", "respondiste",
+}
+
+SUMMARY_INSTRUCTIONS = (
+    "Actualiza el resumen de una conversación sobre un caso legal. Conserva hechos, nombres, "
+    "fechas, montos, decisiones y preguntas pendientes. Responde solo con el resumen, en "
+    "menos de 300 palabras."
+)
+
+# Cases with a refresh in flight in this process
+_refreshing = set()
+
+
+def load_history(db: Session, case_id: int, before_id: int) -> Tuple[Optional[str], List[models.Message]]:
+    """
+    Returns the case summary and the messages it does not cover yet (older than
+    `before_id`, oldest first). Refreshes keep that tail under
+    CHAT_RECENT_MESSAGES + SUMMARY_REFRESH_EVERY, so the prompt stays bounded.
+    """
+    summary = db.query(models.CaseSummary).filter(models.CaseSummary.case_id == case_id).first()
+    query = db.query(models.Message).filter(models.Message.case_id == case_id, models.Message.id < before_id)
+    if summary is not None:
+        query = query.filter(models.Message.id > summary.last_message_id)
+    history = query.order_by(models.Message.id.desc()).limit(CHAT_RECENT_MESSAGES + SUMMARY_REFRESH_EVERY).all()
+    history.reverse()
+    return (summary.summary or None) if summary is not None else None, history
+
+
+def is_standalone(question: str) -> bool:
+    """
+    Whether a question can be answered without the previous turns, which makes its
+    answer reusable across the case's conversation (response cache). Very short
+    questions, ones opening with a connector ("¿y el plazo?") and ones pointing back
+    at earlier turns ("¿qué significa eso?") are follow-ups.
+    """
+    words = re.findall(r"\w+", question.lower())
+    if len(words) <= FOLLOW_UP_MAX_WORDS:
+        return False
+    return words[0] not in _FOLLOW_UP_OPENERS and not _FOLLOW_UP_REFERENCES.intersection(words)
+
+
+def build_contents(history: List[models.Message], prompt: str) -> List[dict]:
+    contents = [
+        {"role": "user" if msg.sender == "user" else "model", "parts": [{"text": msg.content}]}
+        for msg in history
+    ]
+    contents.append({"role": "user", "parts": [{"text": prompt}]})
+    return contents
+
+
+def summary_instruction(summary: Optional[str]) -> Optional[dict]:
+    if not summary:
+        return None
+    return {"parts": [{"text": f"Resumen de la conversación anterior sobre este caso:\n{summary}"}]}
+
+
+def _pending_messages(case_id: int) -> Optional[Tuple[str, List[Tuple[int, str, str]]]]:
+    # (current summary, messages to fold) or None when no refresh is due
+    db = SessionLocal()
+    try:
+        summary = db.query(models.CaseSummary).filter(models.CaseSummary.case_id == case_id).first()
+        last_id = summary.last_message_id if summary is not None else 0
+        unsummarized = db.query(func.count(models.Message.id)).filter(
+            models.Message.case_id == case_id, models.Message.id > last_id
+        ).scalar()
+        foldable = unsummarized - CHAT_RECENT_MESSAGES
+        if foldable < SUMMARY_REFRESH_EVERY:
+            return None
+        rows = db.query(models.Message.id, models.Message.sender, models.Message.content).filter(
+            models.Message.case_id == case_id, models.Message.id > last_id
+        ).order_by(models.Message.id).limit(min(foldable, SUMMARY_MAX_BATCH)).all()
+        return (summary.summary if summary is not None else ""), [tuple(row) for row in rows]
+    finally:
+        db.close()
+
+
+def _save_summary(case_id: int, text: str, last_message_id: int, folded: int):
+    db = SessionLocal()
+    try:
+        summary = db.query(models.CaseSummary).filter(models.CaseSummary.case_id == case_id).first()
+        if summary is None:
+            summary = models.CaseSummary(case_id=case_id, message_count=0)
+            db.add(summary)
+        summary.summary = text
+        summary.last_message_id = last_message_id
+        summary.message_count = (summary.message_count or 0) + folded
+        db.commit()
+    finally:
+        db.close()
+
+
+def _summary_prompt(previous: str, messages: List[Tuple[int, str, str]]) -> str:
+    transcript = "\n".join(
+        f"{'Usuario' if sender == 'user' else 'Asistente'}: {(content or '')[:SUMMARY_MESSAGE_CHARS]}"
+        for _, sender, content in messages
+    )
+    return f"{SUMMARY_INSTRUCTIONS}\n\nResumen actual:\n{previous or '(vacío)'}\n\nMensajes nuevos:\n{transcript}"
+
+
+async def refresh_summary(case_id: int, gemini: GeminiClient):
+    """
+    Background task run after each chat turn: when enough messages have aged out of
+    the recent window, folds them (oldest first) into the case summary.
+    """
+    if case_id in _refreshing:
+        return
+    _refreshing.add(case_id)
+    try:
+        pending = await run_in_threadpool(_pending_messages, case_id)
+        if pending is None:
+            return
+        previous, messages = pending
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": _summary_prompt(previous, messages)}]}],
+            "generationConfig": {"temperature": 0.2, "maxOutputTokens": SUMMARY_MAX_OUTPUT_TOKENS},
+        }
+        response = await gemini.generate_content(payload)
+        if response.status_code != 200:
+            print(f"Summary refresh error for case {case_id}: HTTP {response.status_code}")
+            return
+        candidates = response.json().get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        text = "".join(part.get("text", "") for part in parts).strip()
+        if not text:
+            print(f"Summary refresh for case {case_id} returned no text")
+            return
+        await run_in_threadpool(_save_summary, case_id, text, messages[-1][0], len(messages))
+        print(f"Case {case_id}: folded {len(messages)} messages into the summary")
+    except Exception as e:
+        print(f"Summary refresh error for case {case_id}: {e}")
+    finally:
+        _refreshing.discard(case_id)
@@ -0,0 +1,82 @@
+import os
+import asyncio
+import threading
+from datetime import datetime, timedelta
+import google.auth
+from google.auth.transport.requests import Request
+
+# Scopes shared by chat (Generative Language), embeddings (Vertex AI) and OCR (Vision)
+SCOPES = [
+    "https://www.googleapis.com/auth/cloud-platform",
+    "https://www.googleapis.com/auth/generative-language"
+]
+# Refresh this many seconds before the access token actually expires
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+
+class CredentialManager:
+    """
+    Process-wide holder for the Google default credentials.
+
+    Access tokens are reused until shortly before they expire. Refreshes happen
+    under a lock with a re-check, so concurrent callers that find the token stale
+    wait for a single refresh instead of each doing their own OAuth round trip.
+    """
+
+    def __init__(self, scopes=SCOPES, refresh_margin: int = TOKEN_REFRESH_MARGIN_SECONDS):
+        self.scopes = scopes
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._credentials = None
+        self._project = None
+        self._lock = threading.Lock()
+        self.refresh_count = 0
+
+    def _load(self):
+        if self._credentials is None:
+            self._credentials, self._project = google.auth.default(scopes=self.scopes)
+
+    @property
+    def credentials(self):
+        with self._lock:
+            self._load()
+            return self._credentials
+
+    @property
+    def project(self):
+        with self._lock:
+            self._load()
+            return self._project
+
+    def _is_fresh(self) -> bool:
+        credentials = self._credentials
+        if credentials is None or not credentials.token:
+            return False
+        if credentials.expiry is None:
+            return True
+        # google-auth keeps expiry as a naive UTC datetime
+        return credentials.expiry - datetime.utcnow() > self.refresh_margin
+
+    def get_token(self) -> str:
+        if self._is_fresh():
+            return self._credentials.token
+        with self._lock:
+            self._load()
+            if not self._is_fresh():
+                self._credentials.refresh(Request())
+                self.refresh_count += 1
+            return self._credentials.token
+
+    async def aget_token(self) -> str:
+        if self._is_fresh():
+            return self._credentials.token
+        return await asyncio.to_thread(self.get_token)
+
+    def stats(self) -> dict:
+        credentials = self._credentials
+        return {
+            "refreshes": self.refresh_count,
+            "token_expiry": credentials.expiry.isoformat() if credentials is not None and credentials.expiry else None,
+        }
+
+
+credential_manager = CredentialManager()
@@ -1,9 +1,12 @@
 import os
+import asyncio
+import threading
 import httpx
-from typing import List
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-import google.auth
-from google.auth.transport.requests import Request
+from .credentials import credential_manager
 
 # Load environment variables
 load_dotenv()
@@ -11,54 +14,298 @@ load_dotenv()
 PROJECT_ID = os.getenv("VERTEX_AI_PROJECT_ID")
 LOCATION = os.getenv("VERTEX_AI_LOCATION", "us-central1")
 
-class EmbeddingService:
-    def __init__(self):
+# text-embedding-004 accepts up to 250 instances and ~20k tokens per :predict call
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "250"))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "20000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "30"))
+# vertex | local | auto (vertex when VERTEX_AI_PROJECT_ID is set, else local)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto")
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client() -> httpx.Client:
+    # One keep-alive connection pool shared by every EmbeddingService instance
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                timeout=EMBEDDING_TIMEOUT,
+                limits=httpx.Limits(max_connections=EMBEDDING_CONCURRENCY * 2,
+                                    max_keepalive_connections=EMBEDDING_CONCURRENCY),
+            )
+        return _http_client
+
+
+_async_http_client = None
+_async_http_client_loop = None
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    # Same for async callers (/search, chat). An AsyncClient belongs to the event loop
+    # it was created on, so a new one is made if the loop changes.
+    global _async_http_client, _async_http_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_http_client is None or _async_http_client_loop is not loop:
+        _async_http_client = httpx.AsyncClient(
+            timeout=EMBEDDING_TIMEOUT,
+            limits=httpx.Limits(max_connections=EMBEDDING_CONCURRENCY * 2,
+                                max_keepalive_connections=EMBEDDING_CONCURRENCY),
+        )
+        _async_http_client_loop = loop
+    return _async_http_client
+
+
+async def aclose_http_client():
+    global _async_http_client, _async_http_client_loop
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = _async_http_client_loop = None
+
+
+def _estimate_tokens(text: str) -> int:
+    # Rough upper bound (~4 chars per token) used only to size batches
+    return len(text) // 4 + 1
+
+
+class EmptyEmbeddingInput(ValueError):
+    # The text has nothing to embed (e.g. only stopwords or punctuation): bad input, not a backend failure
+    pass
+
+
+# Per-item error recorded by backends for such texts
+NO_EMBEDDABLE_CONTENT = "no embeddable content"
+
+
+class EmbeddingBatchResult:
+    """
+    Vectors in input order. Items that could not be embedded are None in `vectors`
+    and have their error message in `errors`, keyed by input index.
+    """
+
+    def __init__(self, vectors: List[Optional[List[float]]], errors: Dict[int, str]):
+        self.vectors = vectors
+        self.errors = errors
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface of an embedding provider. `embed` returns one vector per text, in order;
+    `aembed` defaults to running `embed` inline, which suits in-process backends.
+    """
+
+    name = "base"
+    dimension = 768
+
+    @property
+    def model_id(self) -> str:
+        # Identifies the vector space: stored vectors are only reused under the same id
+        return f"{self.name}/{self.dimension}"
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> EmbeddingBatchResult:
+        ...
+
+    async def aembed(self, texts: List[str], client: Optional[httpx.AsyncClient] = None) -> EmbeddingBatchResult:
+        return self.embed(texts)
+
+
+class VertexEmbeddingBackend(EmbeddingBackend):
+    name = "vertex"
+
+    def __init__(self, project_id: str = PROJECT_ID, location: str = LOCATION):
         self.dimension = 768 # Gemini text-embedding-004 dimension
         self.model = 'text-embedding-004'
-        self.api_endpoint = f"https://{LOCATION}-aiplatform.googleapis.com/v1/projects/{PROJECT_ID}/locations/{LOCATION}/publishers/google/models/{self.model}:predict"
-        self.credentials, self.project = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/cloud-platform"]
-        )
+        self.api_endpoint = f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/publishers/google/models/{self.model}:predict"
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.name}/{self.model}"
 
     def _get_access_token(self):
-        auth_req = Request()
-        self.credentials.refresh(auth_req)
-        return self.credentials.token
+        # Cached process-wide, only refreshed shortly before expiry
+        return credential_manager.get_token()
 
-    def get_embedding(self, text: str) -> List[float]:
+    async def _aget_access_token(self):
+        return await credential_manager.aget_token()
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
         """
-        Returns an embedding vector using Vertex AI REST API.
+        Groups input indexes into :predict batches bounded by instance count and tokens.
+        """
+        batches, current, current_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            tokens = _estimate_tokens(text)
+            if current and (len(current) >= EMBEDDING_BATCH_SIZE or current_tokens + tokens > EMBEDDING_MAX_BATCH_TOKENS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _headers(self, token: str) -> dict:
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+    @staticmethod
+    def _payload(texts: List[str]) -> dict:
+        return {"instances": [{"content": text} for text in texts]}
+
+    @staticmethod
+    def _parse(response: httpx.Response) -> List[List[float]]:
+        if response.status_code != 200:
+            print(f"Vertex AI Error: {response.text}")
+            response.raise_for_status()
+        data = response.json()
+        # Vertex AI response format: {"predictions": [{"embeddings": {"values": [...]}}]}
+        return [prediction['embeddings']['values'] for prediction in data['predictions']]
+
+    @staticmethod
+    def _is_item_error(error: Exception) -> bool:
+        # A 400 means some instance in the batch was rejected: worth isolating it.
+        # Auth, quota and network errors would fail every sub-batch the same way.
+        return isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 400
+
+    def _embed_batch(self, client: httpx.Client, texts: List[str], indexes: List[int],
+                     vectors: list, errors: dict):
+        """
+        Embeds one batch. When Vertex rejects a batch's content it is split in half
+        and retried, so a single bad item only fails itself.
         """
-        if not PROJECT_ID:
-             import random
-             return [random.uniform(-1, 1) for _ in range(self.dimension)]
-        
         try:
             token = self._get_access_token()
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "instances": [{
-                    "content": text
-                }]
-            }
-            
-            # Using sync call for simplicity here
-            response = httpx.post(self.api_endpoint, json=payload, headers=headers, timeout=10.0)
-            if response.status_code != 200:
-                print(f"Vertex AI Error: {response.text}")
-                response.raise_for_status()
-                
-            data = response.json()
-            # Vertex AI response format: {"predictions": [{"embeddings": {"values": [...]}}]}
-            return data['predictions'][0]['embeddings']['values']
+            response = client.post(self.api_endpoint, json=self._payload([texts[i] for i in indexes]),
+                                   headers=self._headers(token))
+            for index, values in zip(indexes, self._parse(response)):
+                vectors[index] = values
         except Exception as e:
-            print(f"Error generating embedding via Vertex AI: {e}")
-            raise e
+            if len(indexes) == 1 or not self._is_item_error(e):
+                for index in indexes:
+                    errors[index] = str(e)
+                return
+            middle = len(indexes) // 2
+            self._embed_batch(client, texts, indexes[:middle], vectors, errors)
+            self._embed_batch(client, texts, indexes[middle:], vectors, errors)
+
+    async def _aembed_batch(self, client: httpx.AsyncClient, texts: List[str], indexes: List[int],
+                            vectors: list, errors: dict):
+        try:
+            token = await self._aget_access_token()
+            response = await client.post(self.api_endpoint, json=self._payload([texts[i] for i in indexes]),
+                                         headers=self._headers(token))
+            for index, values in zip(indexes, self._parse(response)):
+                vectors[index] = values
+        except Exception as e:
+            if len(indexes) == 1 or not self._is_item_error(e):
+                for index in indexes:
+                    errors[index] = str(e)
+                return
+            middle = len(indexes) // 2
+            await self._aembed_batch(client, texts, indexes[:middle], vectors, errors)
+            await self._aembed_batch(client, texts, indexes[middle:], vectors, errors)
+
+    def embed(self, texts: List[str]) -> EmbeddingBatchResult:
+        """
+        Embeds many texts with as few :predict calls as possible, running up to
+        EMBEDDING_CONCURRENCY batches at once over the shared connection pool.
+        """
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        errors: Dict[int, str] = {}
+        batches = self._batches(texts)
+        client = _get_http_client()
+        if len(batches) == 1:
+            self._embed_batch(client, texts, batches[0], vectors, errors)
+        else:
+            with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as pool:
+                list(pool.map(lambda indexes: self._embed_batch(client, texts, indexes, vectors, errors), batches))
+        return EmbeddingBatchResult(vectors, errors)
+
+    async def aembed(self, texts: List[str], client: Optional[httpx.AsyncClient] = None) -> EmbeddingBatchResult:
+        """
+        Async version of embed. Uses `client` when given, otherwise the shared
+        module-level AsyncClient, so calls reuse warm connections to Vertex.
+        """
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        errors: Dict[int, str] = {}
+        semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+        async def run(http: httpx.AsyncClient, indexes: List[int]):
+            async with semaphore:
+                await self._aembed_batch(http, texts, indexes, vectors, errors)
+
+        http = client or _get_async_http_client()
+        await asyncio.gather(*(run(http, indexes) for indexes in self._batches(texts)))
+        return EmbeddingBatchResult(vectors, errors)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    # "auto": Vertex AI when a project is configured, otherwise the offline local embedder
+    if name == "auto":
+        name = "vertex" if PROJECT_ID else "local"
+    if name == "vertex":
+        if not PROJECT_ID:
+            raise RuntimeError("EMBEDDING_BACKEND=vertex requires VERTEX_AI_PROJECT_ID")
+        return VertexEmbeddingBackend()
+    if name == "local":
+        from .local_embeddings import LocalHashingEmbedder
+        return LocalHashingEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+
+
+def get_backend() -> EmbeddingBackend:
+    # Chosen once per process. Vectors from different backends are not comparable,
+    # so re-embed stored documents after switching.
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            print(f"Embeddings: using '{_backend.name}' backend")
+        return _backend
+
+
+class EmbeddingService:
+    def __init__(self, backend: Optional[EmbeddingBackend] = None):
+        self.backend = backend or get_backend()
+        self.dimension = self.backend.dimension
+
+    def get_embeddings(self, texts: List[str]) -> EmbeddingBatchResult:
+        return self.backend.embed(texts)
+
+    async def aget_embeddings(self, texts: List[str], client: Optional[httpx.AsyncClient] = None) -> EmbeddingBatchResult:
+        return await self.backend.aembed(texts, client=client)
+
+    def get_embedding(self, text: str) -> List[float]:
+        """
+        Returns an embedding vector from the configured backend.
+        """
+        result = self.get_embeddings([text])
+        if not result.ok:
+            print(f"Error generating embedding ({self.backend.name}): {result.errors[0]}")
+            self._raise(result.errors[0])
+        return result.vectors[0]
 
     async def get_embedding_async(self, text: str) -> List[float]:
-        # For simplicity, reuse sync logic or implement async httpx with token refresh
-        return self.get_embedding(text)
+        result = await self.aget_embeddings([text])
+        if not result.ok:
+            self._raise(result.errors[0])
+        return result.vectors[0]
 
+    @staticmethod
+    def _raise(error: str):
+        if error == NO_EMBEDDABLE_CONTENT:
+            raise EmptyEmbeddingInput(error)
+        raise RuntimeError(error)
@@ -0,0 +1,133 @@
+import os
+import json
+import asyncio
+import httpx
+from typing import AsyncIterator
+from .credentials import credential_manager
+
+# Global Generative Language API (Service Account)
+# Using gemini-2.0-flash as it was found in the available models list
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+# PROJECT_ID is still needed for x-goog-user-project header sometimes
+PROJECT_ID = os.getenv("VERTEX_AI_PROJECT_ID")
+
+# HTTP client tuning
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_RETRY_BACKOFF = float(os.getenv("GEMINI_RETRY_BACKOFF", "0.5"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+GEMINI_MAX_KEEPALIVE = int(os.getenv("GEMINI_MAX_KEEPALIVE", "20"))
+GEMINI_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "60"))
+GEMINI_HTTP2 = os.getenv("GEMINI_HTTP2", "1") == "1"
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Gemini HTTP {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Long-lived client created once in the app lifespan. Keep-alive and HTTP/2
+    multiplexing let many concurrent chats share a handful of connections.
+    """
+    http2 = GEMINI_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("Gemini: 'h2' not installed, falling back to HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(GEMINI_TIMEOUT, connect=GEMINI_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+class GeminiClient:
+    def __init__(self, http: httpx.AsyncClient, model: str = GEMINI_MODEL,
+                 max_retries: int = GEMINI_MAX_RETRIES, retry_backoff: float = GEMINI_RETRY_BACKOFF):
+        self.http = http
+        self.model = model
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def url(self, method: str) -> str:
+        return f"{GEMINI_BASE_URL}/models/{self.model}:{method}"
+
+    async def headers(self) -> dict:
+        token = await credential_manager.aget_token()
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
+        if PROJECT_ID:
+            headers["x-goog-user-project"] = PROJECT_ID
+        return headers
+
+    async def generate_content(self, payload: dict) -> httpx.Response:
+        """
+        POSTs to :generateContent, retrying transport errors and retryable status
+        codes (429/5xx) with exponential backoff.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self.http.post(self.url("generateContent"), json=payload, headers=await self.headers())
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                print(f"Gemini: retrying after HTTP {response.status_code}")
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Gemini: retrying after transport error: {e}")
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
+
+    async def stream_generate_content(self, payload: dict) -> AsyncIterator[str]:
+        """
+        Calls :streamGenerateContent with SSE framing and yields text deltas as they
+        arrive. Opening the stream is retried like generate_content; once tokens
+        have been yielded nothing is retried. Closing the generator (e.g. when the
+        client disconnects) closes the upstream response.
+        """
+        attempt = 0
+        started = False
+        while True:
+            try:
+                async with self.http.stream("POST", self.url("streamGenerateContent"), params={"alt": "sse"},
+                                            json=payload, headers=await self.headers()) as response:
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode("utf-8", "replace")
+                        if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                            print(f"Gemini: retrying stream after HTTP {response.status_code}")
+                        else:
+                            raise GeminiError(response.status_code, body)
+                    else:
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            chunk = json.loads(line[len("data:"):].strip())
+                            for candidate in chunk.get("candidates", [])[:1]:
+                                for part in candidate.get("content", {}).get("parts", []):
+                                    if part.get("text"):
+                                        started = True
+                                        yield part["text"]
+                        return
+            except httpx.TransportError as e:
+                if started or attempt >= self.max_retries:
+                    raise
+                print(f"Gemini: retrying stream after transport error: {e}")
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
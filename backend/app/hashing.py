@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+from . import auth
+
+# bcrypt is CPU-bound: a small dedicated process pool keeps it off Starlette's
+# threadpool (and the GIL), and a pending limit sheds load at login peaks
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process")  # 'process' or 'thread'
+
+
+class HashingQueueFull(Exception):
+    pass
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # Top-level so it can run in a worker process. Returns a new hash when the stored
+    # one uses outdated parameters (e.g. BCRYPT_ROUNDS was raised).
+    return auth.pwd_context.verify_and_update(password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return auth.get_password_hash(password)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING,
+                 executor_kind: str = PASSWORD_HASH_EXECUTOR):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_kind = executor_kind
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {"completed": 0, "rejected": 0, "rehashed": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.executor_kind == "process":
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    async def _run(self, fn, *args):
+        """
+        Runs fn in the pool. Raises HashingQueueFull right away (instead of queueing)
+        when max_pending hashes are already waiting or running.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise HashingQueueFull(f"Too many pending password hashes ({self.max_pending})")
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._pending -= 1
+                self._stats["completed"] += 1
+                self._stats["total_ms"] += elapsed_ms
+                self._stats["max_ms"] = max(self._stats["max_ms"], elapsed_ms)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Returns (valid, new_hash); new_hash is set when the stored hash should be upgraded.
+        """
+        valid, new_hash = await self._run(_verify_and_update, password, hashed_password)
+        if new_hash:
+            with self._lock:
+                self._stats["rehashed"] += 1
+        return valid, new_hash
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+        stats["max_pending"] = self.max_pending
+        stats["workers"] = self.workers
+        stats["avg_ms"] = stats["total_ms"] / stats["completed"] if stats["completed"] else 0.0
+        return stats
+
+
+password_hasher = PasswordHasher()
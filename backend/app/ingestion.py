@@ -0,0 +1,184 @@
+import os
+from functools import partial
+from typing import Callable, List, Optional
+from sqlalchemy import insert, select, literal
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .ocr import OCRService
+from .jobs import Job, Reservation, job_manager
+from .chunking import Chunk, chunk_pages
+from .response_cache import response_cache
+from . import models, embeddings, content_cache
+
+INGEST_STAGES = ["ocr", "chunking", "embedding", "save"]
+INDEX_STAGES = ["chunking", "embedding", "save"]
+
+# Rows per multi-row INSERT; keeps the statement well under Postgres' bind parameter limit
+CHUNK_INSERT_BATCH = int(os.getenv("CHUNK_INSERT_BATCH", "1000"))
+# Texts per embedding call; the job's embedding progress advances after each one
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "1000"))
+
+
+def _run_ocr(content: bytes, mime_type: str, progress: Optional[Callable[[float], None]] = None) -> List[str]:
+    # Top-level so it can be shipped to a process pool worker.
+    ocr_service = OCRService()
+    return ocr_service.extract_pages(content, mime_type, progress)
+
+
+def _embed_with_progress(job: Job, emb_service: embeddings.EmbeddingService,
+                         texts: List[str]) -> embeddings.EmbeddingBatchResult:
+    # Embeds in INGEST_EMBED_BATCH slices, reporting the embedding stage's progress after each
+    vectors, errors = [], {}
+    for start in range(0, len(texts), INGEST_EMBED_BATCH):
+        result = emb_service.get_embeddings(texts[start:start + INGEST_EMBED_BATCH])
+        vectors.extend(result.vectors)
+        errors.update({start + index: error for index, error in result.errors.items()})
+        job.update_stage("embedding", len(vectors) / len(texts))
+    return embeddings.EmbeddingBatchResult(vectors, errors)
+
+
+def insert_chunks(db: Session, document_id: int, chunks: List[Chunk], vectors: List[Optional[List[float]]]):
+    """
+    Replaces the chunks of a document using multi-row INSERT statements.
+    Chunks whose embedding failed are stored without a vector.
+    """
+    db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id == document_id).delete(synchronize_session=False)
+    rows = [
+        {
+            "document_id": document_id,
+            "chunk_index": chunk.index,
+            "page_number": chunk.page_number,
+            "start_offset": chunk.start_offset,
+            "end_offset": chunk.end_offset,
+            "content": chunk.text,
+            "embedding": vector,
+        }
+        for chunk, vector in zip(chunks, vectors)
+    ]
+    for start in range(0, len(rows), CHUNK_INSERT_BATCH):
+        db.execute(insert(models.DocumentChunk).values(rows[start:start + CHUNK_INSERT_BATCH]))
+
+
+def copy_chunks_from_duplicate(db: Session, document_id: int, content_hash: str) -> int:
+    """
+    Reuses the chunks (text and vectors) of an earlier document with the same content
+    key with a single INSERT ... SELECT. Content keys are per organization, so the
+    donor is always a document of the same organization. Returns the number of chunks copied.
+    """
+    donor_id = db.query(models.DocumentChunk.document_id).join(models.Document).filter(
+        models.Document.content_hash == content_hash,
+        models.Document.id != document_id,
+    ).order_by(models.Document.id.desc()).limit(1).scalar()  # newest copy: embedded by the current backend
+    if donor_id is None:
+        return 0
+
+    chunk = models.DocumentChunk
+    columns = ["document_id", "chunk_index", "page_number", "start_offset", "end_offset", "content", "embedding"]
+    source = select(
+        literal(document_id), chunk.chunk_index, chunk.page_number, chunk.start_offset,
+        chunk.end_offset, chunk.content, chunk.embedding,
+    ).where(chunk.document_id == donor_id)
+    result = db.execute(insert(chunk).from_select(columns, source))
+    db.commit()
+    return result.rowcount
+
+
+def _index(job: Job, document_id: int, pages: List[str], content_hash: Optional[str] = None,
+           update_document: bool = True):
+    """
+    Shared tail of the pipelines: chunk -> bulk embed -> save document and chunks.
+    """
+    extracted_text_content = "".join(pages)
+
+    job.start_stage("chunking")
+    chunks = chunk_pages(pages) if extracted_text_content.strip() else []
+    job.finish_stage("chunking")
+
+    # Document-level vector (first 1000 chars) and every chunk go out in the same batched call
+    job.start_stage("embedding")
+    emb_service = embeddings.EmbeddingService()
+    embed_input = extracted_text_content[:1000] if extracted_text_content else "mock text content"
+    result = _embed_with_progress(job, emb_service, [embed_input] + [chunk.text for chunk in chunks])
+    if result.errors:
+        print(f"Embedding errors for document {document_id}: {len(result.errors)} of {len(chunks) + 1} items")
+    vector = result.vectors[0]
+    job.finish_stage("embedding", status="done" if result.ok else "failed")
+
+    job.start_stage("save")
+    db = SessionLocal()
+    try:
+        db_doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if db_doc is None:
+            raise ValueError(f"Document {document_id} no longer exists")
+        if update_document:
+            db_doc.extracted_text = extracted_text_content
+            db_doc.embedding = vector
+        insert_chunks(db, document_id, chunks, result.vectors[1:])
+        db.commit()
+        # Answers cached before these passages were searchable are stale
+        response_cache.invalidate(db_doc.case_id)
+        # Empty text may just mean OCR was unavailable; don't pin that result in the cache
+        if content_hash and extracted_text_content and vector is not None:
+            content_cache.store(db, content_hash, extracted_text_content, vector, emb_service.backend.model_id)
+    finally:
+        db.close()
+    job.finish_stage("save")
+
+    job.complete(
+        ocr_status="success" if extracted_text_content else "no-text/failed",
+        ocr_chars=len(extracted_text_content),
+        chunks=len(chunks),
+        embedding_errors=len(result.errors),
+    )
+
+
+def process_document(job: Job, content: bytearray, document_id: int, filename: str, mime_type: str,
+                     content_hash: str = None):
+    """
+    Background pipeline for an uploaded document: OCR -> chunking -> embedding -> update the Document row.
+    `content` is the plaintext buffer captured while the upload was encrypted, so nothing
+    is decrypted again or written to disk in plaintext. Results are stored in the
+    content cache under `content_hash` so identical re-uploads skip this pipeline.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".pdf":
+        mime_type = "application/pdf"
+
+    # 1. OCR Processing (Hybrid)
+    pages = []
+    job.start_stage("ocr")
+    try:
+        print(f"Starting OCR for {filename} ({mime_type})...")
+        # Progress callbacks cannot cross into the process pool
+        progress = partial(job.update_stage, "ocr") if job_manager.runs_cpu_inline else None
+        pages = job_manager.run_cpu(_run_ocr, content, mime_type, progress) or []
+        print(f"OCR Complete. Extracted {sum(len(page) for page in pages)} chars from {len(pages)} pages.")
+        job.finish_stage("ocr")
+    except Exception as e:
+        print(f"OCR Pipeline Error: {e}")
+        # Non-blocking error, the encrypted file is already saved
+        job.finish_stage("ocr", status="failed")
+
+    # 2-4. Chunk, embed and persist
+    _index(job, document_id, pages, content_hash=content_hash)
+
+
+def index_document_text(job: Job, document_id: int, text: str):
+    # Chunks a document whose text is already known (e.g. from the content cache)
+    _index(job, document_id, [text], update_document=False)
+
+
+def enqueue_document(content: bytearray, document_id: int, filename: str, mime_type: str,
+                     content_hash: str = None, reservation: Optional[Reservation] = None,
+                     organization_id: Optional[int] = None, user_id: Optional[int] = None) -> Job:
+    job = Job(INGEST_STAGES, document_id=document_id, filename=filename,
+              organization_id=organization_id, user_id=user_id)
+    return job_manager.submit(job, process_document, content, document_id, filename, mime_type,
+                              content_hash=content_hash, reservation=reservation)
+
+
+def enqueue_indexing(document_id: int, filename: str, text: str, reservation: Optional[Reservation] = None,
+                     organization_id: Optional[int] = None, user_id: Optional[int] = None) -> Job:
+    job = Job(INDEX_STAGES, document_id=document_id, filename=filename,
+              organization_id=organization_id, user_id=user_id)
+    return job_manager.submit(job, index_document_text, document_id, text, reservation=reservation)
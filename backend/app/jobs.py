@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Ingestion worker pool configuration
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+INGEST_EXECUTOR = os.getenv("INGEST_EXECUTOR", "thread")  # 'thread' or 'process'
+INGEST_MAX_PENDING_JOBS = int(os.getenv("INGEST_MAX_PENDING_JOBS", "100"))
+# Queued jobs hold the plaintext of their upload: also bound the total bytes buffered
+INGEST_MAX_PENDING_BYTES = int(os.getenv("INGEST_MAX_PENDING_BYTES", str(1024 * 1024 * 1024)))
+JOB_RETENTION_SECONDS = int(os.getenv("INGEST_JOB_RETENTION_SECONDS", "3600"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Reservation:
+    """
+    A slot (and a byte budget) taken in the ingestion queue before the work is
+    persisted, so a JobQueueFull can be answered before anything is written.
+    Released when its job finishes, or explicitly if no job is submitted.
+    """
+
+    def __init__(self, manager: "JobManager", nbytes: int):
+        self.manager = manager
+        self.nbytes = nbytes
+        self.released = False
+        # Set once a submitted job owns the reservation (and will release it)
+        self.attached = False
+
+    def resize(self, nbytes: int):
+        # Shrinking only: the capacity was checked for the original size
+        self.manager._adjust(self, min(nbytes, self.nbytes))
+
+    def release(self):
+        self.manager._release(self)
+
+
+class Job:
+    """
+    Tracks the status of one background ingestion job.
+    Each stage has its own status ('pending', 'running', 'done', 'failed', 'skipped')
+    and a 0..1 progress value so clients can poll for fine-grained progress.
+    `organization_id` and `user_id` record who enqueued it, for access checks.
+    """
+
+    def __init__(self, stages: List[str], document_id: Optional[int] = None, filename: Optional[str] = None,
+                 organization_id: Optional[int] = None, user_id: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.document_id = document_id
+        self.filename = filename
+        self.organization_id = organization_id
+        self.user_id = user_id
+        self.status = "queued"  # queued, running, completed, failed
+        self.error = None
+        self.result = {}
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.stages = {name: {"status": "pending", "progress": 0.0} for name in stages}
+        self._lock = threading.Lock()
+
+    def start_stage(self, name: str):
+        with self._lock:
+            self.status = "running"
+            self.stages[name] = {"status": "running", "progress": 0.0}
+            self.updated_at = time.time()
+
+    def update_stage(self, name: str, progress: float):
+        with self._lock:
+            self.stages[name]["progress"] = max(0.0, min(1.0, progress))
+            self.updated_at = time.time()
+
+    def finish_stage(self, name: str, status: str = "done"):
+        with self._lock:
+            self.stages[name] = {"status": status, "progress": 1.0}
+            self.updated_at = time.time()
+
+    def complete(self, **result):
+        with self._lock:
+            self.status = "completed"
+            self.result.update(result)
+            self.updated_at = time.time()
+
+    def fail(self, error: str):
+        with self._lock:
+            self.status = "failed"
+            self.error = error
+            for stage in self.stages.values():
+                if stage["status"] == "running":
+                    stage["status"] = "failed"
+            self.updated_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            progress = sum(stage["progress"] for stage in stages.values()) / max(len(stages), 1)
+            return {
+                "job_id": self.id,
+                "document_id": self.document_id,
+                "filename": self.filename,
+                "status": self.status,
+                "progress": round(progress, 3),
+                "stages": stages,
+                "error": self.error,
+                "result": dict(self.result),
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+            }
+
+
+class JobManager:
+    """
+    Bounded worker pool for background ingestion.
+
+    Pipelines always run on a fixed-size thread pool so they can report progress
+    back to the in-memory job registry. When INGEST_EXECUTOR=process, CPU-bound
+    stages dispatched via `run_cpu` are executed in a process pool of the same size
+    instead, keeping them off the GIL.
+
+    Note: the registry lives in-process, so with several uvicorn workers a client
+    must poll the worker that accepted its upload.
+    """
+
+    def __init__(self, max_workers: int = INGEST_MAX_WORKERS, executor: str = INGEST_EXECUTOR,
+                 max_pending: int = INGEST_MAX_PENDING_JOBS, max_pending_bytes: int = INGEST_MAX_PENDING_BYTES):
+        self.max_workers = max_workers
+        self.executor_kind = executor
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._reserved_bytes = 0
+        self._pool = None
+        self._cpu_pool = None
+
+    def _ensure_pools(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest")
+        if self.executor_kind == "process" and self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def pending_count(self) -> int:
+        # Queued or running jobs, plus reservations not yet turned into jobs
+        with self._lock:
+            return self._reserved
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            return self._reserved_bytes
+
+    def reserve(self, nbytes: int = 0) -> Reservation:
+        """
+        Takes a queue slot for a job holding `nbytes` of buffered input.
+        Raises JobQueueFull when max_pending jobs are pending or the bytes would exceed
+        max_pending_bytes (a single oversized upload is still admitted when the queue is empty).
+        """
+        with self._lock:
+            if self._reserved >= self.max_pending:
+                raise JobQueueFull(f"Too many pending ingestion jobs ({self.max_pending})")
+            if self._reserved and self._reserved_bytes + nbytes > self.max_pending_bytes:
+                raise JobQueueFull(f"Too much pending ingestion data ({self._reserved_bytes} bytes buffered)")
+            self._reserved += 1
+            self._reserved_bytes += nbytes
+        return Reservation(self, nbytes)
+
+    def _adjust(self, reservation: Reservation, nbytes: int):
+        with self._lock:
+            if not reservation.released:
+                self._reserved_bytes += nbytes - reservation.nbytes
+                reservation.nbytes = nbytes
+
+    def _release(self, reservation: Reservation):
+        with self._lock:
+            if reservation.released:
+                return
+            reservation.released = True
+            self._reserved -= 1
+            self._reserved_bytes -= reservation.nbytes
+
+    def submit(self, job: Job, fn: Callable, *args, reservation: Optional[Reservation] = None, **kwargs) -> Job:
+        """
+        Registers the job and schedules fn(job, *args, **kwargs) on the pool.
+        Uses `reservation` when given (see reserve()); otherwise takes a slot itself
+        and raises JobQueueFull when too many jobs are already waiting.
+        """
+        if reservation is None:
+            reservation = self.reserve()
+        reservation.attached = True
+        with self._lock:
+            self._prune()
+            self._ensure_pools()
+            self._jobs[job.id] = job
+
+        def _run():
+            try:
+                fn(job, *args, **kwargs)
+            except Exception as e:
+                print(f"Ingestion job {job.id} failed: {e}")
+                job.fail(str(e))
+            finally:
+                reservation.release()
+
+        self._pool.submit(_run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def runs_cpu_inline(self) -> bool:
+        # True when run_cpu calls fn on the calling thread (so fn may report progress)
+        return self._cpu_pool is None
+
+    def run_cpu(self, fn: Callable, *args):
+        """
+        Runs a CPU-bound, picklable top-level function either inline (thread mode)
+        or in the process pool (process mode), blocking the calling worker thread.
+        """
+        if self._cpu_pool is not None:
+            return self._cpu_pool.submit(fn, *args).result()
+        return fn(*args)
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=wait)
+            self._cpu_pool = None
+
+
+job_manager = JobManager()
@@ -0,0 +1,91 @@
+import re
+import math
+import zlib
+import unicodedata
+from collections import Counter
+from typing import List
+import numpy as np
+from .embeddings import EmbeddingBackend, EmbeddingBatchResult, NO_EMBEDDABLE_CONTENT
+
+_WORD_RE = re.compile(r"\w+")
+
+# Frequent Spanish function words carry no topical signal
+_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquellos aqui asi aun
+bajo bien cada como con contra cual cuales cuando de del desde donde dos el ella ellas ello ellos en
+entre era eran es esa esas ese eso esos esta estaba estado estan estar estas este esto estos fue fueron
+ha habia han hasta hay la las le les lo los mas me mi mis mucho muy nada ni no nos o otra otras otro
+otros para pero poco por porque que quien se sea segun ser si sido sin sobre su sus tambien tan tanto
+te tiene tienen todo todos tu tus un una unas uno unos y ya yo
+""".split())
+
+
+def _normalize_text(text: str) -> str:
+    # Lowercase and strip accents so "apelación" and "apelacion" share features
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _features(text: str) -> Counter:
+    words = [w for w in _WORD_RE.findall(_normalize_text(text)) if w not in _STOPWORDS]
+    features = Counter(f"w:{w}" for w in words)
+    features.update(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    # Character trigrams match inflections (plazo/plazos, apelar/apelación)
+    for word in words:
+        padded = f"<{word}>"
+        features.update(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+class LocalHashingEmbedder(EmbeddingBackend):
+    """
+    Deterministic in-process embedder: word, word-bigram and character-trigram
+    features are hashed (signed feature hashing) straight into `dimension` buckets,
+    weighted with sublinear term frequency, and L2-normalized so cosine similarity
+    works with the existing pgvector indexes.
+
+    There is no corpus-fitted IDF: vectors already stored must stay comparable with
+    queries embedded later, so weights cannot drift as the corpus grows. Stopword
+    removal and per-kind feature weights stand in for it.
+    """
+
+    name = "local"
+    FEATURE_WEIGHTS = {"w": 1.0, "b": 0.7, "c": 0.3}
+
+    def __init__(self, dimension: int = 768):
+        self.dimension = dimension
+
+    def _bucket_rows(self, text: str):
+        buckets, weights = [], []
+        for feature, count in _features(text).items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            buckets.append(digest % self.dimension)
+            weights.append(sign * self.FEATURE_WEIGHTS[feature[0]] * (1.0 + math.log(count)))
+        return buckets, weights
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        rows, buckets, weights = [], [], []
+        for row, text in enumerate(texts):
+            text_buckets, text_weights = self._bucket_rows(text or "")
+            rows.extend([row] * len(text_buckets))
+            buckets.extend(text_buckets)
+            weights.extend(text_weights)
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(buckets, dtype=np.intp)),
+                  np.asarray(weights, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed(self, texts: List[str]) -> EmbeddingBatchResult:
+        matrix = self.embed_matrix(texts)
+        vectors, errors = [], {}
+        for index, row in enumerate(matrix):
+            if not row.any():
+                # A zero vector has no cosine direction; treat it like a failed item
+                vectors.append(None)
+                errors[index] = NO_EMBEDDABLE_CONTENT
+            else:
+                vectors.append(row.tolist())
+        return EmbeddingBatchResult(vectors, errors)
@@ -1,23 +1,76 @@
 from fastapi import FastAPI, UploadFile, File, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 from .security import SecureFileHandler
-from . import models, database, schemas, embeddings
-from sqlalchemy.orm import Session
+from . import models, database, schemas, embeddings, content_cache, search, conversation
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session, selectinload, load_only
 from .database import engine, get_db
-from fastapi import FastAPI, UploadFile, File, Depends, Form, Request, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Depends, Form, Request, HTTPException, Query, BackgroundTasks, status
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from .audit_logger import log_action
+from .audit_logger import log_action, alog_action, audit_writer
+from .audit_partitions import maintain_partitions, PartitionMaintainer
+from .principals import Principal, principal_cache
+from .hashing import password_hasher, HashingQueueFull
+from .audit_query import AuditFilters, query_audit_logs, iter_audit_logs, export_csv, export_ndjson
 from . import auth
+from .jobs import job_manager, JobQueueFull
+from .ingestion import enqueue_document, enqueue_indexing, copy_chunks_from_duplicate
+from .ocr import shutdown_pdf_pool
+from .credentials import credential_manager
+from .gemini import GeminiClient, GeminiError, create_http_client
+from .context import PackedContext, retrieve_context, build_prompt
+from .response_cache import response_cache, RESPONSE_CACHE_ENABLED
+from .cases_cache import cases_cache, bump_cases_version, get_cases_version, CASES_CACHE_ENABLED
+from fastapi.concurrency import run_in_threadpool
 from jose import JWTError, jwt
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+import os
+import hashlib
+import mimetypes
+import json
+import time
+from datetime import datetime
 
-app = FastAPI(title="Bina Legal API", version="1.0.0")
+partition_maintainer = PartitionMaintainer(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled (keep-alive, HTTP/2) client for all Gemini calls
+    app.state.http_client = create_http_client()
+    app.state.gemini = GeminiClient(app.state.http_client)
+    # Upcoming monthly audit partitions (and retention), then the batched audit writer
+    await run_in_threadpool(maintain_partitions, engine)
+    partition_maintainer.start()
+    audit_writer.start()
+    yield
+    await app.state.http_client.aclose()
+    await embeddings.aclose_http_client()
+    # Let in-flight ingestion jobs finish before the process exits
+    job_manager.shutdown(wait=True)
+    shutdown_pdf_pool()
+    password_hasher.shutdown()
+    # Flush every queued audit event before exiting
+    audit_writer.stop()
+    partition_maintainer.stop()
+
+app = FastAPI(title="Bina Legal API", version="1.0.0", lifespan=lifespan)
+
+# Upper bound for ?limit= on paginated listings
+CASES_MAX_PAGE_SIZE = int(os.getenv("CASES_MAX_PAGE_SIZE", "500"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "500"))
 
 # Security Dependency
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    Resolves the caller from the JWT. Tokens carry uid/role/org claims, so with a warm
+    principal cache no query runs; a miss loads the user by primary key once.
+    Tokens whose role/org claims no longer match the user are rejected.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -30,11 +83,26 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-        
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if user is None:
+
+    user_id = payload.get("uid")
+    principal = principal_cache.get(user_id) if user_id is not None else None
+    if principal is None:
+        # Tokens issued before identity claims existed only carry the email
+        query = db.query(models.User)
+        if user_id is not None:
+            user = query.filter(models.User.id == user_id).first()
+        else:
+            user = query.filter(models.User.email == email).first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        principal_cache.put(principal)
+
+    if principal.is_active == 0:
         raise credentials_exception
-    return user
+    if user_id is not None and (payload.get("role") != principal.role or payload.get("org") != principal.organization_id):
+        raise credentials_exception
+    return principal
 
 # CORS Middleware for Frontend connection
 app.add_middleware(
@@ -43,193 +111,483 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Range", "Accept-Ranges", "Content-Disposition", "X-Next-After-Id", "X-Prev-Before-Id", "ETag"],
 )
 
+def _hashing_unavailable(e: HashingQueueFull) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+
+def _update_password_hash(db: Session, user: models.User, new_hash: str):
+    user.hashed_password = new_hash
+    db.commit()
+
 @app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(lambda: db.query(models.User).filter(models.User.email == form_data.username).first())
+    valid = False
+    if user:
+        # bcrypt runs in the dedicated hashing pool, not on the request threadpool
+        try:
+            valid, new_hash = await password_hasher.verify(form_data.password, user.hashed_password)
+        except HashingQueueFull as e:
+            raise _hashing_unavailable(e)
+        if valid and new_hash:
+            # Stored hash used outdated parameters: upgrade it now that we know the password
+            await run_in_threadpool(_update_password_hash, db, user, new_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": user.email})
+    if user.is_active == 0:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is deactivated")
+    access_token = auth.create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer", "role": user.role}
 
 @app.get("/")
 def read_root():
     return {"status": "Bina Backend Running", "system": "Secure"}
 
-@app.post("/upload")
+def _register_upload(db: Session, filename: str, file_path: str, case_id: Optional[int], content_key: str):
+    """
+    Creates the Document row of an upload. Known content is filled in from the content
+    cache, and its passage chunks are copied from an earlier copy of the same file;
+    otherwise OCR and embedding are left to the ingestion worker.
+    Returns (document, cache entry or None, whether chunks were copied).
+    """
+    cached = content_cache.lookup(db, content_key, embeddings.get_backend().model_id)
+    db_doc = models.Document(
+        filename=filename,
+        file_path=file_path,
+        case_id=case_id,
+        content_hash=content_key,
+        extracted_text=cached.extracted_text if cached else None,
+        embedding=cached.embedding if cached else None
+        # In multi-tenant, ensure document belongs to user's organization if applicable
+    )
+    db.add(db_doc)
+    # The document shows up in its case's listing
+    bump_cases_version(db, case_id=case_id)
+    db.commit()
+    db.refresh(db_doc)
+    chunks_copied = cached is not None and copy_chunks_from_duplicate(db, db_doc.id, content_key)
+    return db_doc, cached, chunks_copied
+
+@app.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...), 
     case_id: int = Form(None),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     secure_handler = SecureFileHandler()
-    
-    # 1. Save Encrypted File (Standard Logic)
-    encrypted_path = await secure_handler.save_encrypted_file(file)
-    
-    # 2. OCR Processing (Hybrid)
-    extracted_text_content = ""
+
+    # 0. Take the ingestion queue slot first: when the queue is full, answer 503
+    #    before anything is buffered, stored or registered
     try:
-        # Create a temp file with the original content for OCR processing
-        # We need to read the file again or use the encrypted one and decrypt it.
-        # Since we just read `await file.read()` in save_encrypted_file, `file` cursor is at end.
-        # It's better to decrypt the saved file to a temp location.
-        
-        # Determine extension
-        ext = os.path.splitext(file.filename)[1].lower()
-        if not ext:
-            ext = ".tmp"
-            
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_ocr_file:
-            # Decrypt the file we just saved to getting back original content
-            decrypted_content = secure_handler.decrypt_file(encrypted_path)
-            temp_ocr_file.write(decrypted_content)
-            temp_ocr_path = temp_ocr_file.name
-            
-        # Perform OCR
-        ocr_service = OCRService()
+        reservation = job_manager.reserve(file.size or 0)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    try:
+        # 1. Single pass over the upload: encrypt to disk, hash and keep the plaintext buffer for OCR
+        upload = await secure_handler.save_encrypted_upload(file)
+        encrypted_path = upload.file_path
+        reservation.resize(len(upload.content))
+
+        if upload.deduplicated:
+            content_cache.record_deduplicated_blob()
+
+        # 2-3. Register the document (DB work stays off the event loop); re-uploads of known
+        #      content by the same organization reuse the cached OCR text, embedding and chunks
+        content_key = secure_handler.content_key(upload.sha256, current_user.organization_id)
+        db_doc, cached, chunks_copied = await run_in_threadpool(
+            _register_upload, db, file.filename, encrypted_path, case_id, content_key
+        )
+        # Cached chat answers for this case may no longer reflect its documents
+        response_cache.invalidate(case_id)
+
+        response = {
+            "filename": file.filename,
+            "status": "encrypted",
+            "path": encrypted_path,
+            "document_id": db_doc.id,
+            "case_id": case_id,
+        }
+
+        if cached:
+            # Passage chunks come from an earlier copy of the same file; only chunk + embed if none exists
+            job = None
+            if not chunks_copied and cached.extracted_text:
+                # The indexing job works from the cached text, not from the upload buffer
+                reservation.resize(0)
+                job = enqueue_indexing(db_doc.id, file.filename, cached.extracted_text, reservation=reservation,
+                                       organization_id=current_user.organization_id, user_id=current_user.id)
+            await alog_action(db, request, "UPLOAD", f"Uploaded {file.filename}. Reused cached OCR/embedding", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+            response.update({
+                "job_id": job.id if job else None,
+                "ocr_status": "success" if cached.extracted_text else "no-text/failed"
+            })
+            return response
+
+        # 4. Hand OCR + embedding off to the background worker pool (capacity is already reserved)
         mime_type = file.content_type or "application/octet-stream"
-        
-        # Fix mime type for PDF if generic
-        if ext == ".pdf":
-            mime_type = "application/pdf"
-            
-        print(f"Starting OCR for {file.filename} ({mime_type})...")
-        extracted_text_content = ocr_service.extract_text(temp_ocr_path, mime_type)
-        print(f"OCR Complete. Extracted {len(extracted_text_content)} chars.")
-        
-        # Secure cleanup of temp file
-        os.remove(temp_ocr_path)
-        
-    except Exception as e:
-        print(f"OCR Pipeline Error: {e}")
-        # Non-blocking error, we still save the file
-        extracted_text_content = "" # Ensure it's empty string if failed
+        job = enqueue_document(upload.content, db_doc.id, file.filename, mime_type, content_hash=content_key,
+                               reservation=reservation, organization_id=current_user.organization_id,
+                               user_id=current_user.id)
+    finally:
+        # No-op once a job owns the reservation; frees the slot on every other path
+        if not reservation.attached:
+            reservation.release()
 
-    
-    # Generate Embedding Stub
-    emb_service = embeddings.EmbeddingService()
-    # Use extracted text ideally, but fallback to stub for now if expense concern
-    # For now, let's keep the mock text or use a snippet of OCR?
-    # Let's use the first 500 chars of OCR if available for embedding context!
-    embed_input = extracted_text_content[:1000] if extracted_text_content else "mock text content"
-    vector = emb_service.get_embedding(embed_input)
-
-    # Save to DB
-    db_doc = models.Document(
-        filename=file.filename,
-        file_path=encrypted_path,
-        case_id=case_id,
-        embedding=vector,
-        extracted_text=extracted_text_content
-        # In multi-tenant, ensure document belongs to user's organization if applicable
-    )
-    db.add(db_doc)
-    db.commit()
-    db.refresh(db_doc)
+    await alog_action(db, request, "UPLOAD", f"Uploaded {file.filename}. Ingestion job {job.id}", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+    response.update({
+        "job_id": job.id,
+        "ocr_status": "pending"
+    })
+    return response
 
-    log_action(db, request if 'request' in locals() else None, "UPLOAD", f"Uploaded {file.filename}. OCR chars: {len(extracted_text_content)}", user_id=current_user.id, user_type="User") 
+@app.get("/search", response_model=List[schemas.SearchResult])
+async def search_documents(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    case_id: Optional[int] = None,
+    k: int = Query(10, ge=1, le=100),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000),
+    target: str = Query("chunks", pattern="^(chunks|documents)$"),
+    mode: str = Query("semantic", pattern="^(semantic|keyword|hybrid)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Search over the caller's organization. `mode=semantic` embeds `q` and returns the k
+    most similar passages (or documents); `mode=keyword` is Postgres full-text search
+    (no embedding call); `mode=hybrid` fuses both rankings per document.
+    `ef_search` trades recall for latency.
+    """
+    # SuperAdmin searches across organizations
+    organization_id = None if current_user.role == 0 else current_user.organization_id
+
+    if mode == "keyword":
+        results = await run_in_threadpool(search.keyword_search, db, q, organization_id, case_id=case_id, k=k)
+    else:
+        try:
+            query_vector = await embeddings.EmbeddingService().get_embedding_async(q)
+        except embeddings.EmptyEmbeddingInput:
+            # Only stopwords or punctuation: a bad query, not an upstream failure
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Query has no searchable terms")
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Embedding error: {e}")
+
+        if mode == "hybrid":
+            results = await run_in_threadpool(
+                search.hybrid_search, db, q, query_vector, organization_id,
+                case_id=case_id, k=k, ef_search=ef_search
+            )
+        else:
+            results = await run_in_threadpool(
+                search.semantic_search, db, query_vector, organization_id,
+                case_id=case_id, k=k, ef_search=ef_search, target=target
+            )
+    await alog_action(db, request, "SEARCH", f"Search ({mode}, {target}, k={k}) case={case_id}", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+    return results
+
+@app.get("/metrics")
+def get_metrics(current_user: Principal = Depends(get_current_user)):
     return {
-        "filename": file.filename, 
-        "status": "encrypted", 
-        "path": encrypted_path,
-        "document_id": db_doc.id,
-        "case_id": case_id,
-        "ocr_status": "success" if extracted_text_content else "no-text/failed"
+        "ingest_cache": content_cache.stats(),
+        "google_auth": credential_manager.stats(),
+        "chat_response_cache": response_cache.stats(),
+        "audit_writer": audit_writer.stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "cases_cache": cases_cache.stats(),
     }
 
-@app.get("/cases", response_model=List[schemas.Case])
-def get_cases(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str, current_user: Principal = Depends(get_current_user)):
+    job = job_manager.get(job_id)
+    # Only the uploader (or a SuperAdmin) may poll a job; anyone else is told it does not exist
+    if not job or (current_user.role != 0 and (job.organization_id != current_user.organization_id
+                                               or job.user_id != current_user.id)):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+def _load_cases(db: Session, current_user: Principal, after_id: Optional[int], limit: Optional[int], summary: bool):
+    # Returns (cases, next_after_id)
+    if summary:
+        document_count = select(func.count(models.Document.id)).where(
+            models.Document.case_id == models.Case.id
+        ).correlate(models.Case).scalar_subquery()
+        query = db.query(models.Case.id, models.Case.title, models.Case.description, models.Case.created_at,
+                         document_count.label("document_count"))
+    else:
+        # Two queries in total: the cases, then all their documents via selectinload.
+        # Only the columns the response needs; never the embedding or extracted text.
+        query = db.query(models.Case).options(
+            load_only(models.Case.id, models.Case.title, models.Case.description, models.Case.created_at),
+            selectinload(models.Case.documents).load_only(
+                models.Document.id, models.Document.filename, models.Document.upload_date, models.Document.case_id
+            ),
+        )
+
     # SaaS Logic: Filter by Organization
-    if current_user.role == 0: # SuperAdmin
-        cases = db.query(models.Case).all()
+    if current_user.role != 0: # SuperAdmin sees every organization
+        query = query.filter(models.Case.organization_id == current_user.organization_id)
+    if after_id is not None:
+        query = query.filter(models.Case.id > after_id)
+    query = query.order_by(models.Case.id)
+
+    next_after_id = None
+    if limit is not None:
+        cases = query.limit(limit + 1).all()
+        if len(cases) > limit:
+            cases = cases[:limit]
+            next_after_id = cases[-1].id
     else:
-        cases = db.query(models.Case).filter(models.Case.organization_id == current_user.organization_id).all()
-        
-    log_action(db, request, "CONSULT", "Viewed case list", user_id=current_user.id, user_type="User")
+        cases = query.all()
+
+    if summary:
+        cases = [dict(row._mapping) for row in cases]
+    return cases, next_after_id
+
+@app.get("/cases", response_model=List[schemas.Case])
+def get_cases(request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user),
+              response: Response = None, after_id: Optional[int] = None, limit: Optional[int] = None, summary: bool = False):
+    """
+    Cases of the caller's organization, by id. Pass `limit` (and `after_id` from the
+    X-Next-After-Id header) to page through them. `summary=true` returns
+    document_count instead of the document list, in a single query.
+    Organization listings carry an ETag built from the organization's cases_version:
+    a matching If-None-Match returns 304, and repeated reads of an unchanged version
+    are served from an in-process cache, without querying case rows.
+    """
+    if limit is not None:
+        limit = max(1, min(limit, CASES_MAX_PAGE_SIZE))
+    log_details = dict(user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+
+    # SuperAdmin listings span organizations and are never cached
+    version = None
+    if current_user.role != 0 and current_user.organization_id is not None:
+        version = get_cases_version(db, current_user.organization_id)
+
+    if version is None:
+        cases, next_after_id = _load_cases(db, current_user, after_id, limit, summary)
+        if next_after_id is not None and response is not None:
+            response.headers["X-Next-After-Id"] = str(next_after_id)
+        log_action(db, request, "CONSULT", "Viewed case list", **log_details)
+        return cases
+
+    variant = f"{after_id}:{limit}:{summary}"
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:8]
+    headers = {"ETag": f'W/"cases-{current_user.organization_id}-{version}-{digest}"',
+               "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        log_action(db, request, "CONSULT", "Viewed case list (not modified)", **log_details)
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cached = cases_cache.get(current_user.organization_id, variant, version) if CASES_CACHE_ENABLED else None
+    if cached is not None:
+        cases, next_after_id = cached
+    else:
+        cases, next_after_id = _load_cases(db, current_user, after_id, limit, summary)
+        if CASES_CACHE_ENABLED:
+            # Plain dicts: the cached payload must not depend on this request's session.
+            # Tagged with the version read before loading, so a concurrent bump only causes a miss.
+            cases = [schemas.Case.model_validate(case).model_dump() for case in cases]
+            cases_cache.put(current_user.organization_id, variant, version, (cases, next_after_id))
+
+    if response is not None:
+        response.headers.update(headers)
+        if next_after_id is not None:
+            response.headers["X-Next-After-Id"] = str(next_after_id)
+    log_action(db, request, "CONSULT", "Viewed case list", **log_details)
     return cases
 
 @app.post("/cases", response_model=schemas.Case)
-def create_case(request: Request, case: schemas.CaseCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_case(request: Request, case: schemas.CaseCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     db_case = models.Case(
         title=case.title, 
         description=case.description, 
         organization_id=current_user.organization_id
     )
     db.add(db_case)
+    bump_cases_version(db, organization_id=current_user.organization_id)
     db.commit()
     db.refresh(db_case)
-    log_action(db, request, "CREATE", f"Created case {db_case.id}: {db_case.title}", user_id=current_user.id, user_type="User")
+    log_action(db, request, "CREATE", f"Created case {db_case.id}: {db_case.title}", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
     return db_case
 
+def _authorize_case(db: Session, case_id: int, current_user: Principal) -> Optional[int]:
+    """
+    Raises 404 unless the case exists and belongs to the caller's organization
+    (SuperAdmin excepted). Returns the organization scope for document lookups.
+    """
+    case = db.query(models.Case.id, models.Case.organization_id).filter(models.Case.id == case_id).first()
+    # A case of another organization gets the same answer as a missing one
+    if not case or (current_user.role != 0 and case.organization_id != current_user.organization_id):
+        raise HTTPException(status_code=404, detail="Case not found")
+    return None if current_user.role == 0 else case.organization_id
+
+def _history_etag(db: Session, case_id: int, variant: str) -> str:
+    # Messages are append-only, so (newest id, count) identifies the thread's state.
+    # Index-only scan on ix_messages_case_id_id.
+    max_id, count = db.query(func.max(models.Message.id), func.count(models.Message.id)).filter(
+        models.Message.case_id == case_id
+    ).one()
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:8]
+    return f'W/"chat-{case_id}-{max_id or 0}-{count}-{digest}"'
+
 @app.get("/chat/{case_id}", response_model=List[schemas.Message])
-def get_chat_history(case_id: int, request: Request, db: Session = Depends(get_db)):
-    messages = db.query(models.Message).filter(models.Message.case_id == case_id).order_by(models.Message.timestamp).all()
+def get_chat_history(case_id: int, request: Request, db: Session = Depends(get_db),
+                     current_user: Principal = Depends(get_current_user), response: Response = None,
+                     before_id: Optional[int] = None, since_id: Optional[int] = None, limit: Optional[int] = None):
+    """
+    Messages of a case, oldest first.
+    - `limit` (optionally with `before_id`): the newest `limit` messages older than
+      `before_id`; X-Prev-Before-Id points at the next older page.
+    - `since_id`: only messages newer than `since_id` (incremental sync).
+    Responses carry an ETag; a matching If-None-Match returns 304 without loading messages.
+    """
+    _authorize_case(db, case_id, current_user)
+    if limit is not None:
+        limit = max(1, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE))
+    etag = _history_etag(db, case_id, f"{before_id}:{since_id}:{limit}")
     log_action(db, request, "CONSULT", f"Viewed chat history for case {case_id}")
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    query = db.query(models.Message).filter(models.Message.case_id == case_id)
+    if since_id is not None:
+        query = query.filter(models.Message.id > since_id)
+    if before_id is not None:
+        query = query.filter(models.Message.id < before_id)
+
+    if since_id is None and limit is not None:
+        # Walk backwards from the newest message, then return the page oldest first
+        messages = query.order_by(models.Message.id.desc()).limit(limit + 1).all()
+        has_older = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
+        if has_older and response is not None:
+            response.headers["X-Prev-Before-Id"] = str(messages[0].id)
+    else:
+        query = query.order_by(models.Message.id)
+        messages = query.limit(limit).all() if limit is not None else query.all()
+
+    if response is not None:
+        response.headers.update(cache_headers)
     return messages
 
-@app.post("/chat", response_model=schemas.Message)
-def chat_endpoint(message: schemas.MessageCreate, db: Session = Depends(get_db)):
-    # 1. Save user message
-    user_msg = models.Message(
-        sender="user",
-        content=message.content,
-        case_id=message.case_id
+def _save_message(db: Session, sender: str, content: str, case_id: int,
+                  context: Optional[PackedContext] = None) -> models.Message:
+    msg = models.Message(
+        sender=sender,
+        content=content,
+        case_id=case_id
     )
-    db.add(user_msg)
+    if context is not None:
+        msg.context_tokens = context.tokens
+        msg.retrieval_ms = context.retrieval_ms
+    db.add(msg)
     db.commit()
+    db.refresh(msg)
+    return msg
 
-    # 2. Generate AI Response using Global Generative Language API (Service Account)
-    import httpx
-    import os
-    import google.auth
-    from google.auth.transport.requests import Request
+def get_gemini(request: Request) -> GeminiClient:
+    return request.app.state.gemini
 
-    # PROJECT_ID is still needed for x-goog-user-project header sometimes
-    PROJECT_ID = os.getenv("VERTEX_AI_PROJECT_ID")
-    ai_response_text = "Lo siento, no puedo procesar tu solicitud en este momento."
+async def _embed_question(question: str) -> Optional[List[float]]:
+    try:
+        return await embeddings.EmbeddingService().get_embedding_async(question)
+    except Exception as e:
+        print(f"Question embedding error: {e}")
+        return None
 
+def _is_cacheable(message: schemas.MessageCreate) -> bool:
+    # Follow-ups depend on the previous turns, so only standalone questions share answers
+    return RESPONSE_CACHE_ENABLED and conversation.is_standalone(message.content)
+
+def _cached_answer(case_id: int, query_vector: Optional[List[float]], cacheable: bool):
+    if not cacheable or query_vector is None:
+        return None
+    return response_cache.lookup(case_id, query_vector)
+
+def _cache_answer(message: schemas.MessageCreate, query_vector: Optional[List[float]], cacheable: bool,
+                  answer: str, started: float):
+    # Latency of the full miss path (retrieval + generation) is what a later hit saves
+    if cacheable and query_vector is not None:
+        response_cache.store(message.case_id, message.content, query_vector, answer,
+                             (time.perf_counter() - started) * 1000)
+
+async def _retrieve_chat_context(db: Session, message: schemas.MessageCreate, query_vector: Optional[List[float]],
+                                 started: float, organization_id: Optional[int]) -> Optional[PackedContext]:
+    """
+    Packs the best passages of the case's documents for the embedded question.
+    Retrieval is best-effort: on failure the question is sent without context.
+    """
+    if query_vector is None:
+        return None
     try:
-        # Get Access Token
-        credentials, project = google.auth.default(
-            scopes=[
-                "https://www.googleapis.com/auth/cloud-platform",
-                "https://www.googleapis.com/auth/generative-language"
-            ]
-        )
-        auth_req = Request()
-        credentials.refresh(auth_req)
-        token = credentials.token
-
-        # Global API Endpoint
-        # Using gemini-2.0-flash as it was found in the available models list
-        model_name = "gemini-2.0-flash"
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
-        
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "x-goog-user-project": PROJECT_ID
-        }
-        
-        payload = {
-            "contents": [{
-                "role": "user",
-                "parts": [{"text": message.content}]
-            }],
-            "generationConfig": {
-                "temperature": 0.5,
-                "maxOutputTokens": 1024
-            }
+        context = await run_in_threadpool(retrieve_context, db, query_vector, message.case_id, organization_id)
+    except Exception as e:
+        print(f"Context retrieval error: {e}")
+        return None
+    context.retrieval_ms = (time.perf_counter() - started) * 1000
+    print(f"Chat context: {len(context.passages)} passages, {context.tokens} tokens, {context.retrieval_ms:.0f} ms")
+    return context
+
+def _chat_payload(question: str, context: Optional[PackedContext], summary: Optional[str] = None,
+                  history: List[models.Message] = ()) -> dict:
+    # Rolling case summary + recent turns + the (context-augmented) question
+    payload = {
+        "contents": conversation.build_contents(list(history), build_prompt(question, context)),
+        "generationConfig": {
+            "temperature": 0.5,
+            "maxOutputTokens": 1024
         }
+    }
+    system_instruction = conversation.summary_instruction(summary)
+    if system_instruction:
+        payload["systemInstruction"] = system_instruction
+    return payload
+
+async def _prepare_chat(db: Session, message: schemas.MessageCreate, user_msg: models.Message,
+                        query_vector: Optional[List[float]], started: float, organization_id: Optional[int]):
+    context = await _retrieve_chat_context(db, message, query_vector, started, organization_id)
+    summary, history = await run_in_threadpool(conversation.load_history, db, message.case_id, user_msg.id)
+    return _chat_payload(message.content, context, summary, history), context
+
+@app.post("/chat", response_model=schemas.Message)
+async def chat_endpoint(message: schemas.MessageCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db),
+                        gemini: GeminiClient = Depends(get_gemini), current_user: Principal = Depends(get_current_user)):
+    # 1. Check the case is the caller's, then save user message (DB work stays off the event loop)
+    organization_id = await run_in_threadpool(_authorize_case, db, message.case_id, current_user)
+    user_msg = await run_in_threadpool(_save_message, db, "user", message.content, message.case_id)
+    # Fold aged-out messages into the case summary after the response is sent
+    background_tasks.add_task(conversation.refresh_summary, message.case_id, gemini)
+
+    # 2. Near-identical standalone questions already answered for this case skip
+    #    retrieval and generation
+    started = time.perf_counter()
+    query_vector = await _embed_question(message.content)
+    cacheable = _is_cacheable(message)
+    cached = _cached_answer(message.case_id, query_vector, cacheable)
+    if cached is not None:
+        ai_msg = await run_in_threadpool(_save_message, db, "ai", cached.answer, message.case_id)
+        ai_msg.cached = True
+        return ai_msg
 
-        response = httpx.post(url, json=payload, headers=headers, timeout=30.0)
+    # 3. Retrieve the most relevant passages of the case's documents, plus summary and recent turns
+    payload, context = await _prepare_chat(db, message, user_msg, query_vector, started, organization_id)
+
+    # 4. Generate AI Response using Global Generative Language API (Service Account)
+    ai_response_text = "Lo siento, no puedo procesar tu solicitud en este momento."
+
+    try:
+        response = await gemini.generate_content(payload)
         
         if response.status_code != 200:
             print(f"Global AI Chat Error: {response.text}")
@@ -240,22 +598,81 @@ def chat_endpoint(message: schemas.MessageCreate, db: Session = Depends(get_db))
                 candidate = data["candidates"][0]
                 if "content" in candidate:
                     ai_response_text = candidate["content"]["parts"][0]["text"]
+                    _cache_answer(message, query_vector, cacheable, ai_response_text, started)
                 else:
                     ai_response_text = "La IA no generó respuesta (posible bloqueo de seguridad)."
     except Exception as e:
         print(f"Error calling Global AI API: {e}")
         ai_response_text = f"Error: {str(e)}"
     
-    ai_msg = models.Message(
-        sender="ai",
-        content=ai_response_text,
-        case_id=message.case_id
+    return await run_in_threadpool(_save_message, db, "ai", ai_response_text, message.case_id, context)
+
+def _save_message_new_session(sender: str, content: str, case_id: int,
+                              context: Optional[PackedContext] = None) -> models.Message:
+    # Streaming responses outlive the request-scoped session, so use a dedicated one
+    db = database.SessionLocal()
+    try:
+        return _save_message(db, sender, content, case_id, context)
+    finally:
+        db.close()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(message: schemas.MessageCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db),
+                               gemini: GeminiClient = Depends(get_gemini), current_user: Principal = Depends(get_current_user)):
+    """
+    Same as /chat but forwards Gemini tokens as server-sent events:
+    `token` events carry text deltas and a final `done` event carries the saved AI message.
+    A cached answer is sent as a single `token` event.
+    If the client disconnects the upstream request is cancelled and no AI message is saved.
+    """
+    organization_id = await run_in_threadpool(_authorize_case, db, message.case_id, current_user)
+    user_msg = await run_in_threadpool(_save_message, db, "user", message.content, message.case_id)
+    started = time.perf_counter()
+    query_vector = await _embed_question(message.content)
+    cacheable = _is_cacheable(message)
+    cached = _cached_answer(message.case_id, query_vector, cacheable)
+    if cached is None:
+        payload, context = await _prepare_chat(db, message, user_msg, query_vector, started, organization_id)
+
+    async def event_stream():
+        if cached is not None:
+            yield _sse("token", {"text": cached.answer})
+            ai_msg = await run_in_threadpool(_save_message_new_session, "ai", cached.answer, message.case_id)
+            ai_msg.cached = True
+            yield _sse("done", schemas.Message.model_validate(ai_msg).model_dump(mode="json"))
+            return
+
+        parts = []
+        try:
+            async for delta in gemini.stream_generate_content(payload):
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+            ai_response_text = "".join(parts) or "La IA no generó respuesta (posible bloqueo de seguridad)."
+            if parts:
+                _cache_answer(message, query_vector, cacheable, ai_response_text, started)
+        except GeminiError as e:
+            print(f"Global AI Chat Error: {e.body}")
+            ai_response_text = "".join(parts) or f"Error del sistema: {e.status_code}"
+            yield _sse("error", {"detail": ai_response_text})
+        except Exception as e:
+            print(f"Error calling Global AI API: {e}")
+            ai_response_text = "".join(parts) or f"Error: {str(e)}"
+            yield _sse("error", {"detail": ai_response_text})
+
+        ai_msg = await run_in_threadpool(_save_message_new_session, "ai", ai_response_text, message.case_id, context)
+        yield _sse("done", schemas.Message.model_validate(ai_msg).model_dump(mode="json"))
+
+    # Runs once the stream has completed
+    background_tasks.add_task(conversation.refresh_summary, message.case_id, gemini)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
     )
-    db.add(ai_msg)
-    db.commit()
-    db.refresh(ai_msg)
-    
-    return ai_msg
 
 @app.delete("/cases/{case_id}")
 def delete_case(case_id: int, request: Request, db: Session = Depends(get_db)):
@@ -263,40 +680,144 @@ def delete_case(case_id: int, request: Request, db: Session = Depends(get_db)):
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
     
+    bump_cases_version(db, organization_id=case.organization_id)
     db.delete(case)
     db.commit()
+    response_cache.invalidate(case_id)
     log_action(db, request, "DELETE", f"Deleted case {case_id}")
     return {"status": "deleted", "case_id": case_id}
 
+def _parse_range(range_header: str, size: int):
+    """
+    Parses a single-range `Range: bytes=...` header into an inclusive (start, end).
+    Returns None when the header should be ignored (absent, malformed or multi-range)
+    and raises 416 when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_str, _, end_str = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_str == "":
+            # Suffix range: last N bytes
+            length = int(end_str)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
 @app.get("/download/{document_id}")
 def download_file(document_id: int, request: Request, db: Session = Depends(get_db)):
     doc = db.query(models.Document).filter(models.Document.id == document_id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Decrypt file for download
+    # Decrypt on the fly: plaintext is streamed frame by frame and never written to disk
     secure_handler = SecureFileHandler()
     try:
-        decrypted_content = secure_handler.decrypt_file(doc.file_path)
+        size = secure_handler.plaintext_size(doc.file_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error decrypting file")
-    
-    # Save temporarily to send
-    # Ideally use a tempfile module, but for simplicity:
-    import os
-    temp_path = f"temp_{doc.filename}"
-    with open(temp_path, "wb") as f:
-        f.write(decrypted_content)
-        
+
+    byte_range = _parse_range(request.headers.get("range"), size)
+    start, end = byte_range if byte_range else (0, size - 1)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(max(end - start + 1, 0)),
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(doc.filename)}",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
     log_action(db, request, "DOWNLOAD", f"Downloaded document {document_id}: {doc.filename}")
-    
-    # Use BackgroundTasks to clean up if we were doing this properly for prod
-    return FileResponse(temp_path, filename=doc.filename)
+
+    media_type = mimetypes.guess_type(doc.filename)[0] or "application/octet-stream"
+    body = secure_handler.decrypt_range(doc.file_path, start, end) if size else iter([b""])
+    return StreamingResponse(
+        body,
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=media_type,
+        headers=headers,
+    )
 
 # SaaS Management Endpoints
 
+def _audit_filters(current_user: Principal, organization_id: Optional[int], user_id: Optional[int],
+                   action: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> AuditFilters:
+    if current_user.role == 0: # SuperAdmin: any organization
+        pass
+    elif current_user.role == 1: # OrgAdmin: own organization only
+        organization_id = current_user.organization_id
+    else:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return AuditFilters(organization_id=organization_id, user_id=user_id, action=action, since=since, until=until)
+
+@app.get("/admin/audit-logs", response_model=schemas.AuditLogPage)
+def get_audit_logs(
+    request: Request,
+    organization_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Audit events, newest first. Pass `next_cursor` back as `cursor` for the next page.
+    """
+    filters = _audit_filters(current_user, organization_id, user_id, action, since, until)
+    try:
+        items, next_cursor = query_audit_logs(db, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    log_action(db, request, "AUDIT_QUERY", f"Queried audit logs user={user_id} org={filters.organization_id}", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/admin/audit-logs/export")
+def export_audit_logs(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    organization_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Streams every matching audit event (newest first) as CSV or NDJSON, reading in
+    keyset pages so memory stays flat for exports of any size.
+    """
+    filters = _audit_filters(current_user, organization_id, user_id, action, since, until)
+    log_action(db, request, "AUDIT_EXPORT", f"Exported audit logs ({format}) user={user_id} org={filters.organization_id}", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+
+    entries = iter_audit_logs(database.SessionLocal, filters)
+    if format == "ndjson":
+        body, media_type = export_ndjson(entries), "application/x-ndjson"
+    else:
+        body, media_type = export_csv(entries), "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="audit_logs.{format}"'},
+    )
+
 @app.post("/organizations", dependencies=[Depends(get_current_user)])
-def create_organization(name: str = Form(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_organization(name: str = Form(...), db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role != 0: # Only SuperAdmin
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -304,17 +825,22 @@ def create_organization(name: str = Form(...), db: Session = Depends(get_db), cu
     db.add(org)
     db.commit()
     db.refresh(org)
-    log_action(db, None, "CREATE_ORG", f"Created Organization {org.id}: {org.name}", user_id=current_user.id, user_type="SuperAdmin")
+    log_action(db, None, "CREATE_ORG", f"Created Organization {org.id}: {org.name}", user_id=current_user.id, user_type="SuperAdmin", organization_id=org.id)
     return org
 
+def _insert_user(db: Session, user: models.User) -> int:
+    db.add(user)
+    db.commit()
+    return user.id
+
 @app.post("/users", dependencies=[Depends(get_current_user)])
-def create_user(
+async def create_user(
     email: str = Form(...), 
     password: str = Form(...), 
     role: int = Form(...), 
     organization_id: int = Form(None),
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Authorization Logic
     if current_user.role == 0: # SuperAdmin can create any user
@@ -326,9 +852,34 @@ def create_user(
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    hashed_pw = auth.get_password_hash(password)
+    try:
+        hashed_pw = await password_hasher.hash(password)
+    except HashingQueueFull as e:
+        raise _hashing_unavailable(e)
     user = models.User(email=email, hashed_password=hashed_pw, role=role, organization_id=organization_id)
-    db.add(user)
-    db.commit()
+    user_id = await run_in_threadpool(_insert_user, db, user)
+    principal_cache.invalidate(user_id)
     return {"status": "User created", "email": email}
 
+@app.post("/users/{user_id}/deactivate")
+def deactivate_user(user_id: int, request: Request, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Same rules as create_user: OrgAdmins manage non-admin users of their own org
+    if current_user.role == 0:
+        pass
+    elif current_user.role == 1:
+        if user.organization_id != current_user.organization_id or user.role <= 1:
+            raise HTTPException(status_code=403, detail="Not authorized")
+    else:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    user.is_active = 0
+    db.commit()
+    # Takes effect on the caller's next request, not when their token expires
+    principal_cache.invalidate(user_id)
+    log_action(db, request, "DEACTIVATE_USER", f"Deactivated user {user_id}", user_id=current_user.id, user_type="User", organization_id=current_user.organization_id)
+    return {"status": "User deactivated", "user_id": user_id}
+
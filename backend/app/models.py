@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Text, Float, Index, Computed, Sequence, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from .database import Base
 from pgvector.sqlalchemy import Vector
@@ -23,12 +24,27 @@ class Case(Base):
     title = Column(String, index=True) # e.g., "Familia Pérez"
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=True, index=True)
 
     organization = relationship("Organization", back_populates="cases")
     
     documents = relationship("Document", back_populates="case")
     messages = relationship("Message", back_populates="case")
+    summary = relationship("CaseSummary", back_populates="case", uselist=False,
+                           cascade="all, delete-orphan", passive_deletes=True)
+
+class CaseSummary(Base):
+    __tablename__ = "case_summaries"
+
+    # Rolling summary of a case's conversation, refreshed in the background
+    case_id = Column(Integer, ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    # Highest Message.id folded into the summary; later messages are not covered yet
+    last_message_id = Column(Integer, nullable=False, default=0)
+    message_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    case = relationship("Case", back_populates="summary")
 
 class Message(Base):
     __tablename__ = "messages"
@@ -38,9 +54,17 @@ class Message(Base):
     content = Column(Text)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     case_id = Column(Integer, ForeignKey("cases.id"))
+    # RAG cost of an AI reply: retrieved-context tokens sent to the model and retrieval latency
+    context_tokens = Column(Integer, nullable=True)
+    retrieval_ms = Column(Float, nullable=True)
 
     case = relationship("Case", back_populates="messages")
 
+    __table_args__ = (
+        # Serves per-case history in id order, keyset pages and since_id deltas
+        Index("ix_messages_case_id_id", "case_id", "id"),
+    )
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -48,7 +72,7 @@ class Document(Base):
     filename = Column(String)
     file_path = Column(String) # Path to encrypted file
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
-    case_id = Column(Integer, ForeignKey("cases.id"), nullable=True)
+    case_id = Column(Integer, ForeignKey("cases.id"), nullable=True, index=True)
     
     # Vector embedding for semantic search (Gemini text-embedding-004 uses 768 dimensions)
     embedding = Column(Vector(768))
@@ -56,7 +80,65 @@ class Document(Base):
     # Extracted text from OCR (Hybrid: PyMuPDF or Google Cloud Vision)
     extracted_text = Column(Text, nullable=True)
 
+    # Full-text search vector, generated by Postgres from extracted_text (Spanish stemming/stopwords)
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed("to_tsvector('spanish', coalesce(extracted_text, ''))", persisted=True)
+    ))
+
+    # Per-organization keyed hash of the plaintext (SecureFileHandler.content_key)
+    content_hash = Column(String(64), index=True, nullable=True)
+
     case = relationship("Case", back_populates="documents")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Approximate nearest neighbour index for cosine similarity search (pgvector HNSW)
+        Index(
+            "ix_documents_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        Index("ix_documents_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    chunk_index = Column(Integer, nullable=False) # Position of the chunk within the document
+    page_number = Column(Integer, nullable=True) # 1-based page the chunk starts on
+    start_offset = Column(Integer) # Character offsets into Document.extracted_text
+    end_offset = Column(Integer)
+    content = Column(Text)
+
+    # Passage-level embedding (same model/dimension as Document.embedding)
+    embedding = Column(Vector(768))
+
+    document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        Index(
+            "ix_document_chunks_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+class ContentCache(Base):
+    __tablename__ = "content_cache"
+
+    # OCR + embedding results keyed by SecureFileHandler.content_key (per organization),
+    # so re-uploading the same file (in any of its cases) skips reprocessing
+    content_hash = Column(String(64), primary_key=True)
+    extracted_text = Column(Text, nullable=True)
+    embedding = Column(Vector(768))
+    # EmbeddingBackend.model_id that produced `embedding`; other backends miss
+    embedding_model = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Organization(Base):
     __tablename__ = "organizations"
@@ -65,22 +147,38 @@ class Organization(Base):
     name = Column(String, unique=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_active = Column(Integer, default=1)
+    # Bumped whenever the organization's case listing changes; backs the /cases ETag
+    cases_version = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     users = relationship("User", back_populates="organization")
     cases = relationship("Case", back_populates="organization")
 
+audit_logs_id_seq = Sequence("audit_logs_id_seq")
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Monthly range partitions on timestamp (see audit_partitions.py), so the partition
+    # key is part of the primary key
+    id = Column(BigInteger, audit_logs_id_seq, server_default=audit_logs_id_seq.next_value(), primary_key=True)
     user_id = Column(Integer, nullable=True) 
     user_type = Column(String, default="System") 
     action = Column(String) 
     details = Column(Text, nullable=True)
     ip_address = Column(String)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True)
     organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=True)
 
+    __table_args__ = (
+        Index("ix_audit_logs_org_timestamp", "organization_id", "timestamp"),
+        Index("ix_audit_logs_user_timestamp", "user_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+# Rows outside every monthly partition land here instead of failing the insert
+event.listen(AuditLog.__table__, "after_create",
+             DDL("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"))
+
 # Add relationships to existing models
 # We need to monkey-patch or redefine them if we can't edit in-place easily, 
 # but here I am replacing the whole file content effectively by editing the class definitions if I could,
@@ -1,102 +1,271 @@
 import fitz  # PyMuPDF
 from google.cloud import vision
+from .credentials import credential_manager
 import io
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import BinaryIO, Callable, List, Optional, Tuple, Union
+
+# A document can be given as a filesystem path, raw bytes or a readable binary stream
+DocumentSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+# Local PDF text extraction is split across processes for large documents
+OCR_PARALLEL_MIN_PAGES = int(os.getenv("OCR_PARALLEL_MIN_PAGES", "64"))
+OCR_PDF_WORKERS = int(os.getenv("OCR_PDF_WORKERS", str(os.cpu_count() or 1)))
+
+# Scanned PDFs: pages per batch_annotate_images call (Vision allows 16), batches in
+# flight at once and the maximum number of pages OCR'd per document
+OCR_VISION_BATCH_SIZE = int(os.getenv("OCR_VISION_BATCH_SIZE", "16"))
+OCR_VISION_CONCURRENCY = int(os.getenv("OCR_VISION_CONCURRENCY", "4"))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "500"))
+
+_pdf_pool = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=OCR_PDF_WORKERS)
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=True)
+        _pdf_pool = None
+
+
+def _open_pdf(source):
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _extract_page_range(source, start: int, stop: int) -> List[str]:
+    # Runs in a worker process: each worker opens its own handle on the document
+    with _open_pdf(source) as doc:
+        return [doc.load_page(page_num).get_text() for page_num in range(start, stop)]
+
+
+def _extract_shared_page_range(shm_name: str, size: int, start: int, stop: int) -> List[str]:
+    """
+    Same as _extract_page_range for an in-memory PDF published once in shared memory:
+    workers map the parent's buffer instead of each receiving a pickled copy.
+    """
+    # Pool workers share the parent's resource tracker, which keeps the segment
+    # registered until the parent unlinks it (or cleans it up if the parent dies)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    view = shm.buf[:size]
+    try:
+        doc = fitz.open(stream=view, filetype="pdf")
+        try:
+            return [doc.load_page(page_num).get_text() for page_num in range(start, stop)]
+        finally:
+            doc.close()
+            del doc
+    finally:
+        view.release()
+        shm.close()
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    size = -(-page_count // parts)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
 
 class OCRService:
     def __init__(self):
         # Initialize Google Cloud Vision client
-        # Relies on GOOGLE_APPLICATION_CREDENTIALS env var or default auth
-        self.vision_client = vision.ImageAnnotatorClient()
+        # Relies on GOOGLE_APPLICATION_CREDENTIALS env var or default auth, shared with chat/embeddings
+        self.vision_client = vision.ImageAnnotatorClient(credentials=credential_manager.credentials)
+
+    def extract_text(self, source: DocumentSource, mime_type: str) -> str:
+        return "".join(self.extract_pages(source, mime_type))
 
-    def extract_text(self, file_path: str, mime_type: str) -> str:
+    def extract_pages(self, source: DocumentSource, mime_type: str,
+                      progress: Optional[Callable[[float], None]] = None) -> List[str]:
         """
-        Hybrid OCR extraction:
+        Hybrid OCR extraction (source may be a path, bytes or a binary stream):
         1. If PDF, try valid text extraction with PyMuPDF.
            If text length > 50 chars, return it (Cost Savings).
         2. If PDF (scanned) or Image, use Google Cloud Vision API.
+        Returns one string per page; "".join(pages) is the document text.
+        `progress` is called with the fraction of pages OCR'd as Vision batches complete.
         """
-        extracted_text = ""
+        extracted_pages = []
 
         try:
             if mime_type == "application/pdf":
-                extracted_text = self._extract_text_from_pdf_local(file_path)
+                source = self._read_source(source)
+                extracted_pages = self._extract_pages_from_pdf_local(source)
                 
                 # Threshold check: If we have enough text, avoid Cloud Vision
-                if len(extracted_text.strip()) > 50:
+                if len("".join(extracted_pages).strip()) > 50:
                     print("OCR: Successfully extracted text locally with PyMuPDF.")
-                    return extracted_text
+                    return extracted_pages
                 else:
                     print("OCR: PDF text content too low/empty. Falling back to Cloud Vision (Scanned PDF).")
 
             # Fallback or Image: Use Cloud Vision
             print(f"OCR: Using Google Cloud Vision for {mime_type}")
-            return self._extract_text_cloud_vision(file_path, mime_type)
+            return self._extract_pages_cloud_vision(source, mime_type, progress)
 
         except Exception as e:
             print(f"OCR Error: {e}")
             # Return partial text or empty string on failure, don't crash upload
-            return extracted_text
+            return extracted_pages
 
-    def _extract_text_from_pdf_local(self, file_path: str) -> str:
-        text = ""
+    @staticmethod
+    def _read_source(source: DocumentSource):
+        # Streams are read once; paths and in-memory buffers are passed through as-is
+        if hasattr(source, "read"):
+            return source.read()
+        return source
+
+    @staticmethod
+    def _open_pdf(source: DocumentSource):
+        return _open_pdf(source)
+
+    def _extract_pages_from_pdf_local(self, source: DocumentSource) -> List[str]:
+        """
+        Small PDFs are read serially. From OCR_PARALLEL_MIN_PAGES pages on, the page
+        list is split into contiguous ranges extracted in a process pool and joined
+        back in page order. In-memory documents are shared with the workers through
+        one shared-memory segment.
+        """
+        pages = []
         try:
-            with fitz.open(file_path) as doc:
-                for page in doc:
-                    text += page.get_text()
+            with self._open_pdf(source) as doc:
+                page_count = len(doc)
+                if page_count < OCR_PARALLEL_MIN_PAGES or OCR_PDF_WORKERS < 2:
+                    return [page.get_text() for page in doc]
+
+            pool = _get_pdf_pool()
+            ranges = _page_ranges(page_count, OCR_PDF_WORKERS)
+            if isinstance(source, str):
+                futures = [pool.submit(_extract_page_range, source, start, stop) for start, stop in ranges]
+                for future in futures:
+                    pages.extend(future.result())
+                return pages
+
+            # One copy of the buffer in shared memory (RAM, never a plaintext file)
+            # instead of one pickled copy per page range
+            buffer = memoryview(source).cast("B")
+            size = buffer.nbytes
+            shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            try:
+                shm.buf[:size] = buffer
+                futures = [pool.submit(_extract_shared_page_range, shm.name, size, start, stop)
+                           for start, stop in ranges]
+                for future in futures:
+                    pages.extend(future.result())
+            finally:
+                shm.close()
+                shm.unlink()
         except Exception as e:
             print(f"PyMuPDF Error: {e}")
-        return text
+        return pages
 
-    def _extract_text_cloud_vision(self, file_path: str, mime_type: str) -> str:
+    def _extract_pages_cloud_vision(self, source: DocumentSource, mime_type: str,
+                                    progress: Optional[Callable[[float], None]] = None) -> List[str]:
         try:
-            with open(file_path, "rb") as image_file:
-                content = image_file.read()
+            source = self._read_source(source)
 
             if mime_type == "application/pdf":
                 # Vision API for PDF/TIFF is async 'async_batch_annotate_files' usually,
                 # but for simplicity/speed on single page docs we might treat as image if converted?
                 # Actually, Vision API standard client supports images directly.
                 # For PDFs, it's more complex (requires GCS or async op).
-                # OPTIMIZATION: Convert first few pages of PDF to image locally with PyMuPDF and send to Vision?
+                # OPTIMIZATION: Convert PDF pages to images locally with PyMuPDF and send them to Vision in batches.
                 # This avoids GCS requirement. Let's do that for the "scanned pdf" fallback.
-                return self._ocr_pdf_as_images(file_path)
+                return self._ocr_pdf_pages_as_images(source, progress)
             else:
                 # Standard Image (JPG, PNG)
+                if isinstance(source, str):
+                    with open(source, "rb") as image_file:
+                        content = image_file.read()
+                else:
+                    content = bytes(source)
                 image = vision.Image(content=content)
                 response = self.vision_client.text_detection(image=image)
                 texts = response.text_annotations
                 
                 if texts:
-                    return texts[0].description
-                return ""
+                    return [texts[0].description]
+                return []
 
         except Exception as e:
             print(f"Cloud Vision Error: {e}")
-            return ""
+            return []
 
-    def _ocr_pdf_as_images(self, file_path: str) -> str:
+    def _annotate_batch(self, images: List[bytes]) -> List[str]:
+        """
+        OCRs a group of page images with a single batch_annotate_images call.
+        Failed pages (or a failed batch) come back as empty strings.
+        """
+        requests = [
+            vision.AnnotateImageRequest(
+                image=vision.Image(content=img_data),
+                features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+            )
+            for img_data in images
+        ]
+        try:
+            response = self.vision_client.batch_annotate_images(requests=requests)
+        except Exception as e:
+            print(f"Cloud Vision batch Error: {e}")
+            return [""] * len(images)
+
+        texts = []
+        for page_response in response.responses:
+            if page_response.error.message:
+                print(f"Cloud Vision page Error: {page_response.error.message}")
+            annotations = page_response.text_annotations
+            texts.append(annotations[0].description if annotations else "")
+        return texts
+
+    def _ocr_pdf_pages_as_images(self, source: DocumentSource,
+                                 progress: Optional[Callable[[float], None]] = None) -> List[str]:
         """
         Renders PDF pages to images and sends them to Cloud Vision.
         Avoids the complexity of Cloud Vision PDF GCS-async flow for simple uploads.
-        Limits to first 5 pages to save costs/time.
+        Pages go out in batch_annotate_images groups of OCR_VISION_BATCH_SIZE with up to
+        OCR_VISION_CONCURRENCY batches in flight, capped at OCR_MAX_PAGES per document.
         """
-        full_text = ""
+        page_texts = []
         try:
-            with fitz.open(file_path) as doc:
-                # Limit to first 5 pages for OCR to keep speed high and costs low
-                for page_num in range(min(5, len(doc))):
-                    page = doc.load_page(page_num)
-                    pix = page.get_pixmap()
-                    img_data = pix.tobytes("png")
-                    
-                    image = vision.Image(content=img_data)
-                    response = self.vision_client.text_detection(image=image)
-                    texts = response.text_annotations
-                    
-                    if texts:
-                        full_text += texts[0].description + "\n"
+            with self._open_pdf(source) as doc:
+                page_count = min(OCR_MAX_PAGES, len(doc))
+                if len(doc) > page_count:
+                    print(f"OCR: Page budget reached, OCR limited to {page_count} of {len(doc)} pages.")
+                page_texts = [""] * page_count
+
+                with ThreadPoolExecutor(max_workers=OCR_VISION_CONCURRENCY) as pool:
+                    in_flight = deque()
+                    for start in range(0, page_count, OCR_VISION_BATCH_SIZE):
+                        # Wait for the oldest batch before rendering more pages, bounding memory
+                        if len(in_flight) >= OCR_VISION_CONCURRENCY:
+                            done_start, future = in_flight.popleft()
+                            texts = future.result()
+                            page_texts[done_start:done_start + len(texts)] = texts
+                            if progress is not None:
+                                progress((done_start + len(texts)) / page_count)
+
+                        stop = min(start + OCR_VISION_BATCH_SIZE, page_count)
+                        # Rendering stays on this thread: a fitz document is not thread-safe
+                        images = [doc.load_page(page_num).get_pixmap().tobytes("png") for page_num in range(start, stop)]
+                        in_flight.append((start, pool.submit(self._annotate_batch, images)))
+
+                    while in_flight:
+                        done_start, future = in_flight.popleft()
+                        texts = future.result()
+                        page_texts[done_start:done_start + len(texts)] = texts
+                        if progress is not None:
+                            progress((done_start + len(texts)) / page_count)
         except Exception as e:
             print(f"PDF-to-Image OCR Error: {e}")
-        
-        return full_text
+
+        # Keep one entry per page (empty pages included) so page numbers stay aligned
+        return [text + "\n" if text else "" for text in page_texts]
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+# Cosine similarity a new question needs with a cached one to reuse its answer
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+
+
+def _normalize(vector: List[float]) -> Optional[np.ndarray]:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    if norm == 0:
+        return None
+    return array / norm
+
+
+class CachedResponse:
+    def __init__(self, scope: int, question: str, vector: np.ndarray, answer: str, latency_ms: float):
+        self.scope = scope
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.latency_ms = latency_ms
+        self.created_at = time.time()
+
+
+class ResponseCache:
+    """
+    In-process semantic cache of answers to standalone questions (see
+    conversation.is_standalone). Entries are scoped to a case (and so to its
+    organization) and matched by cosine similarity of the question embeddings: one
+    matrix-vector product per lookup over the scope's normalized vectors. Eviction is LRU across all scopes; entries also expire after
+    a TTL and are dropped whenever the documents of their case change.
+    Each worker process keeps its own cache.
+    """
+
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD, ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # entry id -> CachedResponse, least recently used first
+        self._by_scope = {}  # scope -> set of entry ids
+        self._matrices = {}  # scope -> (entry ids, stacked vectors), rebuilt after changes
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0, "saved_ms": 0.0}
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._matrices.pop(entry.scope, None)
+        ids = self._by_scope.get(entry.scope)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_scope[entry.scope]
+
+    def _matrix(self, scope: int):
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = list(self._by_scope.get(scope, ()))
+            vectors = np.stack([self._entries[entry_id].vector for entry_id in ids]) if ids else None
+            cached = self._matrices[scope] = (ids, vectors)
+        return cached
+
+    def lookup(self, scope: int, vector: List[float]) -> Optional[CachedResponse]:
+        query = _normalize(vector)
+        if query is None:
+            return None
+        now = time.time()
+        with self._lock:
+            expired = [entry_id for entry_id in self._by_scope.get(scope, ())
+                       if now - self._entries[entry_id].created_at > self.ttl]
+            for entry_id in expired:
+                self._remove(entry_id)
+
+            best = None
+            ids, vectors = self._matrix(scope)
+            if ids:
+                scores = vectors @ query
+                index = int(np.argmax(scores))
+                if scores[index] >= self.threshold:
+                    best = ids[index]
+            if best is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best)
+            entry = self._entries[best]
+            self._stats["hits"] += 1
+            self._stats["saved_ms"] += entry.latency_ms
+            return entry
+
+    def store(self, scope: int, question: str, vector: List[float], answer: str, latency_ms: float):
+        normalized = _normalize(vector)
+        if normalized is None:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedResponse(scope, question, normalized, answer, latency_ms)
+            self._by_scope.setdefault(scope, set()).add(entry_id)
+            self._matrices.pop(scope, None)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, scope: int):
+        with self._lock:
+            for entry_id in list(self._by_scope.get(scope, ())):
+                self._remove(entry_id)
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+response_cache = ResponseCache()
@@ -30,6 +30,8 @@ class Case(CaseBase):
     id: int
     created_at: datetime
     documents: List[Document] = []
+    # Set in summary listings, which omit `documents`
+    document_count: Optional[int] = None
 
 
     class Config:
@@ -47,6 +49,39 @@ class Message(MessageBase):
     id: int
     timestamp: datetime
     case_id: int
+    context_tokens: Optional[int] = None
+    retrieval_ms: Optional[float] = None
+    # True when the answer came from the semantic response cache
+    cached: bool = False
 
     class Config:
         from_attributes = True
+
+# Search Schemas
+class SearchResult(BaseModel):
+    document_id: int
+    filename: str
+    case_id: Optional[int]
+    score: float
+    chunk_id: Optional[int] = None
+    page_number: Optional[int] = None
+    content: Optional[str] = None
+    snippet: Optional[str] = None
+
+# Audit Schemas
+class AuditLogEntry(BaseModel):
+    id: int
+    timestamp: datetime
+    organization_id: Optional[int] = None
+    user_id: Optional[int] = None
+    user_type: Optional[str] = None
+    action: Optional[str] = None
+    details: Optional[str] = None
+    ip_address: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogEntry]
+    next_cursor: Optional[str] = None
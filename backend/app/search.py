@@ -0,0 +1,167 @@
+import os
+from typing import List, Optional
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from . import models
+
+# HNSW candidate list size; higher = better recall, slower queries (pgvector default is 40)
+SEARCH_DEFAULT_EF = int(os.getenv("SEARCH_DEFAULT_EF", "64"))
+# pgvector >= 0.8: keep scanning the index until enough rows pass the org/case filter
+SEARCH_ITERATIVE_SCAN = os.getenv("SEARCH_ITERATIVE_SCAN", "relaxed_order")
+
+
+def _tune_index_scan(db: Session, ef_search: Optional[int]):
+    # set_config(..., true) is SET LOCAL: it only lasts for the current transaction
+    db.execute(func.set_config("hnsw.ef_search", str(ef_search or SEARCH_DEFAULT_EF), True).select())
+    if SEARCH_ITERATIVE_SCAN:
+        db.execute(func.set_config("hnsw.iterative_scan", SEARCH_ITERATIVE_SCAN, True).select())
+
+
+def semantic_search(db: Session, query_vector: List[float], organization_id: Optional[int],
+                    case_id: Optional[int] = None, k: int = 10, ef_search: Optional[int] = None,
+                    target: str = "chunks") -> List[dict]:
+    """
+    Top-k cosine nearest neighbours over document chunks (default) or whole documents,
+    restricted to one organization (None = all, for SuperAdmin) and optionally one case.
+    Ordering by the `<=>` distance lets Postgres use the HNSW index.
+    """
+    _tune_index_scan(db, ef_search)
+
+    if target == "documents":
+        distance = models.Document.embedding.cosine_distance(query_vector).label("distance")
+        query = db.query(
+            models.Document.id.label("document_id"),
+            models.Document.filename,
+            models.Document.case_id,
+            distance,
+        ).join(models.Case, models.Document.case_id == models.Case.id).filter(
+            models.Document.embedding.isnot(None)
+        )
+    else:
+        distance = models.DocumentChunk.embedding.cosine_distance(query_vector).label("distance")
+        query = db.query(
+            models.DocumentChunk.id.label("chunk_id"),
+            models.DocumentChunk.document_id,
+            models.DocumentChunk.page_number,
+            models.DocumentChunk.start_offset,
+            models.DocumentChunk.end_offset,
+            models.DocumentChunk.content,
+            models.Document.filename,
+            models.Document.case_id,
+            distance,
+        ).join(models.Document, models.DocumentChunk.document_id == models.Document.id).join(
+            models.Case, models.Document.case_id == models.Case.id
+        ).filter(models.DocumentChunk.embedding.isnot(None))
+
+    if organization_id is not None:
+        query = query.filter(models.Case.organization_id == organization_id)
+    if case_id is not None:
+        query = query.filter(models.Document.case_id == case_id)
+
+    rows = query.order_by(distance).limit(k).all()
+    results = []
+    for row in rows:
+        result = dict(row._mapping)
+        result["score"] = 1 - result.pop("distance")
+        results.append(result)
+    return results
+
+
+# Full-text / hybrid search -------------------------------------------------------
+
+# Candidates taken from each ranking before fusion, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<b>, StopSel=</b>"
+
+
+def _scope_sql(organization_id: Optional[int], case_id: Optional[int]) -> str:
+    clauses = []
+    if organization_id is not None:
+        clauses.append("c.organization_id = :organization_id")
+    if case_id is not None:
+        clauses.append("d.case_id = :case_id")
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def keyword_search(db: Session, q: str, organization_id: Optional[int], case_id: Optional[int] = None,
+                   k: int = 10) -> List[dict]:
+    """
+    Postgres full-text search over Document.search_vector (GIN index), ranked with
+    ts_rank_cd. `q` uses websearch syntax, so quoted phrases such as "Ley 26.994" work.
+    Snippets come from ts_headline, computed only for the returned rows.
+    """
+    sql = text(f"""
+        WITH query AS (SELECT websearch_to_tsquery('spanish', :q) AS tsq),
+        ranked AS (
+            SELECT d.id AS document_id, ts_rank_cd(d.search_vector, query.tsq) AS score
+            FROM documents d
+            JOIN cases c ON d.case_id = c.id, query
+            WHERE d.search_vector @@ query.tsq{_scope_sql(organization_id, case_id)}
+            ORDER BY score DESC
+            LIMIT :k
+        )
+        SELECT r.document_id, d.filename, d.case_id, r.score,
+               ts_headline('spanish', d.extracted_text, query.tsq, :headline) AS snippet
+        FROM ranked r
+        JOIN documents d ON d.id = r.document_id, query
+        ORDER BY r.score DESC
+    """)
+    params = {"q": q, "k": k, "organization_id": organization_id, "case_id": case_id,
+              "headline": HEADLINE_OPTIONS}
+    return [dict(row._mapping) for row in db.execute(sql, params)]
+
+
+def hybrid_search(db: Session, q: str, query_vector: List[float], organization_id: Optional[int],
+                  case_id: Optional[int] = None, k: int = 10, ef_search: Optional[int] = None,
+                  candidates: int = HYBRID_CANDIDATES) -> List[dict]:
+    """
+    Reciprocal rank fusion of full-text rank and vector similarity in one SQL round trip.
+    The semantic side ranks documents by their best-matching chunk (HNSW scan), the
+    keyword side by ts_rank_cd; each contributes 1 / (RRF_K + rank) to the fused score.
+    """
+    _tune_index_scan(db, ef_search)
+    scope = _scope_sql(organization_id, case_id)
+    sql = text(f"""
+        WITH query AS (SELECT websearch_to_tsquery('spanish', :q) AS tsq),
+        nearest_chunks AS (
+            SELECT ch.document_id, ch.embedding <=> CAST(:query_vector AS vector) AS distance
+            FROM document_chunks ch
+            JOIN documents d ON ch.document_id = d.id
+            JOIN cases c ON d.case_id = c.id
+            WHERE ch.embedding IS NOT NULL{scope}
+            ORDER BY distance
+            LIMIT :candidates
+        ),
+        semantic AS (
+            SELECT document_id, RANK() OVER (ORDER BY MIN(distance)) AS rank
+            FROM nearest_chunks
+            GROUP BY document_id
+        ),
+        keyword AS (
+            SELECT d.id AS document_id,
+                   RANK() OVER (ORDER BY ts_rank_cd(d.search_vector, query.tsq) DESC) AS rank
+            FROM documents d
+            JOIN cases c ON d.case_id = c.id, query
+            WHERE d.search_vector @@ query.tsq{scope}
+            ORDER BY rank
+            LIMIT :candidates
+        ),
+        fused AS (
+            SELECT COALESCE(s.document_id, kw.document_id) AS document_id,
+                   COALESCE(1.0 / (:rrf_k + s.rank), 0) + COALESCE(1.0 / (:rrf_k + kw.rank), 0) AS score
+            FROM semantic s
+            FULL OUTER JOIN keyword kw ON s.document_id = kw.document_id
+            ORDER BY score DESC
+            LIMIT :k
+        )
+        SELECT f.document_id, d.filename, d.case_id, f.score,
+               ts_headline('spanish', d.extracted_text, query.tsq, :headline) AS snippet
+        FROM fused f
+        JOIN documents d ON d.id = f.document_id, query
+        ORDER BY f.score DESC
+    """)
+    params = {"q": q, "query_vector": str(list(query_vector)), "k": k, "candidates": candidates,
+              "rrf_k": RRF_K, "organization_id": organization_id, "case_id": case_id,
+              "headline": HEADLINE_OPTIONS}
+    return [dict(row._mapping) for row in db.execute(sql, params)]
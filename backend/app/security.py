@@ -1,28 +1,267 @@
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import base64
+import hashlib
+import hmac
 import os
+import struct
+import uuid
+from typing import BinaryIO, Iterable, Iterator, Optional
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+# Chunked encryption format (v1):
+#   header: MAGIC (4) | version (1) | chunk_size (4, big endian) | nonce_prefix (7)
+#   frames: AES-256-GCM(chunk) + 16 byte tag, one per chunk_size bytes of plaintext.
+# Frame nonces are nonce_prefix | counter (4) | last-frame flag (1), and the header is
+# authenticated as associated data, so reordering, truncation or header tampering
+# fail authentication. Files that do not start with MAGIC are legacy Fernet tokens.
+MAGIC = b"BINA"
+FORMAT_VERSION = 1
+HEADER_FORMAT = ">4sBI7s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = int(os.getenv("ENCRYPTION_CHUNK_SIZE", str(64 * 1024)))
+
+
+def _frame_nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", counter, 1 if last else 0)
+
+
+class StreamEncryptor:
+    """
+    Incremental encryptor for the chunked format: feed plaintext with `update()`
+    and call `finalize()` once; both return ciphertext bytes ready to be written.
+    Buffers at most one chunk of plaintext.
+    """
+
+    def __init__(self, aead: AESGCM, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.aead = aead
+        self.chunk_size = chunk_size
+        self.header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, chunk_size, os.urandom(7))
+        self._prefix = self.header[-7:]
+        self._counter = 0
+        self._buffer = bytearray()
+        self._header_sent = False
+        self.plaintext_size = 0
+
+    def _seal(self, chunk: bytes, last: bool) -> bytes:
+        frame = self.aead.encrypt(_frame_nonce(self._prefix, self._counter, last), chunk, self.header)
+        self._counter += 1
+        return frame
+
+    def update(self, data: bytes) -> bytes:
+        self.plaintext_size += len(data)
+        self._buffer += data
+        out = bytearray()
+        if not self._header_sent:
+            out += self.header
+            self._header_sent = True
+        # Keep the trailing chunk buffered: only finalize() knows it is the last frame
+        while len(self._buffer) > self.chunk_size:
+            out += self._seal(bytes(self._buffer[:self.chunk_size]), last=False)
+            del self._buffer[:self.chunk_size]
+        return bytes(out)
+
+    def finalize(self) -> bytes:
+        out = bytearray()
+        if not self._header_sent:
+            out += self.header
+            self._header_sent = True
+        out += self._seal(bytes(self._buffer), last=True)
+        self._buffer.clear()
+        return bytes(out)
+
+
+class EncryptedUpload:
+    """
+    Result of `SecureFileHandler.save_encrypted_upload`: where the ciphertext was
+    written, the SHA-256 of the plaintext and the plaintext buffer itself.
+    """
+
+    def __init__(self, file_path: str, sha256: str, content: bytearray, deduplicated: bool = False):
+        self.file_path = file_path
+        self.sha256 = sha256
+        self.content = content
+        # True when an identical blob was already stored and the new ciphertext was dropped
+        self.deduplicated = deduplicated
+
 
 class SecureFileHandler:
     def __init__(self):
         # In production, load this from environment variables!
         self.key = os.getenv("ENCRYPTION_KEY", Fernet.generate_key())
         self.cipher_suite = Fernet(self.key)
+        # Derive a separate AES-256 key for the chunked format from the Fernet key
+        self.aead = AESGCM(self._derive_key(b"bina-stream-v1"))
+        # ...and an HMAC key for blob names and content-cache keys, so that neither
+        # reveals the plaintext hash to anyone without the key
+        self.address_key = self._derive_key(b"bina-address-v1")
+        self.chunk_size = DEFAULT_CHUNK_SIZE
         self.upload_dir = "secure_uploads"
         os.makedirs(self.upload_dir, exist_ok=True)
 
+    def _derive_key(self, info: bytes) -> bytes:
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=info,
+        ).derive(base64.urlsafe_b64decode(self.key))
+
+    def encryptor(self) -> StreamEncryptor:
+        return StreamEncryptor(self.aead, self.chunk_size)
+
     async def save_encrypted_file(self, file: UploadFile) -> str:
-        contents = await file.read()
-        encrypted_contents = self.cipher_suite.encrypt(contents)
-        
-        file_path = os.path.join(self.upload_dir, f"{file.filename}.enc")
-        
-        with open(file_path, "wb") as f:
-            f.write(encrypted_contents)
-            
-        return file_path
+        upload = await self.save_encrypted_upload(file, keep_content=False)
+        return upload.file_path
 
-    def decrypt_file(self, file_path: str) -> bytes:
+    def blob_path(self, sha256: str) -> str:
+        # Keyed address: a known document's hash cannot be matched against file names
+        address = hmac.new(self.address_key, f"blob:{sha256}".encode(), hashlib.sha256).hexdigest()
+        return os.path.join(self.upload_dir, f"{address}.enc")
+
+    def content_key(self, sha256: str, organization_id: Optional[int]) -> str:
+        """
+        Per-organization key of a plaintext for the OCR/embedding cache and chunk reuse:
+        identical files uploaded by different organizations never share results.
+        """
+        return hmac.new(self.address_key, f"org:{organization_id}:{sha256}".encode(), hashlib.sha256).hexdigest()
+
+    async def save_encrypted_upload(self, file: UploadFile, keep_content: bool = True) -> EncryptedUpload:
+        """
+        Async entry point for uploads: hashing, sealing and disk writes are CPU and
+        blocking I/O, so the whole pass runs in the threadpool, not on the event loop.
+        """
+        return await run_in_threadpool(self.save_encrypted_stream, file.file, keep_content)
+
+    def save_encrypted_stream(self, src: BinaryIO, keep_content: bool = True) -> EncryptedUpload:
+        """
+        Single pass over the upload: each chunk is read once and the same bytes are
+        fed to the encryptor, a SHA-256 hasher and one plaintext buffer kept for OCR,
+        so the caller never has to decrypt the file it just wrote.
+
+        Blobs are content-addressed (`<HMAC of sha256>.enc`): the ciphertext is written to a
+        temporary name and then either moved into place or dropped when an identical
+        upload is already stored.
+        """
+        temp_path = os.path.join(self.upload_dir, f".{uuid.uuid4().hex}.part")
+        encryptor = self.encryptor()
+        hasher = hashlib.sha256()
+        content = bytearray()
+
+        try:
+            with open(temp_path, "wb") as f:
+                while True:
+                    chunk = src.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    f.write(encryptor.update(chunk))
+                    if keep_content:
+                        content += chunk
+                f.write(encryptor.finalize())
+
+            sha256 = hasher.hexdigest()
+            file_path = self.blob_path(sha256)
+            deduplicated = os.path.exists(file_path)
+            if deduplicated:
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return EncryptedUpload(file_path, sha256, content, deduplicated=deduplicated)
+
+    def encrypt_stream(self, chunks: Iterable[bytes], dst: BinaryIO) -> int:
+        """
+        Encrypts an iterable of plaintext chunks into `dst` using constant memory.
+        Returns the number of plaintext bytes written.
+        """
+        encryptor = self.encryptor()
+        for chunk in chunks:
+            dst.write(encryptor.update(chunk))
+        dst.write(encryptor.finalize())
+        return encryptor.plaintext_size
+
+    def _read_header(self, f: BinaryIO):
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+            return None
+        _, version, chunk_size, prefix = struct.unpack(HEADER_FORMAT, header)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported encryption format version {version}")
+        return header, chunk_size, prefix
+
+    def decrypt_stream(self, file_path: str) -> Iterator[bytes]:
+        """
+        Yields the plaintext of an encrypted file chunk by chunk.
+        Legacy whole-file Fernet tokens are decrypted in one piece.
+        """
         with open(file_path, "rb") as f:
-            encrypted_contents = f.read()
-            
-        return self.cipher_suite.decrypt(encrypted_contents)
+            parsed = self._read_header(f)
+            if parsed is None:
+                f.seek(0)
+                yield self.cipher_suite.decrypt(f.read())
+                return
+
+            header, chunk_size, prefix = parsed
+            frame_size = chunk_size + TAG_SIZE
+            counter = 0
+            frame = f.read(frame_size)
+            while True:
+                next_frame = f.read(frame_size)
+                last = not next_frame
+                yield self.aead.decrypt(_frame_nonce(prefix, counter, last), frame, header)
+                if last:
+                    return
+                frame = next_frame
+                counter += 1
+
+    def plaintext_size(self, file_path: str) -> int:
+        """
+        Size of the decrypted content. Computed from the ciphertext length for the
+        chunked format; legacy Fernet files have to be decrypted to find out.
+        """
+        with open(file_path, "rb") as f:
+            parsed = self._read_header(f)
+        if parsed is None:
+            return len(self.decrypt_file(file_path))
+        _, chunk_size, _ = parsed
+        body = os.path.getsize(file_path) - HEADER_SIZE
+        frame_size = chunk_size + TAG_SIZE
+        frames = max(1, -(-body // frame_size))
+        return body - frames * TAG_SIZE
+
+    def decrypt_range(self, file_path: str, start: int, end: int) -> Iterator[bytes]:
+        """
+        Yields plaintext bytes start..end (inclusive), decrypting only the frames
+        that overlap the range. Used to serve HTTP Range requests without a temp file.
+        """
+        with open(file_path, "rb") as f:
+            parsed = self._read_header(f)
+            if parsed is None:
+                f.seek(0)
+                yield self.cipher_suite.decrypt(f.read())[start:end + 1]
+                return
+            header, chunk_size, prefix = parsed
+            frame_size = chunk_size + TAG_SIZE
+            body = os.path.getsize(file_path) - HEADER_SIZE
+            last_index = max(1, -(-body // frame_size)) - 1
+
+            index = start // chunk_size
+            f.seek(HEADER_SIZE + index * frame_size)
+            while index <= last_index and index * chunk_size <= end:
+                frame = f.read(frame_size)
+                chunk = self.aead.decrypt(_frame_nonce(prefix, index, index == last_index), frame, header)
+                frame_start = index * chunk_size
+                yield chunk[max(start - frame_start, 0):end - frame_start + 1]
+                index += 1
+
+    def decrypt_file(self, file_path: str) -> bytes:
+        return b"".join(self.decrypt_stream(file_path))
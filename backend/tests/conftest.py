@@ -0,0 +1,40 @@
+from unittest.mock import MagicMock
+import pytest
+from sqlalchemy.dialects import postgresql
+
+# Query builder calls that return the same mock, so a whole chain can be inspected
+_CHAIN_METHODS = ("options", "join", "filter", "order_by", "limit")
+
+
+@pytest.fixture
+def query_db():
+    """
+    Factory for a mock Session whose db.query(...) chain always returns one query
+    mock ending in `.all()` -> rows. Returns (db, query).
+    """
+    def make(rows=()):
+        db = MagicMock()
+        query = db.query.return_value
+        for method in _CHAIN_METHODS:
+            getattr(query, method).return_value = query
+        query.all.return_value = list(rows)
+        return db, query
+    return make
+
+
+@pytest.fixture
+def compiled_filters():
+    # SQL of every .filter(...) criterion applied to a query mock, compiled for Postgres
+    def compile_filters(query):
+        return [str(call.args[0].compile(dialect=postgresql.dialect())) for call in query.filter.call_args_list]
+    return compile_filters
+
+
+@pytest.fixture
+def make_request():
+    # Mock Request with optional conditional-request headers
+    def make(if_none_match=None):
+        request = MagicMock()
+        request.headers = {"if-none-match": if_none_match} if if_none_match else {}
+        return request
+    return make
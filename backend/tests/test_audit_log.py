@@ -1,5 +1,8 @@
+import time
+import asyncio
 from unittest.mock import MagicMock
-from app.audit_logger import log_action
+from app import audit_logger
+from app.audit_logger import log_action, alog_action, AuditWriter
 from app.models import AuditLog
 
 def test_log_action_creates_entry():
@@ -26,6 +29,116 @@ def test_log_action_creates_entry():
     mock_db.commit.assert_called_once()
     mock_db.refresh.assert_called_once_with(log_entry)
 
+class _RecordingSession:
+    def __init__(self, batches, fail_times):
+        self.batches = batches
+        self.fail_times = fail_times
+
+    def execute(self, statement, rows):
+        if self.fail_times[0] > 0:
+            self.fail_times[0] -= 1
+            raise RuntimeError("db down")
+        self.batches.append(list(rows))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+def _writer(batches, batch_size=3, interval=60, fail_times=0):
+    failures = [fail_times]
+    return AuditWriter(batch_size=batch_size, interval=interval, max_queue=100,
+                       session_factory=lambda: _RecordingSession(batches, failures))
+
+def test_writer_bulk_inserts_by_batch_size_and_flushes_on_stop():
+    batches = []
+    writer = _writer(batches, batch_size=3)
+    writer.start()
+    for i in range(7):
+        assert writer.submit({"action": f"A{i}"})
+    writer.stop()
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [row["action"] for batch in batches for row in batch] == [f"A{i}" for i in range(7)]
+    assert writer.stats()["written"] == 7 and not writer.running
+
+def test_writer_retries_failed_flush(monkeypatch):
+    monkeypatch.setattr(audit_logger, "AUDIT_RETRY_BACKOFF", 0)
+    batches = []
+    writer = _writer(batches, batch_size=2, fail_times=1)
+    writer.start()
+    writer.submit({"action": "A"})
+    writer.submit({"action": "B"})
+    writer.stop()
+    assert batches == [[{"action": "A"}, {"action": "B"}]]
+    assert writer.stats()["failed_flushes"] == 1
+
+def test_submit_applies_backpressure_when_full():
+    writer = AuditWriter(max_queue=1, session_factory=MagicMock())
+    assert writer.submit({"action": "A"}, timeout=0.01)
+    # Not started: nothing drains the queue, so the second event is refused
+    assert not writer.submit({"action": "B"}, timeout=0.01)
+
+def test_log_action_queues_when_writer_running(monkeypatch):
+    batches = []
+    writer = _writer(batches)
+    monkeypatch.setattr(audit_logger, "audit_writer", writer)
+    writer.start()
+    mock_db = MagicMock()
+    mock_request = MagicMock()
+    mock_request.client.host = "10.0.0.1"
+
+    log_entry = log_action(mock_db, mock_request, "CONSULT", "Viewed case list", user_id=4)
+    writer.stop()
+
+    # Nothing on the request's session; the event reaches the DB through the writer
+    mock_db.add.assert_not_called()
+    mock_db.commit.assert_not_called()
+    assert log_entry.action == "CONSULT"
+    assert batches[0][0]["ip_address"] == "10.0.0.1"
+    assert batches[0][0]["timestamp"] is not None
+
+def test_writer_gives_up_on_a_batch_after_max_retries(monkeypatch):
+    monkeypatch.setattr(audit_logger, "AUDIT_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(audit_logger, "AUDIT_MAX_RETRIES", 3)
+    batches = []
+    writer = _writer(batches, batch_size=1, fail_times=3)
+    writer.start()
+    writer.submit({"action": "A"})
+    writer.submit({"action": "B"})
+    writer.stop()
+    # A was dropped after 3 attempts; the writer moved on and wrote B
+    assert batches == [[{"action": "B"}]]
+    assert writer.stats()["dropped"] == 1
+
+def test_stop_interrupts_retry_backoff(monkeypatch):
+    monkeypatch.setattr(audit_logger, "AUDIT_RETRY_BACKOFF", 60)
+    batches = []
+    writer = _writer(batches, batch_size=1, fail_times=10 ** 6)
+    writer.start()
+    writer.submit({"action": "A"})
+    time.sleep(0.1)
+    started = time.monotonic()
+    writer.stop(timeout=5)
+    assert time.monotonic() - started < 5
+    assert not writer.running
+    assert writer.stats()["dropped"] == 1
+
+def test_alog_action_never_waits_on_a_full_queue(monkeypatch):
+    # Registered as running but never draining: the queue stays full
+    writer = AuditWriter(max_queue=1, session_factory=MagicMock())
+    writer.submit({"action": "A"})
+    monkeypatch.setattr(writer.__class__, "running", property(lambda self: True))
+    monkeypatch.setattr(audit_logger, "audit_writer", writer)
+    mock_db = MagicMock()
+
+    started = time.monotonic()
+    log_entry = asyncio.run(alog_action(mock_db, MagicMock(), "SEARCH", "q"))
+    assert time.monotonic() - started < 1
+    mock_db.add.assert_called_once_with(log_entry)
+    mock_db.commit.assert_called_once()
+
 if __name__ == "__main__":
     try:
         test_log_action_creates_entry()
@@ -0,0 +1,122 @@
+from datetime import date, datetime, timezone
+from unittest.mock import MagicMock
+import pytest
+from app import audit_partitions
+from app.audit_query import encode_cursor, decode_cursor, export_csv, export_ndjson, query_audit_logs, AuditFilters
+from app.models import AuditLog
+
+def _entry(id, day):
+    return AuditLog(id=id, timestamp=datetime(2025, 3, day, 12, 0, tzinfo=timezone.utc), user_id=7,
+                    user_type="User", action="CONSULT", details="Viewed case list", ip_address="10.0.0.1",
+                    organization_id=2)
+
+def test_cursor_roundtrip_and_rejects_garbage():
+    entry = _entry(42, 5)
+    assert decode_cursor(encode_cursor(entry)) == (entry.timestamp, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_query_returns_next_cursor_only_when_more_rows():
+    rows = [_entry(3, 3), _entry(2, 2), _entry(1, 1)]
+    db = MagicMock()
+    query = db.query.return_value
+    query.filter.return_value = query
+    query.order_by.return_value.limit.return_value.all.return_value = rows
+
+    items, cursor = query_audit_logs(db, AuditFilters(user_id=7), limit=2)
+    assert items == rows[:2]
+    assert decode_cursor(cursor) == (rows[1].timestamp, 2)
+    query.order_by.return_value.limit.assert_called_with(3)
+
+    query.order_by.return_value.limit.return_value.all.return_value = rows[:1]
+    items, cursor = query_audit_logs(db, AuditFilters(user_id=7), cursor=cursor, limit=2)
+    assert cursor is None
+
+def test_exports():
+    entries = [_entry(1, 1), _entry(2, 2)]
+    csv_text = "".join(export_csv(iter(entries), rows_per_chunk=1))
+    lines = csv_text.strip().splitlines()
+    assert lines[0] == "id,timestamp,organization_id,user_id,user_type,action,details,ip_address"
+    assert len(lines) == 3
+    ndjson = list(export_ndjson(iter(entries)))
+    assert len(ndjson) == 2 and '"timestamp": "2025-03-01T12:00:00+00:00"' in ndjson[0]
+
+def test_partition_month_math():
+    assert audit_partitions.add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert audit_partitions.add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert audit_partitions.partition_name(date(2025, 3, 1)) == "audit_logs_2025_03"
+
+def test_detach_partitions_before(monkeypatch):
+    conn = MagicMock()
+    monkeypatch.setattr(audit_partitions, "list_partitions", lambda c: [
+        ("audit_logs_2025_01", date(2025, 1, 1)),
+        ("audit_logs_2025_02", date(2025, 2, 1)),
+        ("audit_logs_2025_03", date(2025, 3, 1)),
+    ])
+    detached = audit_partitions.detach_partitions_before(conn, date(2025, 3, 15))
+    assert detached == ["audit_logs_2025_01", "audit_logs_2025_02"]
+    statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+    assert statements == ["ALTER TABLE audit_logs DETACH PARTITION audit_logs_2025_01",
+                          "ALTER TABLE audit_logs DETACH PARTITION audit_logs_2025_02"]
+
+def _partition_conn(exists=False, stray=False):
+    conn = MagicMock()
+    def execute(statement, params=None):
+        sql = str(statement)
+        result = MagicMock()
+        if sql.startswith("SELECT to_regclass(:name)"):
+            result.scalar.return_value = "audit_logs_2025_03" if exists else None
+        elif sql.startswith("SELECT to_regclass('audit_logs_default')"):
+            result.scalar.return_value = "audit_logs_default"
+        elif sql.startswith("SELECT 1 FROM audit_logs_default"):
+            result.scalar.return_value = 1 if stray else None
+        return result
+    conn.execute.side_effect = execute
+    return conn
+
+def _statements(conn):
+    return [str(call.args[0]) for call in conn.execute.call_args_list]
+
+def test_create_partition_moves_rows_out_of_the_default_partition():
+    conn = _partition_conn(stray=True)
+    audit_partitions.create_partition(conn, date(2025, 3, 9))
+    statements = _statements(conn)
+    move = next(i for i, sql in enumerate(statements) if "DELETE FROM audit_logs_default" in sql)
+    create = next(i for i, sql in enumerate(statements) if sql.startswith("CREATE TABLE audit_logs_2025_03"))
+    reinsert = statements.index("INSERT INTO audit_logs SELECT * FROM audit_logs_move")
+    assert move < create < reinsert
+    assert "FROM ('2025-03-01 00:00:00+00') TO ('2025-04-01 00:00:00+00')" in statements[create]
+
+def test_create_partition_is_a_noop_when_it_exists():
+    conn = _partition_conn(exists=True)
+    audit_partitions.create_partition(conn, date(2025, 3, 1))
+    assert not any(sql.startswith("CREATE TABLE") for sql in _statements(conn))
+
+def test_maintenance_runs_each_partition_in_its_own_transaction(monkeypatch):
+    months = [date(2025, 3, 1), date(2025, 4, 1), date(2025, 5, 1)]
+    monkeypatch.setattr(audit_partitions, "upcoming_months", lambda: months)
+    created = []
+    def create(conn, month):
+        if month == months[0]:
+            raise RuntimeError("overlapping rows")
+        created.append(month)
+    monkeypatch.setattr(audit_partitions, "create_partition", create)
+    engine = MagicMock()
+
+    audit_partitions.maintain_partitions(engine)
+    # The failing month does not stop the following ones
+    assert created == months[1:]
+    assert engine.begin.call_count == 1 + len(months)
+
+def test_partition_maintainer_repeats_and_stops(monkeypatch):
+    import time
+    runs = []
+    monkeypatch.setattr(audit_partitions, "maintain_partitions", lambda engine: runs.append(engine))
+    maintainer = audit_partitions.PartitionMaintainer("engine", interval=0.01)
+    maintainer.start()
+    time.sleep(0.1)
+    maintainer.stop()
+    count = len(runs)
+    time.sleep(0.05)
+    assert count >= 2 and len(runs) == count
+
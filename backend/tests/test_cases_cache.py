@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+from fastapi import Response
+from sqlalchemy.dialects import postgresql
+from app.models import User, Case
+from app.main import get_cases, create_case
+from app.cases_cache import CasesCache, bump_cases_version, cases_cache
+from app import schemas
+
+def _cases(*ids):
+    return [Case(id=i, title=f"Caso {i}", created_at=datetime(2024, 1, 1, tzinfo=timezone.utc), documents=[]) for i in ids]
+
+ORG_ADMIN = User(id=2, role=1, email="partner@law.com", organization_id=1)
+
+def test_cache_misses_on_new_version():
+    cache = CasesCache(max_entries=2)
+    cache.put(1, "v", 3, "payload")
+    assert cache.get(1, "v", 3) == "payload"
+    assert cache.get(1, "v", 4) is None
+    assert cache.get(2, "v", 3) is None
+    assert cache.stats()["hits"] == 1
+
+def test_cache_evicts_least_recently_used():
+    cache = CasesCache(max_entries=2)
+    cache.put(1, "a", 0, "a")
+    cache.put(1, "b", 0, "b")
+    cache.get(1, "a", 0)
+    cache.put(1, "c", 0, "c")
+    assert cache.get(1, "b", 0) is None
+    assert cache.get(1, "a", 0) == "a"
+
+def test_bump_increments_organization_version(query_db):
+    mock_db, query = query_db()
+    bump_cases_version(mock_db, organization_id=7)
+    values = query.update.call_args.args[0]
+    assert str(list(values.values())[0].compile(dialect=postgresql.dialect())) == \
+        "organizations.cases_version + %(cases_version_1)s"
+
+def test_bump_without_organization_is_a_noop():
+    mock_db = MagicMock()
+    bump_cases_version(mock_db)
+    mock_db.query.assert_not_called()
+
+@patch("app.main.log_action")
+@patch("app.main.get_cases_version", return_value=5)
+def test_repeated_reads_are_served_from_cache(mock_version, mock_log, query_db, make_request):
+    cases_cache.clear()
+    mock_db, query = query_db(_cases(1, 2))
+    first = Response()
+    result = get_cases(make_request(), mock_db, ORG_ADMIN, response=first)
+    assert [case["id"] for case in result] == [1, 2]
+    assert first.headers["ETag"].startswith('W/"cases-1-5-')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    query.all.reset_mock()
+    second = Response()
+    assert get_cases(make_request(), mock_db, ORG_ADMIN, response=second) == result
+    assert second.headers["ETag"] == first.headers["ETag"]
+    query.all.assert_not_called()
+
+@patch("app.main.log_action")
+@patch("app.main.get_cases_version", return_value=5)
+def test_matching_etag_returns_304(mock_version, mock_log, query_db, make_request):
+    cases_cache.clear()
+    mock_db, query = query_db(_cases(1))
+    first = Response()
+    get_cases(make_request(), mock_db, ORG_ADMIN, response=first)
+    query.all.reset_mock()
+
+    result = get_cases(make_request(first.headers["ETag"]), mock_db, ORG_ADMIN, response=Response())
+    assert result.status_code == 304
+    query.all.assert_not_called()
+
+@patch("app.main.log_action")
+def test_version_bump_changes_etag(mock_log, query_db, make_request):
+    cases_cache.clear()
+    etags = []
+    for version in (5, 6):
+        mock_db, _ = query_db(_cases(1))
+        response = Response()
+        with patch("app.main.get_cases_version", return_value=version):
+            get_cases(make_request(), mock_db, ORG_ADMIN, response=response)
+        etags.append(response.headers["ETag"])
+    assert etags[0] != etags[1]
+
+@patch("app.main.log_action")
+@patch("app.main.bump_cases_version")
+def test_create_case_bumps_version(mock_bump, mock_log):
+    mock_db = MagicMock()
+    create_case(MagicMock(), schemas.CaseCreate(title="Nuevo"), mock_db, ORG_ADMIN)
+    mock_bump.assert_called_once_with(mock_db, organization_id=1)
@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import Response
+from app.models import Message, User
+from app.main import get_chat_history
+
+@pytest.fixture
+def history_db(query_db):
+    # Aggregate (max id, count) for the ETag, and a case of the caller's organization
+    def make(rows=(), max_id=None, count=0):
+        mock_db, query = query_db(rows)
+        query.one.return_value = (max_id, count)
+        query.first.return_value = MagicMock(id=1, organization_id=1)
+        return mock_db, query
+    return make
+
+USER = User(id=2, role=1, email="partner@law.com", organization_id=1)
+
+def _messages(*ids):
+    return [Message(id=i, case_id=1, sender="user", content=f"m{i}") for i in ids]
+
+@patch("app.main.log_action")
+def test_full_history_sets_etag(mock_log, history_db, make_request):
+    mock_db, query = history_db(_messages(1, 2, 3), max_id=3, count=3)
+    response = Response()
+    result = get_chat_history(1, make_request(), mock_db, USER, response)
+    assert [m.id for m in result] == [1, 2, 3]
+    assert response.headers["ETag"].startswith('W/"chat-1-3-3-')
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    query.limit.assert_not_called()
+
+@patch("app.main.log_action")
+def test_matching_etag_returns_304_without_loading(mock_log, history_db, make_request):
+    mock_db, query = history_db(max_id=3, count=3)
+    first = Response()
+    get_chat_history(1, make_request(), mock_db, USER, first)
+    query.all.reset_mock()
+
+    result = get_chat_history(1, make_request(first.headers["ETag"]), mock_db, USER, Response())
+    assert result.status_code == 304
+    query.all.assert_not_called()
+
+@patch("app.main.log_action")
+def test_etag_changes_with_new_messages_and_params(mock_log, history_db, make_request):
+    etags = []
+    for max_id, since_id in ((3, None), (4, None), (4, 2)):
+        mock_db, _ = history_db(max_id=max_id, count=max_id)
+        response = Response()
+        get_chat_history(1, make_request(), mock_db, USER, response, since_id=since_id)
+        etags.append(response.headers["ETag"])
+    assert len(set(etags)) == 3
+
+@patch("app.main.log_action")
+def test_page_from_newest_is_returned_oldest_first(mock_log, history_db, make_request):
+    # limit=2 fetches 3 rows newest first: more older messages exist
+    mock_db, query = history_db(_messages(9, 8, 7), max_id=9, count=9)
+    response = Response()
+    result = get_chat_history(1, make_request(), mock_db, USER, response, before_id=10, limit=2)
+    assert [m.id for m in result] == [8, 9]
+    assert response.headers["X-Prev-Before-Id"] == "8"
+    query.limit.assert_called_with(3)
+
+@patch("app.main.log_action")
+def test_last_page_has_no_prev_cursor(mock_log, history_db, make_request):
+    mock_db, _ = history_db(_messages(2, 1), max_id=2, count=2)
+    response = Response()
+    result = get_chat_history(1, make_request(), mock_db, USER, response, limit=5)
+    assert [m.id for m in result] == [1, 2]
+    assert "X-Prev-Before-Id" not in response.headers
+
+@patch("app.main.log_action")
+def test_since_id_returns_delta_in_order(mock_log, history_db, make_request):
+    mock_db, query = history_db(_messages(4, 5), max_id=5, count=5)
+    result = get_chat_history(1, make_request(), mock_db, USER, Response(), since_id=3)
+    assert [m.id for m in result] == [4, 5]
+    filters = [str(call.args[0]) for call in query.filter.call_args_list]
+    assert "messages.id > :id_1" in filters
@@ -0,0 +1,27 @@
+import pytest
+from app.chunking import chunk_pages, count_tokens
+
+def test_chunks_overlap_and_cover_text():
+    words = [f"palabra{i}" for i in range(25)]
+    pages = [" ".join(words[:10]) + "\n", " ".join(words[10:]) + "\n"]
+    text = "".join(pages)
+
+    chunks = chunk_pages(pages, max_tokens=10, overlap=3)
+
+    assert [c.token_count for c in chunks] == [10, 10, 10, 4]
+    for chunk in chunks:
+        assert text[chunk.start_offset:chunk.end_offset] == chunk.text
+    # Consecutive windows share `overlap` tokens
+    assert chunks[1].text.split()[:3] == chunks[0].text.split()[-3:]
+    assert chunks[-1].text.split()[-1] == "palabra24"
+    assert [c.page_number for c in chunks] == [1, 1, 2, 2]
+
+def test_punctuation_counts_as_tokens():
+    assert count_tokens("Art. 14, inc. b)") == 8
+
+def test_empty_document_has_no_chunks():
+    assert chunk_pages(["", ""]) == []
+
+def test_overlap_must_be_smaller_than_window():
+    with pytest.raises(ValueError):
+        chunk_pages(["texto"], max_tokens=5, overlap=5)
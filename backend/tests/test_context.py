@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock, patch
+from app.context import pack_context, build_prompt, retrieve_context, PackedContext
+from app.chunking import count_tokens
+
+def _passage(chunk_id, score, content, document_id=1, start=0, end=None, page=1):
+    return {
+        "chunk_id": chunk_id, "document_id": document_id, "filename": f"doc{document_id}.pdf",
+        "page_number": page, "start_offset": start, "end_offset": end if end is not None else start + len(content),
+        "content": content, "score": score,
+    }
+
+def test_pack_context_orders_by_score_and_respects_budget():
+    passages = [
+        _passage(1, 0.5, "segundo extracto", document_id=1),
+        _passage(2, 0.9, "primer extracto", document_id=2),
+        _passage(3, 0.7, "palabra " * 500, document_id=3),
+    ]
+    context = pack_context(passages, max_tokens=50, min_score=0.0)
+
+    # The long passage does not fit, the smaller lower-ranked one still does
+    assert [p["chunk_id"] for p in context.passages] == [2, 1]
+    assert context.tokens == count_tokens(context.text)
+    assert context.tokens <= 50
+    assert context.text.index("primer extracto") < context.text.index("segundo extracto")
+
+def test_pack_context_deduplicates():
+    passages = [
+        _passage(1, 0.9, "el contrato vence en marzo", document_id=1, start=0),
+        # Same text in a re-uploaded copy of the document
+        _passage(2, 0.8, "El  contrato vence en marzo", document_id=2, start=0),
+        # Overlapping chunk of the first document
+        _passage(3, 0.7, "vence en marzo de 2024", document_id=1, start=12, end=34),
+        _passage(4, 0.1, "irrelevante", document_id=4),
+    ]
+    context = pack_context(passages, max_tokens=1000, min_score=0.3)
+    assert [p["chunk_id"] for p in context.passages] == [1]
+
+def test_build_prompt():
+    assert build_prompt("¿Hola?", None) == "¿Hola?"
+    context = PackedContext("[doc1.pdf, p. 2]\ntexto", [], 5)
+    prompt = build_prompt("¿Cuándo vence?", context)
+    assert "[doc1.pdf, p. 2]" in prompt
+    assert prompt.endswith("Pregunta: ¿Cuándo vence?")
+
+@patch("app.context.search.semantic_search", return_value=[])
+def test_retrieve_context_is_scoped_to_the_organization(mock_search):
+    db = MagicMock()
+    retrieve_context(db, [0.1], 7, 3)
+    assert mock_search.call_args.args[2] == 3
+    assert mock_search.call_args.kwargs["case_id"] == 7
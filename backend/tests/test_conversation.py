@@ -0,0 +1,61 @@
+import asyncio
+from unittest.mock import MagicMock
+from app import conversation
+
+def _msg(id, sender, content):
+    msg = MagicMock()
+    msg.id, msg.sender, msg.content = id, sender, content
+    return msg
+
+def test_build_contents_maps_roles_and_appends_prompt():
+    history = [_msg(1, "user", "hola"), _msg(2, "ai", "buenas")]
+    contents = conversation.build_contents(history, "¿y el plazo?")
+    assert [c["role"] for c in contents] == ["user", "model", "user"]
+    assert contents[-1]["parts"][0]["text"] == "¿y el plazo?"
+
+def test_standalone_questions_are_cacheable():
+    assert conversation.is_standalone("¿Cuál es el plazo de apelación de la sentencia?")
+    assert conversation.is_standalone("¿Quién firmó el contrato de arrendamiento?")
+
+def test_follow_up_questions_are_not_cacheable():
+    assert not conversation.is_standalone("¿y el plazo?")
+    assert not conversation.is_standalone("¿Por qué?")
+    assert not conversation.is_standalone("Pero, ¿quién lo firmó?")
+    assert not conversation.is_standalone("¿Qué significa eso para el cliente?")
+    assert not conversation.is_standalone("Explica mejor lo que dijiste sobre la multa")
+
+def test_summary_instruction():
+    assert conversation.summary_instruction(None) is None
+    assert "acuerdo firmado" in conversation.summary_instruction("acuerdo firmado")["parts"][0]["text"]
+
+class _FakeGemini:
+    def __init__(self, text):
+        self.text = text
+        self.payloads = []
+
+    async def generate_content(self, payload):
+        self.payloads.append(payload)
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"text": self.text}]}}]}
+        return response
+
+def test_refresh_summary_folds_pending_messages(monkeypatch):
+    saved = []
+    pending = ("resumen previo", [(5, "user", "pregunta"), (6, "ai", "respuesta")])
+    monkeypatch.setattr(conversation, "_pending_messages", lambda case_id: pending)
+    monkeypatch.setattr(conversation, "_save_summary", lambda *args: saved.append(args))
+    gemini = _FakeGemini("resumen nuevo")
+
+    asyncio.run(conversation.refresh_summary(3, gemini))
+
+    prompt = gemini.payloads[0]["contents"][0]["parts"][0]["text"]
+    assert "resumen previo" in prompt and "Usuario: pregunta" in prompt and "Asistente: respuesta" in prompt
+    assert saved == [(3, "resumen nuevo", 6, 2)]
+    assert 3 not in conversation._refreshing
+
+def test_refresh_summary_skips_when_not_due(monkeypatch):
+    monkeypatch.setattr(conversation, "_pending_messages", lambda case_id: None)
+    gemini = _FakeGemini("x")
+    asyncio.run(conversation.refresh_summary(3, gemini))
+    assert gemini.payloads == []
@@ -0,0 +1,44 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from app.credentials import CredentialManager
+
+class _FakeCredentials:
+    def __init__(self, lifetime):
+        self.token = None
+        self.expiry = None
+        self.lifetime = lifetime
+        self.refreshes = 0
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.utcnow() + self.lifetime
+
+def _manager(lifetime=timedelta(hours=1), margin=300):
+    manager = CredentialManager(refresh_margin=margin)
+    manager._credentials = _FakeCredentials(lifetime)
+    return manager
+
+def test_token_is_cached_until_close_to_expiry():
+    manager = _manager()
+    assert manager.get_token() == "token-1"
+    assert manager.get_token() == "token-1"
+    assert manager.refresh_count == 1
+
+    # Inside the refresh margin the token is renewed
+    manager._credentials.expiry = datetime.utcnow() + timedelta(seconds=60)
+    assert manager.get_token() == "token-2"
+
+def test_concurrent_callers_share_one_refresh():
+    manager = _manager()
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["token-1"] * 10
+    assert manager._credentials.refreshes == 1
@@ -0,0 +1,19 @@
+import pytest
+from fastapi import HTTPException
+from app.main import _parse_range
+
+def test_parse_range_variants():
+    assert _parse_range(None, 100) is None
+    assert _parse_range("bytes=0-9", 100) == (0, 9)
+    assert _parse_range("bytes=90-", 100) == (90, 99)
+    assert _parse_range("bytes=-10", 100) == (90, 99)
+    assert _parse_range("bytes=50-500", 100) == (50, 99)
+    # Multi-range and malformed headers fall back to a full response
+    assert _parse_range("bytes=0-1,5-6", 100) is None
+    assert _parse_range("bytes=abc", 100) is None
+
+def test_parse_range_unsatisfiable():
+    with pytest.raises(HTTPException) as exc:
+        _parse_range("bytes=100-", 100)
+    assert exc.value.status_code == 416
+    assert exc.value.headers["Content-Range"] == "bytes */100"
@@ -0,0 +1,143 @@
+import asyncio
+import httpx
+from app import embeddings
+from app.embeddings import EmbeddingService, VertexEmbeddingBackend
+from app.local_embeddings import LocalHashingEmbedder
+
+def _handler(calls):
+    def handle(request):
+        import json
+        instances = json.loads(request.content)["instances"]
+        calls.append(len(instances))
+        if any(instance["content"] == "bad" for instance in instances):
+            return httpx.Response(400, json={"error": "invalid instance"})
+        return httpx.Response(200, json={"predictions": [
+            {"embeddings": {"values": [float(len(instance["content"]))]}} for instance in instances
+        ]})
+    return handle
+
+def _service(monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_BATCH_SIZE", 3)
+    backend = VertexEmbeddingBackend("test-project")
+    backend.api_endpoint = "https://vertex.test/predict"
+    backend._get_access_token = lambda: "token"
+
+    async def _aget_access_token():
+        return "token"
+    backend._aget_access_token = _aget_access_token
+    return EmbeddingService(backend)
+
+def test_get_embeddings_batches_and_keeps_order(monkeypatch):
+    calls = []
+    client = httpx.Client(transport=httpx.MockTransport(_handler(calls)))
+    monkeypatch.setattr(embeddings, "_get_http_client", lambda: client)
+    service = _service(monkeypatch)
+
+    texts = ["a" * n for n in range(1, 8)]
+    result = service.get_embeddings(texts)
+
+    assert result.ok
+    assert result.vectors == [[float(n)] for n in range(1, 8)]
+    assert sorted(calls) == [1, 3, 3]
+
+def test_failed_item_does_not_fail_the_batch(monkeypatch):
+    calls = []
+    client = httpx.Client(transport=httpx.MockTransport(_handler(calls)))
+    monkeypatch.setattr(embeddings, "_get_http_client", lambda: client)
+    service = _service(monkeypatch)
+
+    result = service.get_embeddings(["aa", "bad", "aaaa"])
+
+    assert list(result.errors) == [1]
+    assert result.vectors[0] == [2.0] and result.vectors[1] is None and result.vectors[2] == [4.0]
+
+def test_aget_embeddings_uses_given_client(monkeypatch):
+    calls = []
+    service = _service(monkeypatch)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_handler(calls))) as client:
+            return await service.aget_embeddings(["a", "bb", "bad", "cccc", "d"], client=client)
+
+    result = asyncio.run(run())
+    assert list(result.errors) == [2]
+    assert result.vectors == [[1.0], [2.0], None, [4.0], [1.0]]
+
+def test_aget_embeddings_reuses_shared_client(monkeypatch):
+    calls = []
+    service = _service(monkeypatch)
+    created = []
+    real_client = httpx.AsyncClient
+    def factory(**kwargs):
+        created.append(kwargs)
+        return real_client(transport=httpx.MockTransport(_handler(calls)))
+    monkeypatch.setattr(embeddings.httpx, "AsyncClient", factory)
+
+    async def run():
+        first = await service.get_embedding_async("aa")
+        second = await service.get_embedding_async("aaa")
+        await embeddings.aclose_http_client()
+        return first, second
+
+    assert asyncio.run(run()) == ([2.0], [3.0])
+    # One pooled client for both calls
+    assert len(created) == 1
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+def test_local_backend_is_deterministic_and_normalized():
+    service = EmbeddingService(LocalHashingEmbedder())
+    result = service.get_embeddings(["El plazo de apelación es de cinco días", "El plazo de apelación es de cinco días"])
+
+    assert result.ok
+    first, second = result.vectors
+    assert len(first) == 768
+    assert first == second
+    assert abs(_cosine(first, first) - 1.0) < 1e-5
+
+def test_local_backend_ranks_related_text_higher():
+    service = EmbeddingService(LocalHashingEmbedder())
+    query, related, unrelated = service.get_embeddings([
+        "¿cuál es el plazo de apelación?",
+        "El plazo para apelar la sentencia vence a los cinco días.",
+        "Inventario de bienes muebles del inmueble de la calle Corrientes.",
+    ]).vectors
+    assert _cosine(query, related) > _cosine(query, unrelated)
+
+def test_local_backend_reports_empty_items():
+    result = EmbeddingService(LocalHashingEmbedder()).get_embeddings(["contrato", "", "de la"])
+    assert result.vectors[0] is not None
+    assert result.vectors[1] is None and result.vectors[2] is None
+    assert sorted(result.errors) == [1, 2]
+
+def test_auto_backend_selection(monkeypatch):
+    monkeypatch.setattr(embeddings, "PROJECT_ID", None)
+    assert embeddings.create_backend("auto").name == "local"
+    monkeypatch.setattr(embeddings, "PROJECT_ID", "p")
+    assert embeddings.create_backend("auto").name == "vertex"
+
+def test_backend_interface_is_abstract():
+    import pytest
+    from app.embeddings import EmbeddingBackend
+    with pytest.raises(TypeError):
+        EmbeddingBackend()
+
+def test_model_id_distinguishes_backends():
+    assert VertexEmbeddingBackend("p").model_id == "vertex/text-embedding-004"
+    assert LocalHashingEmbedder().model_id.startswith("local/")
+
+def test_content_cache_is_keyed_by_embedding_model():
+    from unittest.mock import MagicMock
+    from sqlalchemy.dialects import postgresql
+    from app import content_cache
+
+    db = MagicMock()
+    content_cache.lookup(db, "key", "local/768")
+    filters = [str(arg.compile(dialect=postgresql.dialect())) for arg in db.query.return_value.filter.call_args.args]
+    assert "content_cache.embedding_model = %(embedding_model_1)s" in filters
+
+    content_cache.store(db, "key", "texto", [0.0] * 768, "vertex/text-embedding-004")
+    sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (content_hash) DO UPDATE" in sql
+    assert "IS DISTINCT FROM excluded.embedding_model" in sql
@@ -0,0 +1,83 @@
+import asyncio
+import httpx
+from app import gemini
+from app.gemini import GeminiClient
+
+class _FakeCredentials:
+    async def aget_token(self):
+        return "token"
+
+def _client(monkeypatch, handler, max_retries=2):
+    monkeypatch.setattr(gemini, "credential_manager", _FakeCredentials())
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return GeminiClient(http, model="test-model", max_retries=max_retries, retry_backoff=0)
+
+def test_generate_content_retries_retryable_status(monkeypatch):
+    statuses = [503, 429, 200]
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        assert request.headers["Authorization"] == "Bearer token"
+        return httpx.Response(statuses[len(seen) - 1], json={"candidates": []})
+
+    client = _client(monkeypatch, handler)
+    response = asyncio.run(client.generate_content({"contents": []}))
+
+    assert response.status_code == 200
+    assert seen == ["/v1beta/models/test-model:generateContent"] * 3
+
+def test_generate_content_gives_up_after_max_retries(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(500, json={})
+
+    client = _client(monkeypatch, handler, max_retries=1)
+    response = asyncio.run(client.generate_content({"contents": []}))
+
+    assert response.status_code == 500
+    assert len(calls) == 2
+
+def test_client_errors_are_not_retried(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(400, json={})
+
+    client = _client(monkeypatch, handler)
+    assert asyncio.run(client.generate_content({})).status_code == 400
+    assert len(calls) == 1
+
+def test_stream_generate_content_yields_text_deltas(monkeypatch):
+    body = (
+        'data: {"candidates": [{"content": {"parts": [{"text": "El plazo "}]}}]}\r\n\r\n'
+        'data: {"candidates": [{"content": {"parts": [{"text": "es de 5 días."}]}}]}\r\n\r\n'
+    )
+
+    def handler(request):
+        assert request.url.params["alt"] == "sse"
+        assert request.url.path.endswith(":streamGenerateContent")
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    client = _client(monkeypatch, handler)
+
+    async def collect():
+        return [delta async for delta in client.stream_generate_content({"contents": []})]
+
+    assert asyncio.run(collect()) == ["El plazo ", "es de 5 días."]
+
+def test_stream_generate_content_raises_on_client_error(monkeypatch):
+    import pytest
+    from app.gemini import GeminiError
+
+    client = _client(monkeypatch, lambda request: httpx.Response(403, text="denied"))
+
+    async def collect():
+        return [delta async for delta in client.stream_generate_content({})]
+
+    with pytest.raises(GeminiError) as exc:
+        asyncio.run(collect())
+    assert exc.value.status_code == 403
@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from passlib.context import CryptContext
+from app import auth
+from app.hashing import PasswordHasher, HashingQueueFull
+
+def test_hash_and_verify_in_pool():
+    hasher = PasswordHasher(workers=2, max_pending=4, executor_kind="process")
+    try:
+        async def run():
+            hashed = await hasher.hash("secreto")
+            return await hasher.verify("secreto", hashed), await hasher.verify("otro", hashed)
+        (valid, new_hash), (invalid, _) = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert valid and new_hash is None
+    assert not invalid
+    stats = hasher.stats()
+    assert stats["completed"] == 3 and stats["pending"] == 0 and stats["avg_ms"] > 0
+
+def test_outdated_hash_is_upgraded(monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secreto")
+    hasher = PasswordHasher(workers=1, executor_kind="thread")
+    valid, new_hash = asyncio.run(hasher.verify("secreto", old_hash))
+    assert valid
+    assert new_hash and auth.pwd_context.verify("secreto", new_hash)
+    assert f"$2b${auth.BCRYPT_ROUNDS:02d}$" in new_hash
+    assert hasher.stats()["rehashed"] == 1
+
+def test_rejects_fast_beyond_pending_limit():
+    hasher = PasswordHasher(workers=1, max_pending=1, executor_kind="thread")
+
+    async def run():
+        first = asyncio.ensure_future(hasher.hash("uno"))
+        await asyncio.sleep(0)
+        with pytest.raises(HashingQueueFull):
+            await hasher.hash("dos")
+        await first
+
+    asyncio.run(run())
+    assert hasher.stats()["rejected"] == 1
@@ -0,0 +1,134 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from fastapi import HTTPException
+from app import ingestion
+from app.embeddings import EmbeddingBatchResult
+from app.jobs import Job, JobManager, JobQueueFull, job_manager
+from app.main import get_job_status
+from app.models import User
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_job_reports_stage_progress():
+    manager = JobManager(max_workers=2, executor="thread")
+
+    def pipeline(job):
+        job.start_stage("ocr")
+        job.finish_stage("ocr")
+        job.start_stage("embedding")
+        job.finish_stage("embedding")
+        job.complete(ocr_chars=10)
+
+    job = manager.submit(Job(["ocr", "embedding"], document_id=1), pipeline)
+    _wait(job)
+    manager.shutdown()
+
+    status = manager.get(job.id).to_dict()
+    assert status["status"] == "completed"
+    assert status["progress"] == 1.0
+    assert status["stages"]["ocr"]["status"] == "done"
+    assert status["result"]["ocr_chars"] == 10
+
+def test_job_failure_is_recorded():
+    manager = JobManager(max_workers=1, executor="thread")
+
+    def pipeline(job):
+        job.start_stage("ocr")
+        raise RuntimeError("vision down")
+
+    job = manager.submit(Job(["ocr"]), pipeline)
+    _wait(job)
+    manager.shutdown()
+
+    assert job.status == "failed"
+    assert job.error == "vision down"
+    assert job.stages["ocr"]["status"] == "failed"
+
+def test_submit_rejects_when_queue_is_full():
+    manager = JobManager(max_workers=1, executor="thread", max_pending=1)
+    release = []
+
+    def pipeline(job):
+        while not release:
+            time.sleep(0.01)
+        job.complete()
+
+    manager.submit(Job(["ocr"]), pipeline)
+    with pytest.raises(JobQueueFull):
+        manager.submit(Job(["ocr"]), pipeline)
+    release.append(True)
+    manager.shutdown()
+
+def test_reserve_bounds_buffered_bytes():
+    manager = JobManager(max_workers=1, executor="thread", max_pending=10, max_pending_bytes=100)
+    first = manager.reserve(80)
+    with pytest.raises(JobQueueFull):
+        manager.reserve(30)
+    first.resize(10)
+    second = manager.reserve(30)
+    assert manager.pending_bytes() == 40
+    first.release()
+    second.release()
+    second.release()  # idempotent
+    assert manager.pending_count() == 0 and manager.pending_bytes() == 0
+
+def test_oversized_upload_is_admitted_when_queue_is_empty():
+    manager = JobManager(max_workers=1, executor="thread", max_pending_bytes=100)
+    reservation = manager.reserve(500)
+    assert manager.pending_bytes() == 500
+    reservation.release()
+
+def test_submitted_job_releases_its_reservation():
+    manager = JobManager(max_workers=1, executor="thread", max_pending=1)
+    reservation = manager.reserve(50)
+    # The reserved slot is the only one: nothing else gets in
+    with pytest.raises(JobQueueFull):
+        manager.submit(Job(["ocr"]), lambda job: job.complete())
+
+    job = manager.submit(Job(["ocr"]), lambda job: job.complete(), reservation=reservation)
+    _wait(job)
+    manager.shutdown()
+    assert reservation.attached and reservation.released
+    assert manager.pending_count() == 0 and manager.pending_bytes() == 0
+
+def test_embedding_stage_progress_advances_per_batch(monkeypatch):
+    monkeypatch.setattr(ingestion, "INGEST_EMBED_BATCH", 2)
+    service = MagicMock()
+    service.get_embeddings.side_effect = lambda texts: EmbeddingBatchResult(
+        [None if text == "bad" else [1.0] for text in texts],
+        {index: "rejected" for index, text in enumerate(texts) if text == "bad"},
+    )
+    job = Job(["embedding"])
+    seen = []
+    monkeypatch.setattr(job, "update_stage", lambda name, progress: seen.append((name, progress)))
+
+    result = ingestion._embed_with_progress(job, service, ["a", "b", "c", "bad", "e"])
+    assert seen == [("embedding", 0.4), ("embedding", 0.8), ("embedding", 1.0)]
+    assert result.vectors == [[1.0], [1.0], [1.0], None, [1.0]]
+    assert result.errors == {3: "rejected"}
+
+@pytest.fixture
+def owned_job():
+    job = Job(["ocr"], document_id=1, filename="a.pdf", organization_id=1, user_id=2)
+    job_manager._jobs[job.id] = job
+    yield job
+    job_manager._jobs.pop(job.id, None)
+
+def test_job_status_is_visible_to_its_uploader_and_super_admins(owned_job):
+    uploader = User(id=2, role=2, email="lawyer@law.com", organization_id=1)
+    admin = User(id=9, role=0, email="root@bina.com", organization_id=None)
+    assert get_job_status(owned_job.id, uploader)["filename"] == "a.pdf"
+    assert get_job_status(owned_job.id, admin)["job_id"] == owned_job.id
+
+@pytest.mark.parametrize("user", [
+    User(id=3, role=2, email="other@law.com", organization_id=1),
+    User(id=2, role=1, email="other@firm.com", organization_id=5),
+])
+def test_job_status_of_another_user_is_not_found(owned_job, user):
+    with pytest.raises(HTTPException) as exc:
+        get_job_status(owned_job.id, user)
+    assert exc.value.status_code == 404
@@ -0,0 +1,108 @@
+import sys
+import hashlib
+import subprocess
+from pathlib import Path
+import fitz
+from app import ocr
+from app.ocr import OCRService, _page_ranges
+
+def _make_pdf(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"pagina {i}")
+    return doc.tobytes()
+
+def _service():
+    # Skip the Cloud Vision client: only local extraction is exercised here
+    return OCRService.__new__(OCRService)
+
+def test_page_ranges_cover_all_pages_in_order():
+    assert _page_ranges(10, 3) == [(0, 4), (4, 8), (8, 10)]
+    assert _page_ranges(2, 8) == [(0, 1), (1, 2)]
+
+def test_parallel_extraction_preserves_page_order(monkeypatch):
+    pdf = _make_pdf(12)
+    serial = "".join(_service()._extract_pages_from_pdf_local(pdf))
+
+    monkeypatch.setattr(ocr, "OCR_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(ocr, "OCR_PDF_WORKERS", 3)
+    parallel = "".join(_service()._extract_pages_from_pdf_local(pdf))
+
+    assert parallel == serial
+    assert [line for line in parallel.splitlines() if line] == [f"pagina {i}" for i in range(12)]
+
+def test_parallel_workers_get_a_shared_memory_name_not_the_pdf(monkeypatch):
+    pdf = _make_pdf(8)
+    submitted = []
+
+    class _RecordingPool:
+        def submit(self, fn, *args):
+            from concurrent.futures import Future
+            submitted.append(args)
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+
+    monkeypatch.setattr(ocr, "OCR_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(ocr, "OCR_PDF_WORKERS", 2)
+    monkeypatch.setattr(ocr, "_get_pdf_pool", lambda: _RecordingPool())
+    pages = _service()._extract_pages_from_pdf_local(memoryview(pdf))
+
+    assert [page.strip() for page in pages] == [f"pagina {i}" for i in range(8)]
+    assert [args[2:] for args in submitted] == [(0, 4), (4, 8)]
+    assert all(isinstance(args[0], str) and args[1] == len(pdf) for args in submitted)
+
+_REAL_POOL_SCRIPT = """
+import fitz
+from app import ocr
+doc = fitz.open()
+for i in range(8):
+    doc.new_page().insert_text((72, 72), f"pagina {i}")
+ocr.OCR_PARALLEL_MIN_PAGES, ocr.OCR_PDF_WORKERS = 4, 2
+pages = ocr.OCRService.__new__(ocr.OCRService)._extract_pages_from_pdf_local(doc.tobytes())
+ocr.shutdown_pdf_pool()
+print("|".join(page.strip() for page in pages))
+"""
+
+def test_real_process_pool_leaves_no_resource_tracker_errors():
+    # Own interpreter: the resource tracker reports on the stderr it inherited, at unlink and at exit
+    result = subprocess.run([sys.executable, "-c", _REAL_POOL_SCRIPT], cwd=Path(__file__).parents[1],
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "|".join(f"pagina {i}" for i in range(8))
+    assert "Traceback" not in result.stderr
+    assert "leaked shared_memory" not in result.stderr
+
+class _FakeVisionClient:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def batch_annotate_images(self, requests):
+        from types import SimpleNamespace
+        self.batch_sizes.append(len(requests))
+        responses = []
+        for request in requests:
+            # Echo a digest of the PNG so each page gets a distinct, checkable text
+            text = hashlib.sha1(request.image.content).hexdigest()
+            responses.append(SimpleNamespace(
+                error=SimpleNamespace(message=""),
+                text_annotations=[SimpleNamespace(description=text)],
+            ))
+        return SimpleNamespace(responses=responses)
+
+def test_scanned_pdf_is_batched_in_page_order(monkeypatch):
+    monkeypatch.setattr(ocr, "OCR_VISION_BATCH_SIZE", 4)
+    monkeypatch.setattr(ocr, "OCR_VISION_CONCURRENCY", 2)
+    monkeypatch.setattr(ocr, "OCR_MAX_PAGES", 10)
+    pdf = _make_pdf(11)
+
+    service = _service()
+    service.vision_client = _FakeVisionClient()
+    progress = []
+    pages = service._ocr_pdf_pages_as_images(pdf, progress.append)
+
+    with fitz.open(stream=pdf, filetype="pdf") as doc:
+        expected = [hashlib.sha1(doc.load_page(n).get_pixmap().tobytes("png")).hexdigest() for n in range(10)]
+    assert [page.rstrip("\n") for page in pages] == expected
+    assert service.vision_client.batch_sizes == [4, 4, 2]
+    assert progress == [0.4, 0.8, 1.0]
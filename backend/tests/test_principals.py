@@ -0,0 +1,62 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from fastapi import HTTPException
+from jose import jwt
+from app import auth
+from app.main import get_current_user
+from app.models import User
+from app.principals import Principal, PrincipalCache, principal_cache
+
+def _user(**overrides):
+    fields = dict(id=5, email="abogada@estudio.com", role=2, organization_id=3, is_active=1)
+    fields.update(overrides)
+    return User(**fields)
+
+def test_token_carries_identity_claims():
+    payload = jwt.decode(auth.create_user_token(_user()), auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    assert (payload["sub"], payload["uid"], payload["role"], payload["org"]) == ("abogada@estudio.com", 5, 2, 3)
+    assert payload["iat"] <= payload["exp"]
+
+def test_cached_principal_needs_no_query():
+    principal_cache.clear()
+    token = auth.create_user_token(_user())
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.return_value = _user()
+
+    first = get_current_user(token, db)
+    second = get_current_user(token, db)
+
+    assert isinstance(first, Principal) and first.organization_id == 3
+    assert second is first
+    assert db.query.call_count == 1
+
+def test_stale_claims_and_deactivated_users_are_rejected():
+    principal_cache.clear()
+    token = auth.create_user_token(_user())
+    db = MagicMock()
+
+    # Role changed since the token was issued
+    db.query.return_value.filter.return_value.first.return_value = _user(role=1)
+    with pytest.raises(HTTPException) as exc:
+        get_current_user(token, db)
+    assert exc.value.status_code == 401
+
+    principal_cache.invalidate(5)
+    db.query.return_value.filter.return_value.first.return_value = _user(is_active=0)
+    with pytest.raises(HTTPException):
+        get_current_user(token, db)
+    principal_cache.clear()
+
+def test_cache_ttl_and_lru():
+    cache = PrincipalCache(ttl=0.01, max_entries=2)
+    cache.put(Principal(1, "a", 2, 1))
+    time.sleep(0.02)
+    assert cache.get(1) is None
+
+    cache = PrincipalCache(ttl=60, max_entries=2)
+    cache.put(Principal(1, "a", 2, 1))
+    cache.put(Principal(2, "b", 2, 1))
+    cache.get(1)
+    cache.put(Principal(3, "c", 2, 1))
+    assert cache.get(2) is None and cache.get(1) is not None and cache.get(3) is not None
@@ -0,0 +1,109 @@
+import time
+import asyncio
+from unittest.mock import MagicMock
+from datetime import datetime
+from fastapi import BackgroundTasks
+from app.response_cache import ResponseCache
+from app import main, models, schemas
+
+def test_similar_question_hits_within_scope():
+    cache = ResponseCache(threshold=0.9, ttl=60, max_entries=10)
+    cache.store(1, "¿cuál es el plazo de apelación?", [1.0, 0.0, 0.0], "5 días", latency_ms=1200)
+
+    hit = cache.lookup(1, [0.99, 0.05, 0.0])
+    assert hit is not None and hit.answer == "5 días"
+    # Other cases never see the entry, dissimilar questions miss
+    assert cache.lookup(2, [1.0, 0.0, 0.0]) is None
+    assert cache.lookup(1, [0.0, 1.0, 0.0]) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["saved_ms"] == 1200
+    assert abs(stats["hit_rate"] - 1 / 3) < 1e-9
+
+def test_lru_eviction_and_invalidation():
+    cache = ResponseCache(threshold=0.9, ttl=60, max_entries=2)
+    cache.store(1, "a", [1.0, 0.0], "A", 10)
+    cache.store(1, "b", [0.0, 1.0], "B", 10)
+    assert cache.lookup(1, [1.0, 0.0]).answer == "A"  # "a" is now most recently used
+    cache.store(2, "c", [1.0, 0.0], "C", 10)
+
+    assert cache.lookup(1, [0.0, 1.0]) is None  # "b" was evicted
+    assert cache.lookup(1, [1.0, 0.0]).answer == "A"
+
+    cache.invalidate(1)
+    assert cache.lookup(1, [1.0, 0.0]) is None
+    assert cache.lookup(2, [1.0, 0.0]).answer == "C"
+    assert cache.stats()["evictions"] == 1
+
+def test_expired_entries_miss():
+    cache = ResponseCache(threshold=0.9, ttl=0.01, max_entries=10)
+    cache.store(1, "a", [1.0, 0.0], "A", 10)
+    time.sleep(0.02)
+    assert cache.lookup(1, [1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_lookup_picks_the_most_similar_entry():
+    cache = ResponseCache(threshold=0.5, ttl=60, max_entries=10)
+    cache.store(1, "a", [1.0, 0.0, 0.0], "A", 10)
+    cache.store(1, "b", [0.8, 0.6, 0.0], "B", 10)
+    assert cache.lookup(1, [0.7, 0.7, 0.0]).answer == "B"
+    assert cache.lookup(1, [0.9, 0.1, 0.0]).answer == "A"
+
+def test_message_schema_marks_cached_answers():
+    msg = MagicMock(spec=["id", "sender", "content", "timestamp", "case_id", "context_tokens", "retrieval_ms"])
+    msg.id, msg.sender, msg.content, msg.case_id = 1, "ai", "5 días", 3
+    msg.timestamp, msg.context_tokens, msg.retrieval_ms = datetime.now(), None, None
+    assert schemas.Message.model_validate(msg).cached is False
+
+class _CountingGemini:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content(self, payload):
+        self.calls += 1
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"text": f"respuesta {self.calls}"}]}}]}
+        return response
+
+def test_repeated_question_late_in_a_conversation_is_served_from_cache(monkeypatch):
+    saved = []
+
+    def save_message(db, sender, content, case_id, context=None):
+        msg = models.Message(id=len(saved) + 1, sender=sender, content=content, case_id=case_id)
+        saved.append(msg)
+        return msg
+
+    async def embed(question):
+        # One direction per distinct question
+        return [1.0 if candidate == question else 0.0 for candidate in questions]
+
+    async def prepare(db, message, user_msg, query_vector, started, organization_id):
+        return {"contents": []}, None
+
+    questions = ["¿Cuál es el plazo de apelación de la sentencia?"] + [
+        f"¿Qué dice la cláusula {n} del contrato?" for n in range(1, 10)
+    ] + ["¿y el plazo?"]
+    monkeypatch.setattr(main, "response_cache", ResponseCache(threshold=0.95, ttl=60, max_entries=100))
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(main, "_authorize_case", lambda db, case_id, user: 1)
+    monkeypatch.setattr(main, "_save_message", save_message)
+    monkeypatch.setattr(main, "_embed_question", embed)
+    monkeypatch.setattr(main, "_prepare_chat", prepare)
+    gemini = _CountingGemini()
+
+    def ask(question):
+        message = schemas.MessageCreate(sender="user", content=question, case_id=3)
+        return asyncio.run(main.chat_endpoint(message, BackgroundTasks(), MagicMock(), gemini, MagicMock()))
+
+    # Ten turns of different questions, then a follow-up asked twice
+    answers = [ask(question) for question in questions]
+    ask("¿y el plazo?")
+    assert gemini.calls == len(questions) + 1
+
+    # Turn 12: the first question again, answered from the cache despite the turns in between
+    repeated = ask(questions[0])
+    assert getattr(repeated, "cached", False) is True
+    assert repeated.content == answers[0].content
+    assert gemini.calls == len(questions) + 1
@@ -1,33 +1,106 @@
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from app.models import User, Organization, Case
-from app.main import get_cases
+import pytest
+from fastapi import HTTPException
+from app.main import get_cases, _authorize_case, _register_upload
 
-def test_super_admin_sees_all_cases():
-    mock_db = MagicMock()
+def test_super_admin_sees_all_cases(query_db):
+    mock_db, query = query_db()
     mock_request = MagicMock()
     
     # SuperAdmin
     super_admin = User(id=1, role=0, email="admin@bina.com")
     
-    # Expectation: all() is called
     get_cases(mock_request, mock_db, super_admin)
-    mock_db.query().all.assert_called()
+    query.all.assert_called()
+    # No organization filter for SuperAdmin
+    query.filter.assert_not_called()
 
-def test_org_admin_sees_only_own_cases():
-    mock_db = MagicMock()
+@patch("app.main.get_cases_version", return_value=None)
+def test_org_admin_sees_only_own_cases(mock_version, query_db, compiled_filters):
+    mock_db, query = query_db()
     mock_request = MagicMock()
     
     # OrgAdmin for Org 1
     org_admin = User(id=2, role=1, email="partner@law.com", organization_id=1)
     
-    # Expectation: filter(org_id == 1) is called
     get_cases(mock_request, mock_db, org_admin)
-    
-    # Verify filter call
-    # Note: Mocking chaining sqlalchemy calls is tricky, but we check logic intent
-    # Ideally integration tests are better here.
-    assert True # Placeholder for logic verification if we trusted the code change.
-
-if __name__ == "__main__":
-    test_super_admin_sees_all_cases()
-    print("SaaS Logic Tests Passed!")
+    assert compiled_filters(query) == ["cases.organization_id = %(organization_id_1)s"]
+
+@patch("app.main.get_cases_version", return_value=None)
+def test_cases_keyset_pagination(mock_version, query_db, compiled_filters):
+    rows = [Case(id=i, title=f"Caso {i}") for i in (11, 12, 13)]
+    mock_db, query = query_db(rows)
+    response = MagicMock()
+    response.headers = {}
+    org_admin = User(id=2, role=1, email="partner@law.com", organization_id=1)
+
+    cases = get_cases(MagicMock(), mock_db, org_admin, response=response, after_id=10, limit=2)
+
+    assert [case.id for case in cases] == [11, 12]
+    assert response.headers["X-Next-After-Id"] == "12"
+    assert "cases.id > %(id_1)s" in compiled_filters(query)
+    query.limit.assert_called_with(3)
+
+def test_cases_summary_mode_counts_documents_in_one_query(query_db):
+    row = MagicMock()
+    row._mapping = {"id": 1, "title": "Caso", "description": None, "created_at": None, "document_count": 4}
+    mock_db, query = query_db([row])
+    super_admin = User(id=1, role=0, email="admin@bina.com")
+
+    cases = get_cases(MagicMock(), mock_db, super_admin, summary=True)
+
+    assert cases == [row._mapping]
+    columns = [str(column) for column in mock_db.query.call_args.args]
+    assert any("count(documents.id)" in column for column in columns)
+    query.options.assert_not_called()
+
+@pytest.fixture
+def case_db(query_db):
+    def make(case):
+        mock_db, query = query_db()
+        query.first.return_value = case
+        return mock_db
+    return make
+
+def test_case_of_another_organization_is_not_found(case_db):
+    org_admin = User(id=2, role=1, email="partner@law.com", organization_id=1)
+    with pytest.raises(HTTPException) as exc:
+        _authorize_case(case_db(MagicMock(id=5, organization_id=2)), 5, org_admin)
+    assert exc.value.status_code == 404
+
+def test_missing_case_is_not_found(case_db):
+    super_admin = User(id=1, role=0, email="admin@bina.com")
+    with pytest.raises(HTTPException) as exc:
+        _authorize_case(case_db(None), 5, super_admin)
+    assert exc.value.status_code == 404
+
+def test_case_access_returns_organization_scope(case_db):
+    org_admin = User(id=2, role=1, email="partner@law.com", organization_id=1)
+    super_admin = User(id=1, role=0, email="admin@bina.com")
+    case = MagicMock(id=5, organization_id=1)
+    assert _authorize_case(case_db(case), 5, org_admin) == 1
+    # SuperAdmin reads across organizations
+    assert _authorize_case(case_db(case), 5, super_admin) is None
+
+@patch("app.main.copy_chunks_from_duplicate", return_value=True)
+@patch("app.main.bump_cases_version")
+@patch("app.main.content_cache")
+def test_register_upload_reuses_cached_content(mock_cache, mock_bump, mock_copy):
+    mock_cache.lookup.return_value = MagicMock(extracted_text="texto", embedding=[0.1])
+    db = MagicMock()
+    doc, cached, chunks_copied = _register_upload(db, "a.pdf", "/blobs/x", 3, "key")
+    assert doc.extracted_text == "texto" and doc.content_hash == "key"
+    assert cached is mock_cache.lookup.return_value and chunks_copied
+    mock_bump.assert_called_once_with(db, case_id=3)
+    db.commit.assert_called_once()
+    mock_copy.assert_called_once_with(db, doc.id, "key")
+
+@patch("app.main.copy_chunks_from_duplicate")
+@patch("app.main.bump_cases_version")
+@patch("app.main.content_cache")
+def test_register_upload_leaves_new_content_to_ingestion(mock_cache, mock_bump, mock_copy):
+    mock_cache.lookup.return_value = None
+    doc, cached, chunks_copied = _register_upload(MagicMock(), "a.pdf", "/blobs/x", 3, "key")
+    assert doc.extracted_text is None and cached is None and not chunks_copied
+    mock_copy.assert_not_called()
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from fastapi import HTTPException
+from app import search
+from app.embeddings import EmbeddingService
+from app.local_embeddings import LocalHashingEmbedder
+from app.models import User
+from app.main import search_documents
+
+def test_scope_sql():
+    assert search._scope_sql(None, None) == ""
+    assert search._scope_sql(3, None) == " AND c.organization_id = :organization_id"
+    assert search._scope_sql(3, 7) == " AND c.organization_id = :organization_id AND d.case_id = :case_id"
+
+def test_keyword_search_is_one_query_without_vectors():
+    db = MagicMock()
+    row = MagicMock()
+    row._mapping = {"document_id": 1, "filename": "a.pdf", "case_id": 7, "score": 0.5, "snippet": "<b>ley</b>"}
+    db.execute.return_value = [row]
+
+    results = search.keyword_search(db, '"ley 26.994" contrato', organization_id=3, case_id=7, k=5)
+
+    assert results == [row._mapping]
+    db.execute.assert_called_once()
+    sql, params = db.execute.call_args[0]
+    assert "websearch_to_tsquery" in str(sql)
+    assert "d.case_id = :case_id" in str(sql)
+    assert params["q"] == '"ley 26.994" contrato'
+    assert params["k"] == 5
+
+def test_hybrid_search_fuses_in_sql():
+    db = MagicMock()
+    db.execute.return_value = []
+
+    search.hybrid_search(db, "contrato", [0.1, 0.2], organization_id=None, k=3, candidates=20)
+
+    # Two SET LOCALs for the HNSW scan, then one fused query
+    sql, params = db.execute.call_args[0]
+    assert "FULL OUTER JOIN" in str(sql)
+    assert "organization_id" not in str(sql)
+    assert params["query_vector"] == "[0.1, 0.2]"
+    assert params["candidates"] == 20
+    assert params["rrf_k"] == search.RRF_K
+
+def test_semantic_search_scopes_to_organization_and_case(query_db, compiled_filters):
+    db, query = query_db()
+    search.semantic_search(db, [0.1, 0.2], organization_id=3, case_id=7, k=4)
+    filters = compiled_filters(query)
+    assert "cases.organization_id = %(organization_id_1)s" in filters
+    assert "documents.case_id = %(case_id_1)s" in filters
+    query.limit.assert_called_with(4)
+
+def test_semantic_search_without_organization_for_super_admin(query_db, compiled_filters):
+    db, query = query_db()
+    search.semantic_search(db, [0.1, 0.2], organization_id=None, target="documents")
+    filters = compiled_filters(query)
+    assert not any("organization_id" in sql for sql in filters)
+    assert not any("case_id" in sql for sql in filters)
+
+def test_semantic_search_converts_distance_to_score(query_db):
+    row = MagicMock()
+    row._mapping = {"chunk_id": 1, "distance": 0.25}
+    db, _ = query_db([row])
+    assert search.semantic_search(db, [0.1], organization_id=1) == [{"chunk_id": 1, "score": 0.75}]
+
+def _search(user, case_id=None):
+    service = MagicMock()
+    service.get_embedding_async = AsyncMock(return_value=[0.1, 0.2])
+    with patch("app.main.embeddings.EmbeddingService", return_value=service), \
+            patch("app.main.search.semantic_search", return_value=[]) as mock_search, \
+            patch("app.main.alog_action", new=AsyncMock()):
+        asyncio.run(search_documents(MagicMock(), q="plazo", case_id=case_id, k=5, ef_search=None,
+                                     target="chunks", mode="semantic", db=MagicMock(), current_user=user))
+    return mock_search.call_args
+
+def test_search_endpoint_uses_the_caller_organization():
+    call = _search(User(id=2, role=1, email="partner@law.com", organization_id=3), case_id=7)
+    assert call.args[2] == 3
+    assert call.kwargs["case_id"] == 7
+
+def test_search_endpoint_super_admin_searches_all_organizations():
+    call = _search(User(id=1, role=0, email="admin@bina.com"))
+    assert call.args[2] is None
+
+@pytest.mark.parametrize("mode", ["semantic", "hybrid"])
+def test_search_endpoint_rejects_queries_without_searchable_terms(mode):
+    service = EmbeddingService(backend=LocalHashingEmbedder(dimension=64))
+    user = User(id=2, role=1, email="partner@law.com", organization_id=3)
+    with patch("app.main.embeddings.EmbeddingService", return_value=service), \
+            patch("app.main.search.semantic_search") as mock_search:
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(search_documents(MagicMock(), q="¿de la y el...?", case_id=None, k=5, ef_search=None,
+                                         target="chunks", mode=mode, db=MagicMock(), current_user=user))
+    assert exc.value.status_code == 400
+    mock_search.assert_not_called()
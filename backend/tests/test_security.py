@@ -0,0 +1,105 @@
+import io
+import os
+import pytest
+from cryptography.exceptions import InvalidTag
+from app import security
+from app.security import SecureFileHandler
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    h = SecureFileHandler()
+    h.chunk_size = 1024
+    return h
+
+def _encrypt_to_file(handler, tmp_path, payload, pieces=7):
+    path = tmp_path / "doc.enc"
+    with open(path, "wb") as f:
+        handler.encrypt_stream((payload[i:i + pieces] for i in range(0, len(payload), pieces)), f)
+    return str(path)
+
+@pytest.mark.parametrize("size", [0, 1, 1024, 1025, 5000])
+def test_stream_roundtrip(handler, tmp_path, size):
+    payload = bytes(range(256)) * (size // 256 + 1)
+    payload = payload[:size]
+    path = _encrypt_to_file(handler, tmp_path, payload)
+
+    chunks = list(handler.decrypt_stream(path))
+    assert b"".join(chunks) == payload
+    assert all(len(c) <= handler.chunk_size for c in chunks)
+
+def test_legacy_fernet_file_is_still_readable(handler, tmp_path):
+    path = tmp_path / "legacy.enc"
+    path.write_bytes(handler.cipher_suite.encrypt(b"old format"))
+    assert handler.decrypt_file(str(path)) == b"old format"
+
+def test_truncated_file_fails_authentication(handler, tmp_path):
+    path = _encrypt_to_file(handler, tmp_path, b"x" * 3000)
+    data = open(path, "rb").read()
+    # Drop the final frame: the previous frame was not sealed as the last one
+    with open(path, "wb") as f:
+        f.write(data[:security.HEADER_SIZE + 2 * (1024 + security.TAG_SIZE)])
+    with pytest.raises(InvalidTag):
+        handler.decrypt_file(path)
+
+@pytest.mark.parametrize("start,end", [(0, 0), (0, 4999), (1000, 1100), (1023, 1024), (4096, 4999)])
+def test_decrypt_range_matches_plaintext_slice(handler, tmp_path, start, end):
+    payload = bytes(range(256)) * 20
+    payload = payload[:5000]
+    path = _encrypt_to_file(handler, tmp_path, payload, pieces=333)
+
+    assert handler.plaintext_size(path) == 5000
+    assert b"".join(handler.decrypt_range(path, start, end)) == payload[start:end + 1]
+
+def test_plaintext_size_for_exact_chunk_multiple(handler, tmp_path):
+    path = _encrypt_to_file(handler, tmp_path, b"a" * 2048)
+    assert handler.plaintext_size(path) == 2048
+    assert b"".join(handler.decrypt_range(path, 2040, 2047)) == b"a" * 8
+
+def test_save_encrypted_upload_single_pass(handler):
+    import asyncio
+    import hashlib
+    from fastapi import UploadFile
+
+    payload = b"%PDF-1.4 demo " * 500
+    upload = UploadFile(file=io.BytesIO(payload), filename="demo.pdf")
+    result = asyncio.run(handler.save_encrypted_upload(upload))
+
+    assert bytes(result.content) == payload
+    assert result.sha256 == hashlib.sha256(payload).hexdigest()
+    assert handler.decrypt_file(result.file_path) == payload
+
+def test_identical_uploads_share_one_blob(handler):
+    import asyncio
+    from fastapi import UploadFile
+
+    first = asyncio.run(handler.save_encrypted_upload(UploadFile(file=io.BytesIO(b"same"), filename="a.pdf")))
+    second = asyncio.run(handler.save_encrypted_upload(UploadFile(file=io.BytesIO(b"same"), filename="b.pdf")))
+
+    assert first.file_path == second.file_path == handler.blob_path(first.sha256)
+    assert not first.deduplicated and second.deduplicated
+    assert [name for name in os.listdir(handler.upload_dir)] == [os.path.basename(first.file_path)]
+    # The blob name is keyed: it does not reveal the plaintext hash
+    assert first.sha256 not in first.file_path
+
+def test_content_key_is_scoped_per_organization(handler):
+    sha256 = "ab" * 32
+    assert handler.content_key(sha256, 1) == handler.content_key(sha256, 1)
+    assert handler.content_key(sha256, 1) != handler.content_key(sha256, 2)
+    assert len(handler.content_key(sha256, 1)) == 64
+
+def test_save_encrypted_upload_runs_off_the_event_loop(handler, monkeypatch):
+    import asyncio
+    import threading
+    from fastapi import UploadFile
+
+    threads = []
+    original = handler.save_encrypted_stream
+    def recording(src, keep_content=True):
+        threads.append(threading.current_thread())
+        return original(src, keep_content)
+    monkeypatch.setattr(handler, "save_encrypted_stream", recording)
+
+    result = asyncio.run(handler.save_encrypted_upload(UploadFile(file=io.BytesIO(b"data"), filename="a.pdf")))
+    assert handler.decrypt_file(result.file_path) == b"data"
+    assert threads and threads[0] is not threading.main_thread()
@@ -24,6 +24,8 @@ export class HomeComponent implements OnInit {
   selectedCaseId: number | null = null;
   cases: Case[] = [];
   errorMessage: string = '';
+  processingStatus: 'processing' | 'completed' | 'failed' | null = null;
+  processingProgress: number = 0;
 
   topicList: string[] = [
     'Abuso Sexual', 'Homicidio', 'Femicidio', 'Violencia de Género',
@@ -89,6 +91,9 @@ export class HomeComponent implements OnInit {
         console.log('Upload success', response);
         this.uploadStatus = 'success';
         this.selectedFile = null; // Clear file after success
+        if (response.job_id) {
+          this.trackProcessing(response.job_id);
+        }
       },
       error: (error) => {
         console.error('Upload error', error);
@@ -97,4 +102,24 @@ export class HomeComponent implements OnInit {
       }
     });
   }
+
+  // OCR and embedding run in the background; poll the job for progress
+  private trackProcessing(jobId: string) {
+    this.processingStatus = 'processing';
+    this.processingProgress = 0;
+    this.documentService.pollJob(jobId).subscribe({
+      next: (job) => {
+        this.processingProgress = Math.round(job.progress * 100);
+        if (job.status === 'completed') {
+          this.processingStatus = 'completed';
+        } else if (job.status === 'failed') {
+          this.processingStatus = 'failed';
+        }
+      },
+      error: (error) => {
+        console.error('Job polling error', error);
+        this.processingStatus = 'failed';
+      }
+    });
+  }
 }
@@ -56,10 +56,25 @@ export class LegalChatComponent implements OnInit {
             this.messages.push({ sender: 'user', content: content, timestamp: new Date().toISOString() });
 
             this.isLoading = true;
-            this.chatService.sendMessage(this.caseId!, content).subscribe({
-                next: (response) => {
-                    this.messages.push(response); // Add AI response
-                    this.isLoading = false;
+            // AI reply is rendered token by token and replaced by the saved message at the end
+            const aiMessage: any = { sender: 'ai', content: '', timestamp: new Date().toISOString() };
+            this.chatService.streamMessage(this.caseId!, content).subscribe({
+                next: ({ event, data }) => {
+                    if (event === 'token') {
+                        if (!aiMessage.content) {
+                            this.messages.push(aiMessage);
+                            this.isLoading = false;
+                        }
+                        aiMessage.content += data.text;
+                    } else if (event === 'done') {
+                        const index = this.messages.indexOf(aiMessage);
+                        if (index >= 0) {
+                            this.messages[index] = data;
+                        } else {
+                            this.messages.push(data);
+                        }
+                        this.isLoading = false;
+                    }
                 },
                 error: (err) => {
                     console.error('Error sending message', err);
@@ -7,6 +7,7 @@ export interface Case {
     title: string;
     description: string;
     created_at: string;
+    document_count?: number;
 }
 
 @Injectable({
@@ -18,7 +19,8 @@ export class CaseService {
     constructor(private http: HttpClient) { }
 
     getCases(): Observable<Case[]> {
-        return this.http.get<Case[]>(this.apiUrl);
+        // Lists only need the count of documents per case, not the documents themselves
+        return this.http.get<Case[]>(this.apiUrl, { params: { summary: 'true' } });
     }
 
     createCase(title: string, description: string): Observable<Case> {
@@ -2,12 +2,18 @@ import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Observable } from 'rxjs';
 
+export interface ChatStreamEvent {
+    event: 'token' | 'done' | 'error';
+    data: any;
+}
+
 export interface Message {
     id: number;
     sender: 'user' | 'ai';
     content: string;
     timestamp: string;
     case_id: number;
+    cached?: boolean;
 }
 
 @Injectable({
@@ -18,11 +24,70 @@ export class ChatService {
 
     constructor(private http: HttpClient) { }
 
-    getHistory(caseId: number): Observable<Message[]> {
-        return this.http.get<Message[]>(`${this.apiUrl}/${caseId}`);
+    // sinceId: only messages newer than it; limit (+ beforeId): one page counting back from the newest
+    getHistory(caseId: number, options: { sinceId?: number, beforeId?: number, limit?: number } = {}): Observable<Message[]> {
+        const params: any = {};
+        if (options.sinceId != null) params.since_id = options.sinceId;
+        if (options.beforeId != null) params.before_id = options.beforeId;
+        if (options.limit != null) params.limit = options.limit;
+        return this.http.get<Message[]>(`${this.apiUrl}/${caseId}`, { params });
     }
 
     sendMessage(caseId: number, content: string): Observable<Message> {
         return this.http.post<Message>(this.apiUrl, { case_id: caseId, sender: 'user', content });
     }
+
+    // POST /chat/stream and emit server-sent events as they arrive.
+    // EventSource only supports GET, so the SSE body is read from fetch().
+    streamMessage(caseId: number, content: string): Observable<ChatStreamEvent> {
+        return new Observable<ChatStreamEvent>(subscriber => {
+            const controller = new AbortController();
+            const token = localStorage.getItem('token');
+            const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+            if (token) {
+                headers['Authorization'] = `Bearer ${token}`;
+            }
+
+            fetch(`${this.apiUrl}/stream`, {
+                method: 'POST',
+                headers,
+                body: JSON.stringify({ case_id: caseId, sender: 'user', content }),
+                signal: controller.signal
+            }).then(async response => {
+                if (!response.ok || !response.body) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                        const raw = buffer.slice(0, boundary);
+                        buffer = buffer.slice(boundary + 2);
+                        let event = 'message';
+                        let data = '';
+                        for (const line of raw.split('\n')) {
+                            if (line.startsWith('event:')) event = line.slice(6).trim();
+                            else if (line.startsWith('data:')) data += line.slice(5).trim();
+                        }
+                        if (data) {
+                            subscriber.next({ event: event as ChatStreamEvent['event'], data: JSON.parse(data) });
+                        }
+                    }
+                }
+                subscriber.complete();
+            }).catch(err => {
+                if (!controller.signal.aborted) {
+                    subscriber.error(err);
+                }
+            });
+
+            // Unsubscribing aborts the request, which cancels the upstream generation too
+            return () => controller.abort();
+        });
+    }
 }
@@ -1,6 +1,23 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { Observable, timer } from 'rxjs';
+import { switchMap, takeWhile } from 'rxjs/operators';
+
+export interface JobStage {
+    status: 'pending' | 'running' | 'done' | 'failed' | 'skipped';
+    progress: number;
+}
+
+export interface IngestionJob {
+    job_id: string;
+    document_id: number;
+    filename: string;
+    status: 'queued' | 'running' | 'completed' | 'failed';
+    progress: number;
+    stages: { [stage: string]: JobStage };
+    error: string | null;
+    result: { [key: string]: any };
+}
 
 @Injectable({
     providedIn: 'root'
@@ -8,6 +25,7 @@ import { Observable } from 'rxjs';
 export class DocumentService {
     // Replace with your actual backend API URL
     private apiUrl = 'http://localhost:8000/upload';
+    private jobsUrl = 'http://localhost:8000/jobs';
 
     constructor(private http: HttpClient) { }
 
@@ -20,4 +38,16 @@ export class DocumentService {
 
         return this.http.post(this.apiUrl, formData);
     }
+
+    getJob(jobId: string): Observable<IngestionJob> {
+        return this.http.get<IngestionJob>(`${this.jobsUrl}/${jobId}`);
+    }
+
+    // Polls the ingestion job until it completes or fails (last status is emitted too)
+    pollJob(jobId: string, intervalMs: number = 2000): Observable<IngestionJob> {
+        return timer(0, intervalMs).pipe(
+            switchMap(() => this.getJob(jobId)),
+            takeWhile(job => job.status !== 'completed' && job.status !== 'failed', true)
+        );
+    }
 }